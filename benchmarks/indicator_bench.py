@@ -0,0 +1,75 @@
+"""
+Measures the per-bar cost of the incremental indicator states against a full
+recomputation of RSI and MACD over the bar history, and the memory they hold.
+
+Usage: python benchmarks/indicator_bench.py [--symbols 5000] [--history 200] [--bars 20]
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "functions"))
+from strategy import indicators
+
+
+def timed(func) -> (float):
+    """wall time of one call in seconds"""
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--bars", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    closes = 100 + np.cumsum(rng.normal(0, 1, (args.symbols, args.history + args.bars)), axis=1)
+    symbols = [f"S{i}" for i in range(args.symbols)]
+    history = {symbol: closes[row, :args.history].tolist() for row, symbol in enumerate(symbols)}
+    new_bars = [dict(zip(symbols, closes[:, args.history + step].tolist()))
+                for step in range(args.bars)]
+
+    states = {symbol: indicators.IndicatorState.from_history(series)
+              for symbol, series in history.items()}
+    book = indicators.IndicatorBook.from_history(history)
+    updates = args.symbols * args.bars
+
+    def scalar_updates():
+        for bar in new_bars:
+            for symbol, close in bar.items():
+                states[symbol].update(close)
+
+    def book_updates():
+        for bar in new_bars:
+            book.update(bar)
+
+    windows = [{symbol: closes[row, :args.history + step + 1].tolist()
+                for row, symbol in enumerate(symbols)} for step in range(args.bars)]
+
+    def full_recompute():
+        for bars in windows:
+            indicators.latest_indicators(bars)
+
+    results = {
+        "IndicatorState.update": timed(scalar_updates),
+        "IndicatorBook.update": timed(book_updates),
+        "latest_indicators (full)": timed(full_recompute),
+    }
+    print(f"{args.symbols} symbols, {args.history} bars of history, {args.bars} new bars")
+    print(f"{'method':<26} {'total ms':>10} {'us/update':>10}")
+    for name, seconds in results.items():
+        print(f"{name:<26} {seconds * 1000:>10.1f} {seconds / updates * 1e6:>10.2f}")
+    print(f"IndicatorBook table: {book.nbytes / 1024:.1f} KiB")
+    print(f"pickled IndicatorStates: {len(pickle.dumps(states)) / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
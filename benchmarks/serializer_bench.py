@@ -0,0 +1,90 @@
+"""
+Measures order serialization for Firestore: the compiled per-model serializer
+against the previous vars() + UUID stringify loop and pydantic's model_dump.
+
+Usage: python benchmarks/serializer_bench.py [--orders 10000] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "functions"))
+from alpaca.trading.models import Order
+from strategy import serializers
+
+
+def make_orders(count: int) -> (list[Order]):
+    """realistic filled market orders"""
+    start = datetime(2024, 3, 1, 14, 30, tzinfo=timezone.utc)
+    return [Order(
+        id=uuid.uuid4(), client_order_id=str(uuid.uuid4()), created_at=start,
+        updated_at=start, submitted_at=start + timedelta(milliseconds=i),
+        filled_at=start, asset_id=uuid.uuid4(), symbol=f"S{i % 500}", asset_class="us_equity",
+        qty="10", filled_qty="10", filled_avg_price="101.25", order_class="simple",
+        order_type="market", type="market", side="buy", time_in_force="day",
+        status="filled", extended_hours=False,
+        ) for i in range(count)]
+
+
+def vars_records(orders: list[Order]) -> (list[dict]):
+    """the previous firestore_db approach, mutates the orders' __dict__"""
+    records = []
+    for order in orders:
+        data = vars(order)
+        for k, v in data.items():
+            if isinstance(v, uuid.UUID):
+                data[k] = str(v)
+        records.append(data)
+    return records
+
+
+def vars_copy_records(orders: list[Order]) -> (list[dict]):
+    """the previous approach on a copy, so the orders are left unchanged"""
+    records = []
+    for order in orders:
+        data = dict(vars(order))
+        for k, v in data.items():
+            if isinstance(v, uuid.UUID):
+                data[k] = str(v)
+        records.append(data)
+    return records
+
+
+def compiled_records(orders: list[Order]) -> (list[dict]):
+    return [serializers.serialize(order) for order in orders]
+
+
+def dump_records(orders: list[Order]) -> (list[dict]):
+    return [order.model_dump(mode="json") for order in orders]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    orders = make_orders(args.orders)
+    methods = {"vars() + UUID loop": vars_records, "dict(vars()) + UUID loop": vars_copy_records,
+               "model_dump(json)": dump_records, "compiled serializer": compiled_records}
+    print(f"{args.orders} orders, median of {args.repeat} runs")
+    print(f"{'method':<26} {'total ms':>10} {'us/order':>10}")
+    for name, method in methods.items():
+        samples = []
+        for _ in range(args.repeat):
+            # vars() rewrites the orders in place, every run gets fresh copies
+            batch = [order.model_copy() for order in orders]
+            start = time.perf_counter()
+            method(batch)
+            samples.append(time.perf_counter() - start)
+        seconds = statistics.median(samples)
+        print(f"{name:<26} {seconds * 1000:>10.1f} {seconds / args.orders * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
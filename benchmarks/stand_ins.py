@@ -0,0 +1,271 @@
+"""
+Local HTTP stand-ins for the upstream APIs the strategy talks to.
+
+One threaded server answers for Alpaca trading (/trading), Alpaca market data
+(/data), FMP (/fmp) and Polygon (/polygon) in their response formats, from a
+deterministic synthetic market of any number of symbols. Every request sleeps
+the injected latency of its upstream first and is counted per endpoint.
+Orders are filled at the last close and kept so later order queries see them.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+UPSTREAMS = ("trading", "data", "fmp", "polygon")
+# Largest page the bars endpoint returns
+BARS_PAGE_LIMIT = 10000
+# Hourly bars of a session, 14:00 to 20:00 UTC
+SESSION_HOURS = range(14, 21)
+# Bars of the sell-off and of the flattening after it that end a dip symbol's series
+SELL_OFF_BARS, FLATTENING_BARS = 22, 8
+
+
+def iso(moment: datetime) -> (str):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class SyntheticMarket():
+    """
+    Hourly closes, daily volume and open positions of `size` symbols, seeded.
+    A `dips` share of the symbols ends on a sell-off that is flattening out:
+    RSI oversold with the MACD crossing up, the buy signal
+    """
+    def __init__(self, size: int, positions: int = 100, lookback_days: int = 30, seed: int = 7,
+                 dips: float = 0.2):
+        rng = np.random.default_rng(seed)
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        days = [now.date() - timedelta(days=offset) for offset in range(lookback_days, -1, -1)]
+        self.timestamps = [datetime(day.year, day.month, day.day, hour, tzinfo=timezone.utc)
+                           for day in days if day.weekday() < 5 for hour in SESSION_HOURS]
+        self.timestamps = [stamp for stamp in self.timestamps if stamp <= now]
+        self.stamps = [stamp.strftime("%Y-%m-%dT%H:%M:%SZ") for stamp in self.timestamps]
+        self.symbols = [f"S{index:04d}" for index in range(size)]
+        start = np.exp(rng.uniform(np.log(2.0), np.log(400.0), size))
+        steps = rng.normal(0.0, 0.01, (size, len(self.timestamps)))
+        self.volume = np.round(np.exp(rng.uniform(np.log(2e5), np.log(5e7), size)))
+        self.change = np.round(rng.normal(0.0, 4.0, size), 2)
+        self.index = {symbol: row for row, symbol in enumerate(self.symbols)}
+        held = min(positions, size)
+        self.positions = {symbol: float(rng.uniform(-0.1, 0.1)) for symbol in self.symbols[:held]}
+        tail = SELL_OFF_BARS + FLATTENING_BARS
+        if len(self.timestamps) > tail:
+            rows = rng.choice(size, int(size * dips), replace=False)
+            steps[rows, -tail:-FLATTENING_BARS] = rng.normal(-0.02, 0.002,
+                                                             (len(rows), SELL_OFF_BARS))
+            steps[rows, -FLATTENING_BARS:] = rng.normal(-0.002, 0.001,
+                                                        (len(rows), FLATTENING_BARS))
+        self.closes = np.round(start[:, None] * np.exp(np.cumsum(steps, axis=1)), 2)
+
+    def last(self, symbol: str) -> (float):
+        return float(self.closes[self.index[symbol], -1])
+
+
+class StandIns():
+    """Threaded HTTP server holding the synthetic market, the orders and the counters"""
+    def __init__(self, latency: dict[str, float]|None = None):
+        self.latency = dict.fromkeys(UPSTREAMS, 0.0) | (latency or {})
+        self.market = SyntheticMarket(0)
+        self.orders: list[dict] = []
+        self.calls: Counter = Counter()
+        self.bytes: Counter = Counter()
+        self.lock = threading.Lock()
+        stand_ins = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stand_ins.handle(self, "GET")
+
+            def do_POST(self):
+                stand_ins.handle(self, "POST")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> ("StandIns"):
+        self.thread.start()
+        return self
+
+    def stop(self) -> (None):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self, market: SyntheticMarket) -> (None):
+        """serves a new market with no orders and zeroed counters"""
+        with self.lock:
+            self.market = market
+            self.orders = []
+            self.calls.clear()
+            self.bytes.clear()
+
+    def handle(self, request: BaseHTTPRequestHandler, method: str) -> (None):
+        url = urlparse(request.path)
+        upstream, _, path = url.path.lstrip("/").partition("/")
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        body = None
+        if method == "POST":
+            body = json.loads(request.rfile.read(int(request.headers["Content-Length"])))
+        time.sleep(self.latency.get(upstream, 0.0))
+        try:
+            endpoint, payload = self.route(upstream, method, path, query, body)
+            status = 200
+        except KeyError as exc:
+            endpoint, payload, status = f"{upstream} unknown", {"message": str(exc)}, 404
+        data = json.dumps(payload).encode("utf-8")
+        with self.lock:
+            self.calls[endpoint] += 1
+            self.bytes[endpoint] += len(data)
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def route(self, upstream: str, method: str, path: str, query: dict,
+              body: dict|None) -> (tuple[str, object]):
+        """returns the endpoint name and the response of a request"""
+        market = self.market
+        parts = path.split("/")
+        if upstream == "fmp":
+            feed = parts[-1]
+            return f"fmp {feed}", self.feed(feed)
+        if upstream == "data":
+            symbols = [symbol for symbol in query.get("symbols", "").split(",") if symbol]
+            if parts[-1] == "bars":
+                return "data bars", self.bars(symbols, query)
+            if parts[-1] == "latest":
+                return "data quotes", {"quotes": {symbol: self.quote(symbol)
+                                                  for symbol in symbols if symbol in market.index}}
+            if parts[-1] == "snapshots":
+                return "data snapshots", {symbol: self.snapshot(symbol)
+                                          for symbol in symbols if symbol in market.index}
+        if upstream == "trading":
+            resource = parts[1] if len(parts) > 1 else ""
+            if resource == "account":
+                return "trading account", self.account()
+            if resource == "orders" and method == "POST":
+                return "trading submit_order", self.submit(body or {})
+            if resource == "orders":
+                return "trading orders", self.query_orders(query)
+            if resource == "positions" and len(parts) > 2:
+                return "trading position", self.position(parts[2])
+            if resource == "positions":
+                return "trading positions", [self.position(symbol) for symbol in market.positions]
+        if upstream == "polygon":
+            indicator, ticker = parts[-2], parts[-1]
+            return f"polygon {indicator}", self.indicator(indicator, ticker)
+        raise KeyError(path)
+
+    def feed(self, feed: str) -> (list[dict]):
+        market = self.market
+        order = np.argsort(-market.volume, kind="stable")
+        if feed == "gainers":
+            order = np.argsort(-market.change, kind="stable")[:len(order) // 5]
+        elif feed == "losers":
+            order = np.argsort(market.change, kind="stable")[:len(order) // 5]
+        return [{"symbol": market.symbols[row], "name": market.symbols[row],
+                 "change": float(market.change[row]), "price": float(market.closes[row, -1]),
+                 "changesPercentage": float(market.change[row])} for row in order]
+
+    def bars(self, symbols: list[str], query: dict) -> (dict):
+        market = self.market
+        start = datetime.fromisoformat(query["start"].replace("Z", "+00:00"))
+        first = next((i for i, stamp in enumerate(market.timestamps) if stamp >= start),
+                     len(market.timestamps))
+        per_symbol = len(market.timestamps) - first
+        rows = [market.index[symbol] for symbol in symbols if symbol in market.index]
+        offset = int(query.get("page_token") or 0)
+        limit = min(int(query.get("limit", BARS_PAGE_LIMIT)), BARS_PAGE_LIMIT)
+        end = min(offset + limit, len(rows) * per_symbol)
+        bars: dict[str, list[dict]] = {}
+        for position in range(offset, end):
+            row, bar = divmod(position, per_symbol) if per_symbol else (0, 0)
+            close = float(market.closes[rows[row], first + bar])
+            bars.setdefault(market.symbols[rows[row]], []).append({
+                "t": market.stamps[first + bar], "o": close, "h": close, "l": close, "c": close,
+                "v": 1000, "n": 10, "vw": close,
+                })
+        token = str(end) if end < len(rows) * per_symbol else None
+        return {"bars": bars, "next_page_token": token}
+
+    def quote(self, symbol: str) -> (dict):
+        last = self.market.last(symbol)
+        return {"ap": round(last * 1.0005, 2), "as": 1, "bp": round(last * 0.9995, 2), "bs": 1,
+                "t": iso(datetime.now(timezone.utc))}
+
+    def snapshot(self, symbol: str) -> (dict):
+        market = self.market
+        row = market.index[symbol]
+        last = market.last(symbol)
+        return {"latestQuote": self.quote(symbol),
+                "dailyBar": {"o": last, "h": last, "l": last, "c": last,
+                             "v": float(market.volume[row])}}
+
+    def account(self) -> (dict):
+        return {"id": str(uuid.UUID(int=1)), "account_number": "PA0000001", "status": "ACTIVE",
+                "currency": "USD", "cash": "100000", "buying_power": "200000",
+                "equity": "100000", "portfolio_value": "100000"}
+
+    def position(self, symbol: str) -> (dict):
+        last = self.market.last(symbol)
+        plpc = self.market.positions[symbol]
+        return {"asset_id": str(uuid.uuid5(uuid.NAMESPACE_OID, symbol)), "symbol": symbol,
+                "exchange": "NASDAQ", "asset_class": "us_equity", "qty": "10",
+                "qty_available": "10", "side": "long", "avg_entry_price": str(last / (1 + plpc)),
+                "cost_basis": str(10 * last / (1 + plpc)), "market_value": str(10 * last),
+                "unrealized_plpc": str(plpc), "current_price": str(last)}
+
+    def submit(self, body: dict) -> (dict):
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            if self.orders:
+                # strictly increasing submission times, like separate requests would get
+                last = datetime.fromisoformat(self.orders[-1]["submitted_at"].replace("Z", "+00:00"))
+                now = max(now, last + timedelta(microseconds=1))
+            order = {
+                "id": str(uuid.uuid4()), "client_order_id": body.get("client_order_id")
+                or str(uuid.uuid4()), "created_at": iso(now), "updated_at": iso(now),
+                "submitted_at": iso(now), "filled_at": iso(now), "asset_class": "us_equity",
+                "symbol": body["symbol"], "qty": str(body["qty"]), "filled_qty": str(body["qty"]),
+                "filled_avg_price": str(self.market.last(body["symbol"])),
+                "order_class": "simple", "order_type": "market", "type": "market",
+                "side": body["side"], "time_in_force": body["time_in_force"],
+                "status": "filled", "extended_hours": False,
+                }
+            self.orders.append(order)
+        return order
+
+    def query_orders(self, query: dict) -> (list[dict]):
+        status = query.get("status", "open")
+        after = query.get("after")
+        symbols = set(query["symbols"].split(",")) if query.get("symbols") else None
+        with self.lock:
+            orders = [order for order in self.orders
+                      if (status in ("all", "closed"))
+                      and (after is None or order["submitted_at"] > iso(
+                          datetime.fromisoformat(after.replace("Z", "+00:00"))))
+                      and (symbols is None or order["symbol"] in symbols)]
+        orders.sort(key=lambda order: order["submitted_at"], reverse=query.get("direction") != "asc")
+        return orders[:int(query.get("limit", 50))]
+
+    def indicator(self, indicator: str, ticker: str) -> (dict):
+        last = self.market.last(ticker) if ticker in self.market.index else 1.0
+        stamp = int(time.time() * 1000)
+        if indicator == "rsi":
+            values = [{"timestamp": stamp, "value": 50.0}]
+        else:
+            values = [{"timestamp": stamp, "value": last * 0.01, "signal": last * 0.009,
+                       "histogram": last * 0.001}]
+        return {"results": {"values": values}, "status": "OK"}
@@ -0,0 +1,90 @@
+"""
+Measures Cloud Function cold-start cost per Pub/Sub message type.
+
+Every sample runs in a fresh interpreter and records the time to import
+functions.main and the time subscribe spends setting up a message type
+before its first network call, plus which heavy SDKs (and whether the
+strategy module) ended up loaded. Only the paths that run the strategy in
+the invoked process should load main_strategy.
+
+Usage: python benchmarks/startup_bench.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("alpaca", "firebase_admin", "massive", "numpy",
+                 "functions.strategy.main_strategy")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from functions import main
+imported = time.perf_counter()
+{setup}
+done = time.perf_counter()
+print(json.dumps({{
+    "import": imported - start,
+    "first_invocation": done - imported,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+CLIENT_SETUP = """
+from functions.strategy import main_strategy
+main_strategy.ClientInstance()
+"""
+
+FIRESTORE_SETUP = """
+import firebase_admin
+from firebase_admin import firestore
+from functions.strategy import firestore_db
+firestore_db.write_errors()
+"""
+
+# What subscribe builds for each message type before it talks to an API
+SCENARIOS = {
+    "buy": CLIENT_SETUP,
+    "sell": CLIENT_SETUP,
+    "push": CLIENT_SETUP + FIRESTORE_SETUP,
+    # a registry fans out to workers, a push run's parent only reads the registry
+    "push portfolios": """
+from functions.strategy import firestore_db, portfolios
+portfolios.load_registry()
+""" + FIRESTORE_SETUP,
+    "unknown": """
+from functions.strategy import firestore_db, portfolios
+""",
+}
+
+
+def sample(setup: str) -> (dict):
+    """runs one probe in a fresh interpreter and returns its measurements"""
+    env = dict(os.environ, ALPACA_KEY="bench", ALPACA_SECRET="bench")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(setup=setup, heavy=HEAVY_MODULES)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'message':<16} {'import ms':>10} {'first call ms':>14}  loaded modules")
+    for message, setup in SCENARIOS.items():
+        samples = [sample(setup) for _ in range(args.repeat)]
+        import_ms = statistics.median(s["import"] for s in samples) * 1000
+        invoke_ms = statistics.median(s["first_invocation"] for s in samples) * 1000
+        loaded = ", ".join(name.rsplit(".", 1)[-1] for name in samples[-1]["loaded"]) or "-"
+        print(f"{message:<16} {import_ms:>10.1f} {invoke_ms:>14.1f}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Runs the real StrategyExecution buy, sell and push flows offline against local
+stand-ins of Alpaca, FMP and Polygon (benchmarks/stand_ins.py) and the
+Firestore fake of the tests, at several watchlist sizes.
+
+Every size gets a fresh synthetic market, an empty market cache and outbox,
+and runs its flows in order (the push exports the orders of the buy and sell)
+in a fresh interpreter. Part of the symbols carry a buy signal and the runs
+may spend half the cash, so the buy submits, reconciles and waits on a batch
+of orders. Reported per flow: wall time, calls per upstream, time the rate
+limiters held the run back, peak RSS and the orders placed.
+
+Usage: python benchmarks/strategy_bench.py [--sizes 30,300,1000,5000]
+       [--latency data=0.02 --latency trading=0.03] [--positions 100] [--repeat 1]
+"""
+import argparse
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stand_ins import StandIns, SyntheticMarket, UPSTREAMS
+
+FLOWS = ("buy", "sell", "push")
+# Seconds of injected latency per upstream, roughly what the live APIs answer in
+DEFAULT_LATENCY = {"trading": 0.03, "data": 0.02, "fmp": 0.05, "polygon": 0.05}
+SECRET = {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret", "MASSIVE_API_KEY": "key",
+          "FMP_KEY": "key"}
+# Share of the cash a run may spend, the live 2% stops a buy after its first order
+ALLOCATION_LIMIT = 0.5
+
+
+def run_flow(flow: str, size: int, trading_url: str) -> (dict):
+    """runs one flow in a benchmark worker process, returns its measurements"""
+    sys.path[:0] = [os.path.join(ROOT, "functions"), os.path.join(ROOT, "tests")]
+    from alpaca.trading.client import TradingClient
+    from fakes import FakeFirestore
+    from strategy import firestore_db, metrics
+    from strategy.main_strategy import StrategyExecution
+    from strategy.rules import StrategyParams
+
+    db = FakeFirestore()
+    firestore_db.get_db = lambda: db
+    client = TradingClient("key", "secret", paper=True, url_override=trading_url)
+    execution = StrategyExecution(client, SECRET, StrategyParams(allocation_limit=ALLOCATION_LIMIT))
+    execution.watchlist_handler.max_watchlist_len = size
+    summaries = []
+    start = time.perf_counter()
+    with metrics.run(flow, summaries.append):
+        if flow == "buy":
+            execution.push_data("buy", execution.buy_strategy() or [])
+        elif flow == "sell":
+            execution.push_data("sell", execution.sell_strategy() or [])
+        else:
+            account, pages = execution.create_data()
+            firestore_db.push_portfolio(account)
+            execution.export_orders(pages)
+        firestore_db.drain(60.0)
+    wall = time.perf_counter() - start
+    return {"wall": wall, "limiter_wait": summaries[0]["limiter_wait"],
+            "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "documents": len(db.documents)}
+
+
+def run_size(stand_ins: StandIns, size: int, positions: int) -> (dict[str, dict]):
+    """runs every flow once over a fresh market of `size` symbols"""
+    stand_ins.reset(SyntheticMarket(size, positions))
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["MARKET_CACHE_DIR"] = os.path.join(workdir, "cache")
+        os.environ["FIRESTORE_OUTBOX"] = os.path.join(workdir, "outbox.db")
+        for flow in FLOWS:
+            stand_ins.calls.clear()
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(run_flow, flow, size, f"{stand_ins.url}/trading").result()
+            result["calls"] = {upstream: sum(count for endpoint, count in stand_ins.calls.items()
+                                             if endpoint.startswith(upstream))
+                               for upstream in UPSTREAMS}
+            result["orders"] = stand_ins.calls["trading submit_order"]
+            if flow == "buy" and not result["orders"]:
+                raise RuntimeError(f"The buy run over {size} symbols placed no orders, "
+                                   "the batch submit and reconcile went unmeasured")
+            results[flow] = result
+    return results
+
+
+def parse_latency(values: list[str]) -> (dict[str, float]):
+    """parses upstream=seconds command line arguments"""
+    latency = dict(DEFAULT_LATENCY)
+    for value in values:
+        name, _, seconds = value.partition("=")
+        if name not in UPSTREAMS:
+            raise ValueError(f"Unknown upstream {name}, expected one of {UPSTREAMS}")
+        latency[name] = float(seconds)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="30,300,1000,5000")
+    parser.add_argument("--latency", action="append", default=[], help="upstream=seconds")
+    parser.add_argument("--positions", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    stand_ins = StandIns(parse_latency(args.latency)).start()
+    os.environ["ALPACA_DATA_URL"] = f"{stand_ins.url}/data/v2/stocks"
+    os.environ["FMP_API_URL"] = f"{stand_ins.url}/fmp/api/v3"
+    os.environ["MASSIVE_API_URL"] = f"{stand_ins.url}/polygon"
+    print(f"{'symbols':>7} {'flow':>5} {'wall s':>8} {'limiter s':>9} {'peak MB':>8} "
+          + " ".join(f"{upstream:>8}" for upstream in UPSTREAMS) + f" {'orders':>6} {'docs':>6}")
+    try:
+        for size in (int(size) for size in args.sizes.split(",")):
+            runs = [run_size(stand_ins, size, args.positions) for _ in range(args.repeat)]
+            for flow in FLOWS:
+                results = [run[flow] for run in runs]
+                last = results[-1]
+                print(f"{size:>7} {flow:>5} {statistics.median(r['wall'] for r in results):>8.2f} "
+                      f"{last['limiter_wait']:>9.2f} {max(r['peak_mb'] for r in results):>8.0f} "
+                      + " ".join(f"{last['calls'][upstream]:>8}" for upstream in UPSTREAMS)
+                      + f" {last['orders']:>6} {last['documents']:>6}")
+    finally:
+        stand_ins.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,14 @@ import base64
 import logging
 import functions_framework
 from cloudevents.http.event import CloudEvent
-from .strategy import main_strategy
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Seconds an invocation waits for queued Firestore writes before returning
+OUTBOX_DRAIN_TIMEOUT = 30.0
+
 @functions_framework.cloud_event
 def subscribe(cloud_event: CloudEvent) -> (None):
     """
@@ -18,16 +20,40 @@ def subscribe(cloud_event: CloudEvent) -> (None):
     """
     msg = base64.b64decode(cloud_event.data["message"]["data"]).decode()
 
-    trading = main_strategy.ClientInstance()
+    # imported on first invocation to keep the cold start light
+    from .strategy import firestore_db, portfolios
+    if msg not in portfolios.ACTIONS:
+        logger.warning("Ignoring unknown message %s", msg)
+        return
+    registry = portfolios.load_registry()
+    if registry != [portfolios.DEFAULT_PORTFOLIO]:
+        logger.info("Running %s for %s portfolios", msg, len(registry))
+        try:
+            portfolios.run_portfolios(msg, registry)
+        finally:
+            firestore_db.drain(OUTBOX_DRAIN_TIMEOUT)
+        return
+    # only the single portfolio path runs the strategy in this process
+    from .strategy import main_strategy
+    # reused across invocations while the container stays warm
+    trading = main_strategy.get_client_instance()
 
-    if msg == "buy":
-        logger.info("Executing buy strat now!")
-        trading.execute_buy_strategy()
+    try:
+        if msg == "buy":
+            logger.info("Executing buy strat now!")
+            trading.execute_buy_strategy()
 
-    elif msg == "sell":
-        logger.info("Executing sell strat now!")
-        trading.execute_sell_strategy()
+        elif msg == "sell":
+            logger.info("Executing sell strat now!")
+            trading.execute_sell_strategy()
 
-    elif msg == "push":
-        logger.info("Pushing data now!")
-        trading.push_port_orders()
\ No newline at end of file
+        elif msg == "push":
+            logger.info("Pushing data now!")
+            trading.push_port_orders()
+    except Exception:
+        # don't carry possibly broken clients into the next invocation
+        main_strategy.invalidate_client_instance()
+        raise
+    finally:
+        # the instance may be frozen once the function returns
+        firestore_db.drain(OUTBOX_DRAIN_TIMEOUT)
@@ -0,0 +1,97 @@
+"""Module caches Alpaca account details and keeps a local ledger of reserved and spent cash"""
+import logging
+import threading
+import time
+from collections.abc import Callable
+from alpaca.trading.models import TradeAccount
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds an account snapshot is trusted before it's resynced with Alpaca
+ACCOUNT_MAX_AGE = 60.0
+
+
+class AccountSnapshot():
+    """
+    Cached view of the trading account. Cash reserved by submitted but unfilled
+    orders and cash spent by fills since the last sync are tracked locally from
+    trade updates, so cash checks only resync once the snapshot is older than max_age
+    """
+    def __init__(self, fetch: Callable[[], TradeAccount], max_age: float = ACCOUNT_MAX_AGE):
+        self.fetch = fetch
+        self.max_age = max_age
+        self.account: TradeAccount|None = None
+        self.fetched_at = 0.0
+        self.opening: float|None = None
+        self.pending: dict[str, float] = {}
+        self.settled: dict[str, float] = {}
+        # fill notional per order already in the cash of the last sync
+        self.synced: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def current(self) -> ("AccountSnapshot"):
+        """Returns the snapshot, resyncing it first if it's stale"""
+        with self.lock:
+            if self.account is None or time.monotonic() - self.fetched_at >= self.max_age:
+                self.account = self.fetch()
+                self.fetched_at = time.monotonic()
+                if self.opening is None:
+                    self.opening = float(self.account.cash) # pyright: ignore
+                # fills before the sync are in the cash Alpaca reports, later
+                # settles of the same orders only book what filled after it.
+                # Open orders stay reserved, Alpaca's cash doesn't include them
+                for order_id, spent in self.settled.items():
+                    self.synced[order_id] = self.synced.get(order_id, 0.0) + spent
+                self.settled.clear()
+                logger.debug("Account snapshot resynced")
+        return self
+
+    @property
+    def cash(self) -> (float):
+        """Cash reported by Alpaca minus the cash reserved by pending orders and spent since"""
+        if self.account is None:
+            raise RuntimeError("Account snapshot read before it was synced")
+        committed = sum(self.pending.values()) + sum(self.settled.values())
+        return float(self.account.cash) - committed # pyright: ignore
+
+    @property
+    def opening_cash(self) -> (float):
+        """
+        Cash Alpaca reported at the first sync of the run, before any of the run's
+        spend. The daily allocation is a share of it
+        """
+        if self.opening is None:
+            raise RuntimeError("Account snapshot read before it was synced")
+        return self.opening
+
+    def reserve(self, order_id: str, amount: float) -> (None):
+        """Reserves cash for a submitted order until it fills"""
+        with self.lock:
+            self.pending[order_id] = self.pending.get(order_id, 0.0) + amount
+
+    def settle(self, order_id: str, spent: float, remaining: float = 0.0) -> (None):
+        """
+        Books the executed notional of an order's fills (cumulative, as the order
+        book reports it) and keeps `remaining` reserved for its unfilled quantity
+        """
+        with self.lock:
+            self.settled[order_id] = max(spent - self.synced.get(order_id, 0.0), 0.0)
+            if remaining > 0:
+                self.pending[order_id] = remaining
+            else:
+                self.pending.pop(order_id, None)
+
+    def release(self, order_id: str) -> (None):
+        """Drops the reservation of an order that closed without filling further"""
+        with self.lock:
+            self.pending.pop(order_id, None)
+
+    def reset(self) -> (None):
+        """Drops all reservations and forces a resync, used at the start of a run"""
+        with self.lock:
+            self.pending.clear()
+            self.settled.clear()
+            self.synced.clear()
+            self.account = None
+            self.opening = None
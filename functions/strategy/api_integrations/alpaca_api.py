@@ -0,0 +1,110 @@
+"""Module returns bulk stock market data from the Alpaca Market Data API"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+import requests
+from requests.adapters import HTTPAdapter
+from . import rate_limiter
+from .. import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DATA_URL = os.getenv("ALPACA_DATA_URL", "https://data.alpaca.markets/v2/stocks")
+# Enough hourly bars to seed MACD(12,26,9) and let the EMAs converge
+BAR_LOOKBACK_DAYS = 30
+
+
+def create_session(secret: dict, pool_size=10) -> (requests.Session):
+    """
+    Returns a keep-alive session authenticated against the Alpaca data API,
+    reuse it for every data request of a run to skip repeated TLS handshakes
+    """
+    session = requests.Session()
+    session.headers.update({"accept": "application/json",
+                            "APCA-API-KEY-ID": secret['ALPACA_KEY'],
+                            "APCA-API-SECRET-KEY": secret['ALPACA_SECRET']
+                            })
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch(session: requests.Session, path: str, params: dict, timeout: float,
+          endpoint: str) -> (requests.Response):
+    """
+    GETs a data API path under the shared rate limiter, a 429 is retried once
+    the limiter's pause is over. Raises requests.HTTPError for error responses,
+    other requests.RequestExceptions for timeouts and connection failures
+    """
+    def request() -> (requests.Response):
+        with metrics.measure(endpoint) as call:
+            response = session.get(f"{DATA_URL}/{path}", params=params, timeout=timeout)
+            call.bytes = len(response.content)
+            call.failed = not response.ok
+        return response
+    response = rate_limiter.send("alpaca_data", request)
+    response.raise_for_status()
+    return response
+
+
+def get_latest_quotes(symbols: list[str], session: requests.Session) -> (dict[str, dict]):
+    """
+    Fetches the latest quote of every symbol with one multi-symbol request,
+    returns the quotes keyed by symbol
+    """
+    params = {"symbols": ",".join(symbol.upper() for symbol in symbols), "feed": "iex"}
+    try:
+        response = fetch(session, "quotes/latest", params, 4, "alpaca_data.quotes")
+    except requests.RequestException as exc:
+        logger.error("Request error encountered while fetching Alpaca stock quotes: %s", exc)
+        raise RuntimeError("Error occured while getting quotes from Alpaca API") from exc
+    return response.json().get("quotes") or {}
+
+
+def get_snapshots(symbols: list[str], session: requests.Session) -> (dict[str, dict]):
+    """
+    Fetches the snapshot (latest quote and trade, daily bars) of every symbol
+    with one multi-symbol request, returns the snapshots keyed by symbol
+    """
+    params = {"symbols": ",".join(symbol.upper() for symbol in symbols), "feed": "iex"}
+    try:
+        response = fetch(session, "snapshots", params, 4, "alpaca_data.snapshots")
+    except requests.RequestException as exc:
+        logger.error("Request error encountered while fetching Alpaca snapshots: %s", exc)
+        raise RuntimeError("Error occured while getting snapshots from Alpaca API") from exc
+    return {symbol: snapshot for symbol, snapshot in (response.json() or {}).items() if snapshot}
+
+
+def get_bars(symbols: list[str], session: requests.Session, timeframe="1Hour",
+             lookback_days=BAR_LOOKBACK_DAYS, start: datetime|None = None
+             ) -> (dict[str, list[dict]]):
+    """
+    Fetches bars for all symbols with one (paginated) multi-symbol bars request,
+    from `start` or else the last lookback_days, and returns them oldest first
+    keyed by symbol. Bars are the raw API dicts (t, o, h, l, c, v, ...)
+    """
+    if start is None:
+        start = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+    params = {
+        "symbols": ",".join(symbol.upper() for symbol in symbols),
+        "timeframe": timeframe,
+        "start": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "adjustment": "split",
+        "feed": "iex",
+        "limit": 10000,
+    }
+    all_bars: dict[str, list[dict]] = {}
+    while True:
+        try:
+            response = fetch(session, "bars", params, 10, "alpaca_data.bars")
+        except requests.RequestException as exc:
+            logger.error("Error occured while getting bars from Alpaca API: %s", exc)
+            raise RuntimeError("Error occured while getting bars from Alpaca API") from exc
+        result = response.json()
+        for symbol, bars in (result.get("bars") or {}).items():
+            all_bars.setdefault(symbol, []).extend(bars)
+        page_token = result.get("next_page_token")
+        if not page_token:
+            return all_bars
+        params["page_token"] = page_token
@@ -1,31 +1,45 @@
 """Module returns stock market data from the FMP (Financial Modeling Prep) API"""
 import json
 import logging
+import os
+from urllib.error import HTTPError
 from urllib.request import urlopen, Request
-from requests import HTTPError
 import certifi
+from . import rate_limiter
+from .. import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BASE_URL = os.getenv("FMP_API_URL", "https://financialmodelingprep.com/api/v3")
+# Market movers endpoints by feed name
+FEEDS = {
+    "active": "actives",
+    "gainer": "gainers",
+    "loser": "losers",
+}
+
 def get_jsonparsed_data(datatype, key) -> (list|None):
     """returns data from API endpoint (arg: api url)"""
     user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
     headers = {'User-Agent': user_agent}
-    try:
-        if datatype == "gainer":
-            url = f'https://financialmodelingprep.com/api/v3/stock_market/gainers?apikey={key}'
-            request = Request(url, headers=headers)
-            response = urlopen(request, cafile=certifi.where())
-            data = response.read().decode("utf-8")
-            return json.loads(data)
-        if datatype == "active":
-            url = f'https://financialmodelingprep.com/api/v3/stock_market/actives?apikey={key}'
-            request = Request(url, headers=headers)
-            response = urlopen(request, cafile=certifi.where())
-            data = response.read().decode("utf-8")
-            return json.loads(data)
-    except HTTPError as exc:
-        logger.error("Error occured while getting data from FMP API: %s", exc)
-        raise RuntimeError("Error occured while getting data from FMP API") from exc
+    if datatype not in FEEDS:
+        return None
+    url = f'{BASE_URL}/stock_market/{FEEDS[datatype]}?apikey={key}'
+    request = Request(url, headers=headers)
+    for attempt in range(rate_limiter.RETRIES + 1):
+        rate_limiter.acquire("fmp")
+        try:
+            with metrics.measure(f"fmp.{FEEDS[datatype]}") as call:
+                response = urlopen(request, cafile=certifi.where())
+                data = response.read()
+                call.bytes = len(data)
+        except HTTPError as exc:
+            rate_limiter.observe("fmp", exc.code, exc.headers)
+            if exc.code == rate_limiter.TOO_MANY_REQUESTS and attempt < rate_limiter.RETRIES:
+                continue
+            logger.error("Error occured while getting data from FMP API: %s", exc)
+            raise RuntimeError("Error occured while getting data from FMP API") from exc
+        rate_limiter.observe("fmp", response.status, response.headers)
+        return json.loads(data.decode("utf-8"))
     return None
\ No newline at end of file
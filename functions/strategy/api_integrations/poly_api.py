@@ -1,19 +1,63 @@
 """Module returns RSI and EMA data from Polygon.io API"""
+import functools
 import logging
 import os
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
-from massive import RESTClient
-from requests import HTTPError
+from urllib3.util.retry import Retry
+from . import rate_limiter
+from .. import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-load_dotenv()
-client = RESTClient(api_key=os.getenv("MASSIVE_API_KEY"))
+
+# MASSIVE_API_URL overrides it, read with the .env when the client is built
+BASE_URL = "https://api.massive.com"
+# The client's own retries without 429, which urllib3 would retry (also when
+# a Retry-After comes with it) and then raise as MaxRetryError.
+# rate_limiter.send waits those out instead
+RETRIES = Retry(total=3, status_forcelist=[413, 499, 500, 502, 503, 504],
+                backoff_factor=0.1, raise_on_status=False, respect_retry_after_header=False)
+
+
+def endpoint(url: str) -> (str):
+    """metrics name of a Polygon URL, /v1/indicators/rsi/AAA is polygon.rsi"""
+    parts = urlsplit(url).path.strip("/").split("/")
+    if len(parts) > 2 and parts[1] == "indicators":
+        return f"polygon.{parts[2]}"
+    return "polygon." + ".".join(parts[:2])
+
+
+@functools.cache
+def get_client():
+    """
+    Returns the process-wide Polygon client, created on first use. Every
+    request it makes takes a token from the polygon bucket, which sees the
+    response and retries it after a 429. Only the HTTP calls are timed, the
+    limiter's waits are recorded apart from them
+    """
+    from massive import RESTClient
+    load_dotenv()
+    client = RESTClient(api_key=os.getenv("MASSIVE_API_KEY"),
+                        base=os.getenv("MASSIVE_API_URL", BASE_URL))
+    request = client.client.request
+    def throttled_request(method, url, **kwargs):
+        kwargs["retries"] = RETRIES
+        def timed_request():
+            with metrics.measure(endpoint(url)) as call:
+                response = request(method, url, **kwargs)
+                call.bytes = len(response.data or b"")
+                call.failed = response.status >= 400
+            return response
+        return rate_limiter.send("polygon", timed_request)
+    client.client.request = throttled_request
+    return client
 
 
 def get_indicator(tckr, indicator) -> (int|tuple[int,int,int]):
     """collects RSI or MACD data provided a ticker and returns it"""
     indicator = indicator.lower()
+    client = get_client()
     if indicator == "rsi":
         try:
             rsi = client.get_rsi(
@@ -26,7 +70,7 @@ def get_indicator(tckr, indicator) -> (int|tuple[int,int,int]):
             if rsi:
                 return rsi.values[0].value # pyright: ignore
 
-        except HTTPError as exc:
+        except Exception as exc:
             raise RuntimeError("Error fetching RSI data from polygon API: ") from exc
 
     if indicator == "macd":
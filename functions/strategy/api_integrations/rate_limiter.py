@@ -0,0 +1,238 @@
+"""
+Module holds process-wide token-bucket rate limiters, one per upstream API.
+
+The buckets start from the documented quotas and adapt to what the upstream
+reports: X-RateLimit-Limit sets the budget, X-RateLimit-Remaining caps the
+tokens (other processes may share the key) and a 429 pauses the bucket until
+Retry-After / X-RateLimit-Reset, or for a jittered exponential backoff. APIs
+that send no limit headers halve their rate on a 429 and grow it back slowly,
+up to max_rate, while calls succeed.
+
+Processes sharing an API key split its quota: set_share() scales the buckets
+of such APIs down to the process's part of it.
+"""
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from collections.abc import Callable, Iterable, Mapping
+from email.utils import parsedate_to_datetime
+from .. import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Window the X-RateLimit-Limit header counts requests in
+LIMIT_WINDOW = 60.0
+# Retries of a request answered with 429
+RETRIES = 3
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Share of the starting rate added back per successful call after a 429
+RECOVERY_STEP = 0.05
+TOO_MANY_REQUESTS = 429
+# Requests per minute of the Polygon plan, it sends no limit headers to learn it from
+POLYGON_CALLS_PER_MIN = int(os.getenv("POLYGON_CALLS_PER_MIN", "5"))
+
+
+def header_number(headers: Mapping|None, name: str) -> (float|None):
+    """numeric value of a response header, None if it's missing or malformed"""
+    value = headers.get(name) if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(headers: Mapping|None) -> (float|None):
+    """seconds to wait before the next request as the upstream asks for, None if it doesn't"""
+    if headers is None:
+        return None
+    seconds = header_number(headers, "Retry-After")
+    if seconds is None and headers.get("Retry-After"):
+        try:
+            seconds = parsedate_to_datetime(headers["Retry-After"]).timestamp() - time.time()
+        except (TypeError, ValueError):
+            seconds = None
+    reset = header_number(headers, "X-RateLimit-Reset")
+    if seconds is None and reset is not None:
+        # an epoch timestamp or, for some APIs, seconds until the window resets
+        seconds = reset - time.time() if reset > 1e9 else reset
+    return max(seconds, 0.0) if seconds is not None else None
+
+
+class TokenBucket():
+    """
+    Thread-safe token bucket, allows bursts of up to `calls` requests
+    and refills at calls/period tokens per second. observe() adapts it to
+    the responses of the upstream
+    """
+    def __init__(self, calls: int, period: float, max_rate: float|None = None):
+        self.capacity = float(calls)
+        self.rate = calls / period
+        self.base_rate = self.rate
+        self.max_rate = max_rate or self.rate
+        self.tokens = float(calls)
+        # part of the quota this process may use, the rest is other processes'
+        self.share = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.rejections = 0
+        self.throttled = 0
+        self.reported = False
+        self.lock = threading.Lock()
+
+    def acquire(self) -> (float):
+        """Blocks until a token is available, returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                else:
+                    wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def observe(self, status: int, headers: Mapping|None = None) -> (None):
+        """adapts the budget to one response's status code and rate limit headers"""
+        limit = header_number(headers, "X-RateLimit-Limit")
+        remaining = header_number(headers, "X-RateLimit-Remaining")
+        with self.lock:
+            if limit:
+                self.reported = True
+                self.capacity = max(1.0, limit * self.share)
+                self.rate = self.max_rate = limit * self.share / LIMIT_WINDOW
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+            if status == TOO_MANY_REQUESTS:
+                self.rejections += 1
+                self.throttled += 1
+                delay = retry_after(headers)
+                if delay is None:
+                    delay = random.uniform(0.5, 1.0) * min(
+                        BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.rejections - 1))
+                else:
+                    # spread the callers waiting on the same reset
+                    delay += random.uniform(0.0, 0.1 * delay + 0.1)
+                if not self.reported:
+                    self.rate = max(self.rate / 2, self.base_rate / 10)
+                self.tokens = 0.0
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                logger.warning("Rate limited, pausing for %.1fs at %.1f calls/min",
+                               delay, self.rate * 60)
+                return
+            self.rejections = 0
+            if remaining == 0 and (delay := retry_after(headers)):
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            if not self.reported and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + RECOVERY_STEP * self.base_rate)
+
+    def set_share(self, share: float) -> (None):
+        """scales the budget to the given part of the quota, e.g. 1/4 for four processes"""
+        with self.lock:
+            factor = share / self.share
+            self.share = share
+            # at least one call of burst, else the bucket would never hand out a token
+            capacity = max(1.0, self.capacity * factor)
+            self.tokens *= capacity / self.capacity
+            self.capacity = capacity
+            self.rate *= factor
+            self.base_rate *= factor
+            self.max_rate *= factor
+
+    def state(self) -> (dict):
+        """current budget for monitoring, rates in calls per minute"""
+        with self.lock:
+            now = time.monotonic()
+            return {
+                "calls_per_min": self.rate * 60,
+                "burst": self.capacity,
+                "tokens": min(self.capacity, self.tokens + (now - self.updated) * self.rate),
+                "paused_for": max(self.paused_until - now, 0.0),
+                "throttled": self.throttled,
+                "from_headers": self.reported,
+            }
+
+
+# Shared by every caller of the same API so the budget matches the real quota.
+# APIs without limit headers may probe up to max_rate (calls per second),
+# Polygon's quota is a hard plan limit so it never goes past it
+BUCKETS = {
+    "polygon": TokenBucket(calls=POLYGON_CALLS_PER_MIN, period=61),
+    "alpaca_data": TokenBucket(calls=200, period=61),
+    "alpaca_trading": TokenBucket(calls=200, period=61),
+    "fmp": TokenBucket(calls=250, period=61, max_rate=3000 / 60),
+}
+
+
+def acquire(api: str) -> (float):
+    """Takes one token from the bucket of the given API"""
+    waited = BUCKETS[api].acquire()
+    metrics.record_wait(api, waited)
+    if waited:
+        logger.debug("Waited %.2fs for the %s rate limit", waited, api)
+    return waited
+
+
+def observe(api: str, status: int, headers: Mapping|None = None) -> (None):
+    """feeds one response of the given API to its bucket"""
+    BUCKETS[api].observe(status, headers)
+
+
+def set_share(apis: Iterable[str], share: float) -> (None):
+    """gives this process the given part of the quota of every API, for keys shared by processes"""
+    for api in apis:
+        BUCKETS[api].set_share(share)
+
+
+def state() -> (dict[str, dict]):
+    """budget of every bucket keyed by API"""
+    return {api: bucket.state() for api, bucket in BUCKETS.items()}
+
+
+def response_hook(api: str) -> (Callable):
+    """requests response hook feeding every response of a session to the API's bucket"""
+    def hook(response, *args, **kwargs):
+        observe(api, response.status_code, response.headers)
+    return hook
+
+
+def status_code(response) -> (int):
+    """status of a requests or urllib3 response"""
+    status = getattr(response, "status_code", None)
+    return status if status is not None else response.status
+
+
+def send(api: str, request: Callable):
+    """
+    Takes a token and makes a requests or urllib3 call, retrying it after the
+    bucket's pause while the upstream answers 429. Returns the last response
+    """
+    for attempt in range(RETRIES + 1):
+        acquire(api)
+        response = request()
+        status = status_code(response)
+        observe(api, status, response.headers)
+        if status != TOO_MANY_REQUESTS or attempt == RETRIES:
+            return response
+    return response
+
+
+def throttled(api: str):
+    """Decorator that takes a token from the API bucket before every call"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            acquire(api)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
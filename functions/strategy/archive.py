@@ -0,0 +1,275 @@
+"""
+Module keeps a columnar archive of the daily account snapshots and orders.
+
+Every push run appends the day's account and the exported orders to Parquet
+files partitioned by date (hive style, accounts/date=YYYY-MM-DD/<portfolio>.parquet),
+with a compact typed schema: numbers as float64, timestamps in UTC and the
+repeated strings (portfolio, symbol, side, status) dictionary encoded. The
+analytics read only the partitions and columns they need and run vectorized:
+equity curve, returns against a benchmark and P&L per symbol.
+
+The root is set with PORTFOLIO_ARCHIVE, a local directory or any URI pyarrow
+can open (gs://bucket/path). There is no default: /tmp does not outlive a
+Cloud Functions instance, so without a root nothing is archived.
+"""
+import functools
+import logging
+import os
+import uuid
+from collections.abc import Iterable
+from datetime import date, datetime, timezone
+import numpy as np
+import pandas as pd
+from . import firestore_db, serializers
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ROOT = os.getenv("PORTFOLIO_ARCHIVE")
+# Portfolio name of the records written outside a portfolio namespace
+DEFAULT_PORTFOLIO = "default"
+ACCOUNT_FIELDS = ("equity", "last_equity", "cash", "buying_power", "portfolio_value",
+                  "long_market_value", "short_market_value")
+ORDER_NUMBERS = ("qty", "filled_qty", "filled_avg_price", "notional")
+ORDER_LABELS = ("symbol", "side", "type", "status")
+
+
+@functools.cache
+def schemas() -> (dict):
+    """Arrow schema of every dataset, the date column comes from the partition path"""
+    # imported here, pyarrow is only needed by the push and the analytics
+    import pyarrow as pa
+    label = pa.dictionary(pa.int32(), pa.string())
+    stamp = pa.timestamp("us", tz="UTC")
+    return {
+        "accounts": pa.schema([("date", pa.date32()), ("portfolio", label),
+                               ("captured_at", stamp),
+                               *((name, pa.float64()) for name in ACCOUNT_FIELDS)]),
+        "orders": pa.schema([("date", pa.date32()), ("portfolio", label), ("id", pa.string()),
+                             *((name, label) for name in ORDER_LABELS),
+                             *((name, pa.float64()) for name in ORDER_NUMBERS),
+                             ("submitted_at", stamp), ("filled_at", stamp)]),
+    }
+
+
+def number(value) -> (float|None):
+    """float of an Alpaca decimal string, None if it's missing or not a number"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def label(value) -> (str|None):
+    """string of an enum or text field, None if it's missing"""
+    value = serializers.convert_value(value)
+    return str(value) if value is not None else None
+
+
+def order_date(order) -> (date):
+    """
+    partition of an order: the UTC day it filled, else the day it was
+    submitted, today (UTC) for an order without either
+    """
+    return serializers.order_date(order) or datetime.now(timezone.utc).date()
+
+
+class PortfolioArchive():
+    """Date-partitioned Parquet datasets of one archive root"""
+    def __init__(self, root: str):
+        from pyarrow import fs
+        self.root = root
+        self.fs, self.path = fs.FileSystem.from_uri(root if "://" in root else os.path.abspath(root))
+
+    def exists(self, path: str) -> (bool):
+        from pyarrow import fs
+        return self.fs.get_file_info(path).type != fs.FileType.NotFound
+
+    def partition(self, dataset: str, day: date) -> (str):
+        return f"{self.path}/{dataset}/date={day.isoformat()}"
+
+    def write(self, dataset: str, day: date, portfolio: str, table) -> (None):
+        """
+        Replaces the portfolio's file of a day. The file is written under a
+        hidden name first, so scans never see it half written
+        """
+        import pyarrow.parquet as pq
+        directory = self.partition(dataset, day)
+        self.fs.create_dir(directory, recursive=True)
+        staging = f"{directory}/.{portfolio}.{uuid.uuid4().hex}"
+        pq.write_table(table.drop_columns(["date"]), staging, filesystem=self.fs,
+                       compression="zstd")
+        self.fs.move(staging, f"{directory}/{portfolio}.parquet")
+
+    def read(self, dataset: str, day: date, portfolio: str):
+        """the portfolio's records of a day, None if there are none yet"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        file = f"{self.partition(dataset, day)}/{portfolio}.parquet"
+        if not self.exists(file):
+            return None
+        table = pq.read_table(file, filesystem=self.fs)
+        schema = schemas()[dataset]
+        return table.append_column("date", pa.array([day] * len(table), pa.date32())
+                                   ).select(schema.names).cast(schema)
+
+    def append_account(self, account, portfolio: str|None = None) -> (bool):
+        """
+        Stores today's (UTC, like the order partitions) snapshot of a TradeAccount,
+        replacing an earlier one of the day. Failures are logged, the archive
+        never stops a push
+        """
+        import pyarrow as pa
+        portfolio = portfolio or firestore_db.namespace() or DEFAULT_PORTFOLIO
+        captured = datetime.now(timezone.utc)
+        today = captured.date()
+        try:
+            row = {"date": [today], "portfolio": [portfolio], "captured_at": [captured],
+                   **{name: [number(getattr(account, name, None))] for name in ACCOUNT_FIELDS}}
+            self.write("accounts", today, portfolio,
+                       pa.Table.from_pydict(row, schema=schemas()["accounts"]))
+            return True
+        except Exception as exc: # pyarrow raises its own types too, e.g. ArrowTypeError
+            logger.error("Failed to archive the account snapshot: %s", exc)
+            return False
+
+    def append_orders(self, orders: Iterable, portfolio: str|None = None) -> (int):
+        """
+        Merges Alpaca orders into their day's file, an order archived again
+        replaces its earlier record. A day that fails is logged and skipped,
+        the archive never stops an export. Returns the orders archived
+        """
+        import pyarrow as pa
+        portfolio = portfolio or firestore_db.namespace() or DEFAULT_PORTFOLIO
+        schema = schemas()["orders"]
+        by_day: dict[date, list] = {}
+        for order in orders:
+            try:
+                by_day.setdefault(order_date(order), []).append(order)
+            except Exception as exc: # e.g. a timestamp that isn't a datetime
+                logger.error("Not archiving order %s: %s", getattr(order, "id", None), exc)
+        archived = 0
+        for day, day_orders in sorted(by_day.items()):
+            try:
+                columns = {
+                    "date": [day] * len(day_orders),
+                    "portfolio": [portfolio] * len(day_orders),
+                    "id": [str(order.id) for order in day_orders],
+                    **{name: [label(getattr(order, name, None)) for order in day_orders]
+                       for name in ORDER_LABELS},
+                    **{name: [number(getattr(order, name, None)) for order in day_orders]
+                       for name in ORDER_NUMBERS},
+                    "submitted_at": [getattr(order, "submitted_at", None) for order in day_orders],
+                    "filled_at": [getattr(order, "filled_at", None) for order in day_orders],
+                }
+                table = pa.Table.from_pydict(columns, schema=schema)
+                existing = self.read("orders", day, portfolio)
+                if existing is not None:
+                    replaced = np.isin(existing.column("id").to_numpy(zero_copy_only=False),
+                                       columns["id"])
+                    table = pa.concat_tables([existing.filter(pa.array(~replaced)), table])
+                self.write("orders", day, portfolio, table)
+                archived += len(day_orders)
+            except Exception as exc: # pyarrow raises its own types too, e.g. ArrowTypeError
+                logger.error("Failed to archive the orders of %s: %s", day, exc)
+        return archived
+
+    def scan(self, dataset: str, start: date|None = None, end: date|None = None,
+             portfolio: str|None = None, columns: list[str]|None = None):
+        """
+        Arrow table of a dataset between two dates (inclusive). Partitions outside
+        the range are skipped without being opened
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        schema = schemas()[dataset]
+        directory = f"{self.path}/{dataset}"
+        if not self.exists(directory):
+            table = schema.empty_table()
+            return table.select(columns) if columns else table
+        source = ds.dataset(directory, filesystem=self.fs, format="parquet", schema=schema,
+                            partitioning=ds.partitioning(pa.schema([schema.field("date")]),
+                                                         flavor="hive"))
+        condition = None
+        for clause in (ds.field("date") >= start if start else None,
+                       ds.field("date") <= end if end else None,
+                       ds.field("portfolio") == portfolio if portfolio else None):
+            if clause is not None:
+                condition = clause if condition is None else condition & clause
+        return source.to_table(columns=columns, filter=condition)
+
+    def equity_curve(self, portfolio: str|None = None, start: date|None = None,
+                     end: date|None = None) -> (pd.DataFrame):
+        """daily equity of a portfolio, one row per archived day"""
+        portfolio = portfolio or firestore_db.namespace() or DEFAULT_PORTFOLIO
+        table = self.scan("accounts", start, end, portfolio, ["date", "equity"])
+        curve = pd.DataFrame({"date": table.column("date").to_numpy(zero_copy_only=False),
+                              "equity": table.column("equity").to_numpy(zero_copy_only=False)})
+        return curve.sort_values("date", ignore_index=True)
+
+    def symbol_pnl(self, portfolio: str|None = None, start: date|None = None,
+                   end: date|None = None, marks: dict[str, float]|None = None) -> (pd.DataFrame):
+        """
+        P&L per symbol from the filled orders of a period: sale proceeds minus
+        purchase cost, plus the net shares still held valued at `marks` (NaN
+        for a symbol without a mark)
+        """
+        portfolio = portfolio or firestore_db.namespace() or DEFAULT_PORTFOLIO
+        table = self.scan("orders", start, end, portfolio,
+                          ["symbol", "side", "filled_qty", "filled_avg_price"])
+        qty = np.nan_to_num(table.column("filled_qty").to_numpy(zero_copy_only=False))
+        price = np.nan_to_num(table.column("filled_avg_price").to_numpy(zero_copy_only=False))
+        symbols, index = np.unique(table.column("symbol").to_numpy(zero_copy_only=False)
+                                   .astype(str), return_inverse=True)
+        selling = table.column("side").to_numpy(zero_copy_only=False).astype(str) == "sell"
+        count = len(symbols)
+        bought_qty = np.bincount(index, np.where(selling, 0.0, qty), count)
+        sold_qty = np.bincount(index, np.where(selling, qty, 0.0), count)
+        bought = np.bincount(index, np.where(selling, 0.0, qty * price), count)
+        sold = np.bincount(index, np.where(selling, qty * price, 0.0), count)
+        held = bought_qty - sold_qty
+        mark = np.array([(marks or {}).get(symbol, np.nan) for symbol in symbols], dtype=float)
+        value = np.where(held == 0, 0.0, held * mark)
+        return pd.DataFrame({"symbol": symbols, "bought_qty": bought_qty, "sold_qty": sold_qty,
+                             "bought": bought, "sold": sold, "held_qty": held,
+                             "held_value": value, "pnl": sold - bought + value})
+
+
+@functools.cache
+def get_archive() -> (PortfolioArchive|None):
+    """
+    archive at ARCHIVE_ROOT shared by the process, None if no root is set
+    or it can't be opened
+    """
+    if not ARCHIVE_ROOT:
+        logger.warning("PORTFOLIO_ARCHIVE is not set, only Firestore gets the data")
+        return None
+    try:
+        return PortfolioArchive(ARCHIVE_ROOT)
+    except (ImportError, OSError, ValueError) as exc:
+        logger.error("Portfolio archive unavailable, only Firestore gets the data: %s", exc)
+        return None
+
+
+def compare_to_benchmark(curve: pd.DataFrame, benchmark: pd.Series) -> (pd.DataFrame):
+    """
+    Lines an equity curve up with a benchmark close series indexed by date
+    (e.g. SPY), carrying the last close over days the benchmark has none.
+    Adds daily and cumulative returns of both and the excess return
+    """
+    days = pd.to_datetime(curve["date"]).to_numpy()
+    benchmark = benchmark.sort_index()
+    stamps = pd.to_datetime(benchmark.index).to_numpy()
+    closes = benchmark.to_numpy(dtype=float)
+    position = np.searchsorted(stamps, days, side="right") - 1
+    aligned = np.where(position >= 0, closes[np.maximum(position, 0)], np.nan)
+    equity = curve["equity"].to_numpy(dtype=float)
+    frame = pd.DataFrame({"date": curve["date"].to_numpy(), "equity": equity,
+                          "benchmark": aligned})
+    for column in ("equity", "benchmark"):
+        values = frame[column].to_numpy()
+        frame[f"{column}_return"] = np.concatenate(([np.nan], values[1:] / values[:-1] - 1.0))
+        frame[f"{column}_cumulative"] = values / values[0] - 1.0 if len(values) else values
+    frame["excess_return"] = frame["equity_return"] - frame["benchmark_return"]
+    frame["excess_cumulative"] = frame["equity_cumulative"] - frame["benchmark_cumulative"]
+    return frame
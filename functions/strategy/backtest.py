@@ -0,0 +1,327 @@
+"""
+Module replays historical bars through the strategy rules offline.
+
+Bars are loaded from local CSV/Parquet files into aligned (symbols, bars) arrays,
+the indicators are computed once for the whole history and every trading session
+runs the live decision logic: buys at the first bar of the session, sells at the
+last one. Orders are built with StrategyHandler.create_order_data and filled at
+the bar close (plus optional slippage).
+
+Usage: python -m functions.strategy.backtest BARS_PATH [--benchmark SPY] [--out equity.csv]
+"""
+import argparse
+import glob
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from . import indicators, rules, market_cache
+from .rules import StrategyParams, DEFAULT_PARAMS
+from .main_strategy import StrategyHandler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXCHANGE_TIMEZONE = "America/New_York"
+TRADING_DAYS = 252
+
+
+class MarketData():
+    """
+    Bars of many symbols on one time axis. Every array is (symbols, bars),
+    missing bars are NaN
+    """
+    def __init__(self, symbols: list[str], timestamps: np.ndarray, arrays: dict[str, np.ndarray]):
+        self.symbols = list(symbols)
+        self.timestamps = np.asarray(timestamps, dtype="datetime64[ns]")
+        self.arrays = arrays
+        self.days, self.session_open, self.session_close = self.sessions()
+
+    @classmethod
+    def from_closes(cls, symbols: list[str], timestamps: np.ndarray, close: np.ndarray,
+                    volume: np.ndarray|None = None) -> ("MarketData"):
+        """Builds market data from close (and volume) arrays, computing the indicators"""
+        close = np.asarray(close, dtype=float)
+        value, signal, hist = indicators.macd(close)
+        arrays = {
+            "close": close,
+            "price": forward_fill(close),
+            "volume": np.asarray(volume, dtype=float) if volume is not None
+                      else np.full(close.shape, np.nan),
+            "rsi": indicators.rsi(close),
+            "macd": value,
+            "signal": signal,
+            "hist": hist,
+        }
+        return cls(symbols, timestamps, arrays)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["arrays"][name]
+        except KeyError as exc:
+            raise AttributeError(name) from exc
+
+    def sessions(self) -> (tuple[np.ndarray, np.ndarray, np.ndarray]):
+        """Returns the trading days and the first and last bar index of each"""
+        if self.timestamps.size == 0:
+            empty = np.array([], dtype=int)
+            return np.array([], dtype="datetime64[D]"), empty, empty
+        local = pd.DatetimeIndex(self.timestamps, tz="UTC").tz_convert(EXCHANGE_TIMEZONE)
+        days = local.tz_localize(None).to_numpy().astype("datetime64[D]")
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        ends = np.r_[starts[1:] - 1, days.size - 1]
+        return days[starts], starts, ends
+
+    def session_volume(self) -> (np.ndarray):
+        """Total volume per symbol and trading day, (symbols, days)"""
+        if self.session_open.size == 0:
+            return np.zeros((len(self.symbols), 0))
+        return np.add.reduceat(np.nan_to_num(self.volume), self.session_open, axis=1)
+
+
+def forward_fill(values: np.ndarray) -> (np.ndarray):
+    """Carries the last valid value of every row forward over NaN gaps"""
+    index = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return values[np.arange(values.shape[0])[:, None], index]
+
+
+def read_bars(path: str) -> (pd.DataFrame):
+    """
+    Reads bars from a CSV/Parquet file or a directory of them in long format
+    (timestamp, symbol, close[, volume]). Files without a symbol column are
+    taken to hold the symbol named by the file
+    """
+    files = sorted(glob.glob(os.path.join(path, "*"))) if os.path.isdir(path) else [path]
+    frames = []
+    for file in files:
+        if file.endswith(".parquet"):
+            frame = pd.read_parquet(file)
+        elif file.endswith(".csv"):
+            frame = pd.read_csv(file)
+        else:
+            continue
+        frame.columns = [str(column).lower() for column in frame.columns]
+        if "symbol" not in frame:
+            frame["symbol"] = os.path.basename(file).split(".")[0].upper()
+        frames.append(frame[[c for c in ("timestamp", "symbol", "close", "volume") if c in frame]])
+    if not frames:
+        raise ValueError(f"No CSV or Parquet bar files found at {path}")
+    return pd.concat(frames, ignore_index=True)
+
+
+def bar_files_stamp(path: str) -> (str):
+    """changes whenever a bar file under path is added, removed or modified"""
+    files = sorted(glob.glob(os.path.join(path, "*"))) if os.path.isdir(path) else [path]
+    state = "|".join(f"{file}:{os.path.getmtime(file)}:{os.path.getsize(file)}" for file in files)
+    return hashlib.sha1(state.encode("utf-8")).hexdigest()[:16]
+
+
+def load_bars(path: str, cache: market_cache.MarketCache|None = None) -> (MarketData):
+    """
+    Loads bars from local files into MarketData. The parsed arrays are kept in the
+    market cache, so repeated runs over unchanged files skip parsing and pivoting
+    """
+    cache = cache or market_cache.get_cache()
+    source = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    keys = {name: ("local", source, "bars", name, bar_files_stamp(path))
+            for name in ("symbols", "timestamps", "close", "volume")}
+    cached = {name: cache.get(key, float("inf")) for name, key in keys.items()}
+    if all(value is not None for value in cached.values()):
+        timestamps = cached["timestamps"].astype("datetime64[ns]")
+        return MarketData.from_closes(cached["symbols"], timestamps,
+                                      cached["close"], cached["volume"])
+    data = parse_bars(path)
+    cache.put(keys["symbols"], data.symbols)
+    cache.put(keys["timestamps"], data.timestamps.astype(np.int64))
+    cache.put(keys["close"], data.close)
+    cache.put(keys["volume"], data.volume)
+    return data
+
+
+def parse_bars(path: str) -> (MarketData):
+    """Parses bars from local files into MarketData"""
+    bars = read_bars(path)
+    bars["timestamp"] = pd.to_datetime(bars["timestamp"], utc=True)
+    close = bars.pivot_table(index="symbol", columns="timestamp", values="close", aggfunc="last")
+    volume = None
+    if "volume" in bars:
+        volume = bars.pivot_table(index="symbol", columns="timestamp", values="volume",
+                                  aggfunc="sum").reindex(index=close.index, columns=close.columns)
+    timestamps = close.columns.tz_convert("UTC").tz_localize(None).to_numpy()
+    return MarketData.from_closes(
+        list(close.index), timestamps, close.to_numpy(),
+        volume.to_numpy() if volume is not None else None
+        )
+
+
+@dataclass
+class BacktestResult():
+    """Daily equity curve of a backtest, the benchmark curve and the simulated fills"""
+    days: np.ndarray
+    equity: np.ndarray
+    benchmark: np.ndarray|None
+    trades: pd.DataFrame
+
+    def equity_curve(self) -> (pd.DataFrame):
+        """returns the strategy and benchmark equity per trading day"""
+        curve = pd.DataFrame({"date": self.days, "equity": self.equity})
+        if self.benchmark is not None:
+            curve["benchmark"] = self.benchmark
+        return curve
+
+    def summary(self) -> (dict):
+        """returns headline performance numbers of the run"""
+        summary = {
+            "total_return": total_return(self.equity),
+            "max_drawdown": max_drawdown(self.equity),
+            "sharpe": sharpe_ratio(self.equity),
+            "trades": len(self.trades),
+        }
+        if self.benchmark is not None:
+            summary["benchmark_return"] = total_return(self.benchmark)
+            summary["excess_return"] = summary["total_return"] - summary["benchmark_return"]
+        return summary
+
+
+def total_return(curve: np.ndarray) -> (float):
+    """return from the first to the last point of an equity curve"""
+    return float(curve[-1] / curve[0] - 1.0) if curve.size else 0.0
+
+
+def max_drawdown(curve: np.ndarray) -> (float):
+    """largest peak-to-trough loss of an equity curve, as a negative fraction"""
+    if curve.size == 0:
+        return 0.0
+    return float(np.min(curve / np.maximum.accumulate(curve) - 1.0))
+
+
+def sharpe_ratio(curve: np.ndarray) -> (float):
+    """annualized Sharpe ratio of the daily returns of an equity curve"""
+    returns = np.diff(curve) / curve[:-1] if curve.size > 1 else np.array([])
+    if returns.size < 2 or returns.std() == 0:
+        return 0.0
+    return float(returns.mean() / returns.std() * np.sqrt(TRADING_DAYS))
+
+
+class Backtester():
+    """
+    Runs the strategy over MarketData.
+    The watchlist of a session is the max_watchlist_len most traded symbols of the
+    previous session priced at or below max_stock_price (a stand-in for the FMP
+    "actives" list), the benchmark symbol is never traded
+    """
+    def __init__(self, data: MarketData, params: StrategyParams = DEFAULT_PARAMS,
+                 initial_cash=100000.0, benchmark: str|None = None,
+                 max_stock_price=5000.0, max_watchlist_len=30, slippage=0.0):
+        self.data = data
+        self.params = params
+        self.initial_cash = initial_cash
+        self.benchmark = benchmark if benchmark in data.symbols else None
+        self.max_stock_price = max_stock_price
+        self.max_watchlist_len = max_watchlist_len
+        self.slippage = slippage
+        self.tradable = np.ones(len(data.symbols), dtype=bool)
+        if self.benchmark is not None:
+            self.tradable[data.symbols.index(self.benchmark)] = False
+
+    def watchlist(self, day: int, volume: np.ndarray) -> (np.ndarray):
+        """indices of the session's watchlist symbols, most traded first"""
+        bar = self.data.session_open[day]
+        price = self.data.close[:, bar]
+        eligible = np.flatnonzero(self.tradable & (price <= self.max_stock_price))
+        if day > 0:
+            eligible = eligible[np.argsort(-volume[eligible, day - 1], kind="stable")]
+        return eligible[:self.max_watchlist_len]
+
+    def fill(self, symbol: str, qty: float, side: str, price: float, bar: int) -> (dict):
+        """simulates the fill of the market order the live strategy would submit"""
+        order = StrategyHandler.create_order_data(symbol, qty, side)
+        direction = 1.0 if side == "buy" else -1.0
+        return {
+            "timestamp": self.data.timestamps[bar],
+            "symbol": order.symbol,
+            "side": side,
+            "qty": float(order.qty), # pyright: ignore
+            "price": price * (1.0 + direction * self.slippage),
+        }
+
+    def run(self) -> (BacktestResult):
+        """replays every session and returns the daily equity curve"""
+        data, params = self.data, self.params
+        volume = data.session_volume()
+        cash = self.initial_cash
+        qty = np.zeros(len(data.symbols))
+        entry = np.zeros(len(data.symbols))
+        equity = np.empty(data.days.size)
+        trades = []
+
+        for day, (start, end) in enumerate(zip(data.session_open, data.session_close)):
+            watch = self.watchlist(day, volume)
+            buys = watch[rules.macd_bullish(data.macd[watch, start], data.signal[watch, start],
+                                            data.hist[watch, start])
+                         & rules.rsi_oversold(data.rsi[watch, start], params)]
+            opening_cash, spent_already = cash, 0.0
+            for i in buys:
+                if not rules.can_buy(opening_cash, spent_already, params):
+                    break
+                amount = rules.buy_quantity(data.close[i, start], cash, params)
+                if amount <= 0:
+                    continue
+                trade = self.fill(data.symbols[i], amount, "buy", data.close[i, start], start)
+                cost = trade["qty"] * trade["price"]
+                entry[i] = (entry[i] * qty[i] + cost) / (qty[i] + trade["qty"])
+                qty[i] += trade["qty"]
+                cash -= cost
+                spent_already += cost
+                trades.append(trade)
+
+            held = np.flatnonzero(qty > 0)
+            price = data.price[held, end]
+            sells = held[(rules.macd_bearish(data.macd[held, end], data.signal[held, end],
+                                             data.hist[held, end])
+                          & rules.rsi_overbought(data.rsi[held, end], params))
+                         | rules.take_profit_hit(price / entry[held] - 1.0, params)]
+            for i in sells:
+                trade = self.fill(data.symbols[i], qty[i], "sell", data.price[i, end], end)
+                cash += trade["qty"] * trade["price"]
+                qty[i] = 0.0
+                entry[i] = 0.0
+                trades.append(trade)
+
+            equity[day] = cash + qty @ np.nan_to_num(data.price[:, end])
+
+        return BacktestResult(data.days, equity, self.benchmark_curve(), pd.DataFrame(
+            trades, columns=["timestamp", "symbol", "side", "qty", "price"]))
+
+    def benchmark_curve(self) -> (np.ndarray|None):
+        """benchmark closes per session scaled to the initial cash"""
+        if self.benchmark is None:
+            return None
+        closes = self.data.price[self.data.symbols.index(self.benchmark), self.data.session_close]
+        first = closes[~np.isnan(closes)][:1]
+        return self.initial_cash * closes / first[0] if first.size else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the strategy on local bar files")
+    parser.add_argument("path", help="CSV/Parquet bar file or directory of them")
+    parser.add_argument("--benchmark", default="SPY")
+    parser.add_argument("--cash", type=float, default=100000.0)
+    parser.add_argument("--slippage", type=float, default=0.0)
+    parser.add_argument("--out", help="write the equity curve to this CSV file")
+    args = parser.parse_args()
+
+    data = load_bars(args.path)
+    result = Backtester(data, initial_cash=args.cash, benchmark=args.benchmark,
+                        slippage=args.slippage).run()
+    for name, value in result.summary().items():
+        print(f"{name:>16}: {value:.4f}" if isinstance(value, float) else f"{name:>16}: {value}")
+    if args.out:
+        result.equity_curve().to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
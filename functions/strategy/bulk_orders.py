@@ -0,0 +1,183 @@
+"""
+Module submits batches of market orders concurrently and reconciles them.
+
+Every request gets a client order id, the batch is submitted across a thread
+pool (the shared alpaca_trading rate limiter paces it) and the resulting
+statuses are then checked in one paginated get_orders sweep. The BatchResult
+reports the outcome and submit latency of every order. iter_order_pages is the
+paginated order query shared with the end-of-day export.
+"""
+import logging
+import statistics
+import time
+import uuid
+from collections import Counter
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import requests
+from alpaca.common.exceptions import APIError
+from alpaca.trading.client import TradingClient
+from alpaca.trading.enums import QueryOrderStatus, OrderStatus
+from alpaca.trading.models import Order
+from alpaca.trading.requests import GetOrdersRequest, MarketOrderRequest
+from .api_integrations import rate_limiter
+from . import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Largest page get_orders returns
+ORDERS_PAGE_LIMIT = 500
+BATCH_WORKERS = 8
+
+
+@dataclass
+class OrderOutcome():
+    """What happened to one order of a batch"""
+    symbol: str
+    side: str
+    qty: float|None
+    client_order_id: str
+    latency: float = 0.0
+    order: Order|None = None
+    status: str = "not submitted"
+    filled_qty: float = 0.0
+    filled_avg_price: float|None = None
+    error: str|None = None
+
+    def update(self, order: Order) -> (None):
+        """takes the status and fills of an order response"""
+        self.order = order
+        self.status = order.status.value if isinstance(order.status, OrderStatus) else str(order.status)
+        self.filled_qty = float(order.filled_qty or 0)
+        self.filled_avg_price = (float(order.filled_avg_price)
+                                 if order.filled_avg_price is not None else None)
+
+
+@dataclass
+class BatchResult():
+    """Outcomes of a batch in submission order"""
+    outcomes: list[OrderOutcome] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def orders(self) -> (list[Order]):
+        """latest known version of every order that was accepted by Alpaca"""
+        return [outcome.order for outcome in self.outcomes if outcome.order is not None]
+
+    def summary(self) -> (dict):
+        """order counts per status and submit latency percentiles in seconds"""
+        latencies = sorted(outcome.latency for outcome in self.outcomes
+                           if outcome.order is not None)
+        summary = {"orders": len(self.outcomes), "elapsed": self.elapsed,
+                   **Counter(outcome.status for outcome in self.outcomes)}
+        if latencies:
+            summary["latency_p50"] = statistics.median(latencies)
+            summary["latency_max"] = latencies[-1]
+        return summary
+
+
+def submit_batch(submit: Callable[[MarketOrderRequest], Order|None],
+                 orders: list[MarketOrderRequest],
+                 workers: int = BATCH_WORKERS) -> (BatchResult):
+    """
+    Submits the orders concurrently with `submit` (e.g. StrategyHandler.execute_order).
+    Failed submissions are recorded in their outcome instead of raising
+    """
+    start = time.perf_counter()
+    orders = [order if order.client_order_id else
+              order.model_copy(update={"client_order_id": str(uuid.uuid4())})
+              for order in orders]
+    outcomes = [OrderOutcome(order.symbol, str(order.side.value if order.side else ""),
+                             order.qty, order.client_order_id) # pyright: ignore
+                for order in orders]
+
+    def send(order_data: MarketOrderRequest, outcome: OrderOutcome) -> (None):
+        sent = time.perf_counter()
+        try:
+            order = submit(order_data)
+        except Exception as exc: # connection or response validation errors fail the order too
+            outcome.status = "failed"
+            outcome.error = str(exc)
+            logger.error("Failed to place %s order for %s: %s",
+                         order_data.side, order_data.symbol, exc)
+            return
+        finally:
+            outcome.latency = time.perf_counter() - sent
+        if order is not None:
+            outcome.update(order)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(send, order_data, outcome)
+                   for order_data, outcome in zip(orders, outcomes)]
+    for future in futures:
+        future.result()
+    return BatchResult(outcomes, time.perf_counter() - start)
+
+
+def iter_order_pages(client: TradingClient, since: datetime,
+                     status: QueryOrderStatus = QueryOrderStatus.CLOSED,
+                     page_limit: int = ORDERS_PAGE_LIMIT,
+                     symbols: list[str]|None = None) -> (Iterator[list[Order]]):
+    """
+    Yields pages of orders submitted at or after `since`, oldest first, one
+    get_orders call per page. Every request resumes just before the last
+    submission time seen, so orders sharing it are fetched again and dropped
+    instead of being skipped
+    """
+    after = since - timedelta(microseconds=1)
+    boundary: set[str] = set()
+    while True:
+        rate_limiter.acquire("alpaca_trading")
+        try:
+            with metrics.measure("alpaca_trading.get_orders"):
+                page = client.get_orders(GetOrdersRequest(
+                    status=status, after=after, direction="asc", limit=page_limit,
+                    symbols=symbols,
+                    ))
+        except (requests.HTTPError, APIError) as exc:
+            logger.error("Failed to fetch a page of orders: %s", exc)
+            raise RuntimeError("Failed to fetch a page of orders") from exc
+        page = [order for order in page if type(order) == Order] # pyright: ignore
+        fresh = [order for order in page if str(order.id) not in boundary]
+        if fresh:
+            yield fresh
+        if len(page) < page_limit:
+            return
+        if not fresh:
+            logger.warning("More than %s orders share the submission time %s, "
+                           "stopping the sweep", page_limit, after)
+            return
+        last: datetime = page[-1].submitted_at
+        boundary = {str(order.id) for order in page if order.submitted_at == last}
+        after = last - timedelta(microseconds=1)
+
+
+def reconcile(client: TradingClient, result: BatchResult,
+              page_limit: int = ORDERS_PAGE_LIMIT) -> (BatchResult):
+    """
+    Refreshes the status and fills of every submitted order of the batch from
+    one get_orders sweep over the batch's submission window, oldest first
+    """
+    pending = {str(outcome.order.id): outcome for outcome in result.outcomes
+               if outcome.order is not None}
+    if not pending:
+        return result
+    since = min(outcome.order.submitted_at for outcome in pending.values()) # pyright: ignore
+    symbols = sorted({outcome.symbol for outcome in pending.values()})
+    pages = iter_order_pages(client, since, QueryOrderStatus.ALL, page_limit, symbols)
+    try:
+        for page in pages:
+            for order in page:
+                outcome = pending.pop(str(order.id), None)
+                if outcome is not None:
+                    outcome.update(order)
+            if not pending:
+                break
+    except RuntimeError as exc:
+        logger.error("Failed to reconcile order statuses: %s", exc)
+    if pending:
+        logger.warning("%s orders were not found while reconciling", len(pending))
+    return result
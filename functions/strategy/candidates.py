@@ -0,0 +1,129 @@
+"""
+Module ranks watchlist candidates in a columnar table.
+
+The FMP market movers feeds are merged into one row per symbol (the first feed
+listing a symbol wins), Alpaca snapshots add the day's volume and the quoted
+spread, and the price, liquidity and spread filters run on whole columns. The
+top K rows by the chosen score are picked with a partial sort.
+"""
+import logging
+from collections.abc import Callable
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Numeric columns, NaN where a source had no value
+COLUMNS = ("price", "change", "volume", "bid", "ask")
+
+
+class CandidateTable():
+    """Watchlist candidates, one row per symbol and one array per column"""
+    def __init__(self, symbols: np.ndarray, columns: dict[str, np.ndarray]):
+        self.symbols = symbols
+        self.columns = columns
+
+    @classmethod
+    def from_feeds(cls, feeds: list[list[dict]]) -> ("CandidateTable"):
+        """merges feed records (symbol, price, changesPercentage) and drops repeated symbols"""
+        records = [record for feed in feeds for record in feed if record.get("symbol")]
+        symbols = np.array([str(record["symbol"]).upper() for record in records], dtype=str)
+        # np.unique sorts, the first index of every symbol keeps the feed order
+        _, first = np.unique(symbols, return_index=True)
+        first.sort()
+        records = [records[index] for index in first]
+        columns = {name: np.full(len(records), np.nan) for name in COLUMNS}
+        columns["price"][:] = [number(record.get("price")) for record in records]
+        columns["change"][:] = [number(record.get("changesPercentage")) for record in records]
+        return cls(symbols[first], columns)
+
+    def __len__(self) -> (int):
+        return len(self.symbols)
+
+    def take(self, rows: np.ndarray) -> ("CandidateTable"):
+        """table of the given rows (indices or boolean mask)"""
+        return CandidateTable(self.symbols[rows],
+                              {name: column[rows] for name, column in self.columns.items()})
+
+    def add_snapshots(self, snapshots: dict[str, dict]) -> (None):
+        """fills volume, bid and ask from Alpaca snapshots, the day's bar or else the previous one"""
+        for row, symbol in enumerate(self.symbols):
+            snapshot = snapshots.get(symbol)
+            if not snapshot:
+                continue
+            bar = snapshot.get("dailyBar") or snapshot.get("prevDailyBar") or {}
+            quote = snapshot.get("latestQuote") or {}
+            self.columns["volume"][row] = number(bar.get("v"))
+            self.columns["bid"][row] = number(quote.get("bp"))
+            self.columns["ask"][row] = number(quote.get("ap"))
+
+    def dollar_volume(self) -> (np.ndarray):
+        """traded value of the day, price x volume"""
+        return self.columns["price"] * self.columns["volume"]
+
+    def spread(self) -> (np.ndarray):
+        """quoted spread as a fraction of the mid price, NaN without a two-sided quote"""
+        bid, ask = self.columns["bid"], self.columns["ask"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            spread = (ask - bid) / ((ask + bid) / 2)
+        return np.where((bid > 0) & (ask >= bid), spread, np.nan)
+
+    def eligible(self, max_price: float, min_dollar_volume: float,
+                 max_spread: float) -> (np.ndarray):
+        """
+        Mask of the rows passing the filters. Liquidity and spread are only
+        checked where they are known, so a missing snapshot doesn't drop a row
+        """
+        price = self.columns["price"]
+        dollar_volume, spread = self.dollar_volume(), self.spread()
+        return ((price > 0) & (price <= max_price)
+                & (np.isnan(dollar_volume) | (dollar_volume >= min_dollar_volume))
+                & (np.isnan(spread) | (spread <= max_spread)))
+
+    def top(self, score: np.ndarray, k: int) -> (np.ndarray):
+        """
+        Indices of the k highest scores, best first. A partial sort finds the
+        k-th score, ties and NaN scores (ranked last) keep the feed order
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return np.array([], dtype=int)
+        keys = np.where(np.isnan(score), -np.inf, score)
+        kth = -np.partition(-keys, k - 1)[k - 1]
+        above = np.flatnonzero(keys > kth)
+        rows = np.concatenate([above, np.flatnonzero(keys == kth)[:k - len(above)]])
+        return rows[np.argsort(-keys[rows], kind="stable")]
+
+    def records(self) -> (list[dict]):
+        """rows as watchlist records, NaN values left out"""
+        names = list(self.columns)
+        rows = np.column_stack([self.columns[name] for name in names])
+        return [{"symbol": str(symbol), **{name: float(value) for name, value
+                                           in zip(names, rows[row]) if not np.isnan(value)}}
+                for row, symbol in enumerate(self.symbols)]
+
+
+def number(value) -> (float):
+    """float of a feed value, NaN if it's missing or not a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# Ranking scores by name, higher is better
+SCORES: dict[str, Callable[[CandidateTable], np.ndarray]] = {
+    "dollar_volume": CandidateTable.dollar_volume,
+    "volume": lambda table: table.columns["volume"],
+    "change": lambda table: np.abs(table.columns["change"]),
+    "tight_spread": lambda table: -table.spread(),
+}
+
+
+def rank(table: CandidateTable, k: int, score: str = "dollar_volume", max_price: float = np.inf,
+         min_dollar_volume: float = 0.0, max_spread: float = np.inf) -> (CandidateTable):
+    """filters the table and returns its top k rows by `score`, best first"""
+    if score not in SCORES:
+        raise ValueError(f"Unknown watchlist score {score}, expected one of {list(SCORES)}")
+    table = table.take(table.eligible(max_price, min_dollar_volume, max_spread))
+    return table.take(table.top(SCORES[score](table), k))
@@ -1,98 +1,269 @@
 """Firestore DB module"""
-from datetime import date
+from datetime import datetime, timezone
+import functools
+import hashlib
+import json
 import logging
-import uuid
-import firebase_admin
-from firebase_admin import firestore
-from google.api_core.exceptions import PermissionDenied, ServiceUnavailable, DeadlineExceeded, InvalidArgument
+import os
+import sqlite3
+from . import metrics, outbox, serializers
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-# Application Default credentials are automatically created.
-app = firebase_admin.initialize_app()
-db = firestore.client()
+@functools.cache
+def get_db():
+    """
+    Returns the process-wide Firestore client, firebase_admin is imported and
+    initialized on first use so runs that never write don't pay for it
+    """
+    import firebase_admin
+    from firebase_admin import firestore
+    # Application Default credentials are automatically created.
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app()
+    return firestore.client()
+
+
+@functools.cache
+def write_errors() -> (tuple[type[Exception], ...]):
+    """Firestore errors that are logged instead of failing the run"""
+    from google.api_core.exceptions import (
+        PermissionDenied, ServiceUnavailable, DeadlineExceeded, InvalidArgument
+        )
+    return (PermissionDenied, ServiceUnavailable, DeadlineExceeded, InvalidArgument)
+
+
+@functools.cache
+def retry_errors() -> (tuple[type[Exception], ...]):
+    """Errors after which the outbox keeps the documents and retries them later"""
+    from google.api_core.exceptions import GoogleAPICallError, RetryError
+    from google.auth.exceptions import GoogleAuthError
+    return (GoogleAPICallError, RetryError, GoogleAuthError)
+
+
+@functools.cache
+def open_outbox(path: str) -> (outbox.Outbox):
+    """Returns the process-wide outbox stored at `path`"""
+    return outbox.Outbox(path)
 
-def push_portfolio(trade_object): #tradeaccount object
+
+def outbox_path() -> (str):
     """
-    Pushes portfolio data (TradingAccount objects) to the portfolio 
-    firebase collection
+    Outbox file of the current namespace. Every portfolio queues in its own
+    file, so the processes of a multi-portfolio run never share one
     """
-    data = vars(trade_object)
-    for k,v in data.items():
-        if isinstance(v, uuid.UUID):
-            data[k] = str(v)
+    if not _namespace:
+        return outbox.OUTBOX_PATH
+    root, extension = os.path.splitext(outbox.OUTBOX_PATH)
+    return f"{root}.{_namespace}{extension}"
+
+
+def get_outbox() -> (outbox.Outbox):
+    """Returns the outbox the pushes below are queued in"""
+    return open_outbox(outbox_path())
+
+
+@functools.cache
+def get_flusher(box: outbox.Outbox) -> (outbox.OutboxFlusher):
+    """Returns the running background flusher of an outbox"""
+    return outbox.OutboxFlusher(box, write_batched, retry_errors).start()
+
+
+# Firestore caps a WriteBatch at 500 operations
+BATCH_LIMIT = 500
+# Documents of a portfolio other than the default one live under portfolios/<namespace>/
+NAMESPACE_ROOT = "portfolios"
+_namespace = ""
+
+
+def set_namespace(namespace: str) -> (None):
+    """Scopes this process's reads and writes to a portfolio, "" is the top level"""
+    global _namespace
+    _namespace = namespace
+
+
+def namespace() -> (str):
+    """portfolio namespace of this process, "" at the top level"""
+    return _namespace
+
+
+def scoped(path: str) -> (str):
+    """document path inside the current portfolio namespace"""
+    return f"{NAMESPACE_ROOT}/{_namespace}/{path}" if _namespace else path
+
+def push_portfolio(trade_object, client=None): #tradeaccount object
+    """
+    Pushes portfolio data (TradingAccount objects) to the portfolio
+    firebase collection, under today's UTC date like the archive and the orders
+    """
+    data = serializers.serialize(trade_object)
     try:
-        db.collection('portfolio').document(str(date.today())).set(data)
-    except (PermissionDenied, ServiceUnavailable, DeadlineExceeded, InvalidArgument) as exc:
+        deliver([(scoped(f"portfolio/{datetime.now(timezone.utc).date()}"), data)], client)
+    except write_errors() as exc:
         logger.error("Failed to push portfolio data to the firebase collection: %s", exc)
 
-def push_order(order_list):
+
+def document_id(data: dict) -> (str):
     """
-    Pushes buy order and sell order data (Order objects from alpaca backend) 
-    to the orders firebase collection
+    Returns a deterministic document ID so re-pushing the same data overwrites
+    instead of duplicating: the order ID if there is one, else a content hash
     """
-    doc_ref = db.collection('orders').document(str(date.today()))
-    # Create a sub-collection
-    subcollection_ref = doc_ref.collection('orders')
+    if data.get("id"):
+        return str(data["id"])
+    content = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
 
-    # Add documents to the sub-collection if needed
-    if order_list is not None and len(order_list) > 0:
+
+def order_documents(order_list) -> (list[tuple[str, dict]]):
+    """Converts order objects into (document ID, data) pairs"""
+    documents = []
+    for order in order_list:
+        data = serializers.serialize(order)
+        documents.append((document_id(data), data))
+    return documents
+
+
+def write_batched(documents: list[tuple[str, dict]], client=None) -> (int):
+    """
+    Writes (document path, data) pairs in WriteBatches of up to BATCH_LIMIT
+    and returns the number of batches committed
+    """
+    client = client or get_db()
+    batches = 0
+    for start in range(0, len(documents), BATCH_LIMIT):
+        batch = client.batch()
+        for path, data in documents[start:start + BATCH_LIMIT]:
+            batch.set(client.document(path), data)
+        with metrics.measure("firestore.commit"):
+            batch.commit()
+        batches += 1
+    return batches
+
+
+def deliver(documents: list[tuple[str, dict]], client=None, barrier: bool = False) -> (int):
+    """
+    Queues documents in the outbox for the background flusher and returns
+    straight away. Given a client, writes them directly instead. Barrier
+    documents are dropped if a document queued before them was parked.
+    Returns the number of documents queued or written
+    """
+    if client is None:
+        box = get_outbox()
         try:
-            for order in order_list:
-                data = vars(order)
-                for k,v in data.items():
-                    if isinstance(v, uuid.UUID):
-                        data[k] = str(v)
-                subcollection_ref.add(data)
-        except (PermissionDenied, ServiceUnavailable, DeadlineExceeded, InvalidArgument) as exc:
-            logger.error("Failed to push order data to the firebase collection: %s", exc)
-    else:
-        logger.info("No new order data today!")
+            queued = box.append(documents, barrier)
+            get_flusher(box).wake()
+            return queued
+        except sqlite3.Error as exc:
+            logger.error("Failed to queue documents in the outbox, writing directly: %s", exc)
+    write_batched(documents, client)
+    return len(documents)
 
 
-def push_buy_executions(order_list):
+def drain(timeout: float) -> (bool):
     """
-    Pushes buy order execution data to the database
+    Flushes the outbox to Firestore before the invocation ends, the flusher
+    thread may not get CPU time once it has. False if entries are left over
     """
-    doc_ref = db.collection('buy_executions').document(str(date.today()))
+    box = get_outbox()
+    delivered = not box.pending() or box.drain(write_batched, retry_errors, timeout)
+    if not delivered:
+        logger.warning("%s documents are still in the outbox", box.pending())
+    parked = box.parked()
+    if parked:
+        logger.error("%s documents are parked in the outbox at %s, they are retried "
+                     "when it is next opened", parked, box.path)
+    return delivered
 
-    subcollection_ref = doc_ref.collection('buy_orders')
 
+def push_orders(collection: str, subcollection: str, order_list, client=None,
+                by_order_date: bool = False) -> (int):
+    """
+    Pushes order objects into today's subcollection of the given collection
+    with batched, idempotent writes, returns the number of orders written or queued.
+    by_order_date files every order under the day it filled or was submitted
+    instead, so exporting an order again overwrites it rather than copying it
+    """
     if order_list is not None and len(order_list) > 0:
+        today = datetime.now(timezone.utc).date()
+        documents = []
+        for order, (doc_id, data) in zip(order_list, order_documents(order_list)):
+            day = (serializers.order_date(order) if by_order_date else None) or today
+            documents.append((scoped(f"{collection}/{day}/{subcollection}/{doc_id}"), data))
         try:
-            for order in order_list:
-                data = vars(order)
-                for k,v in data.items():
-                    if isinstance(v, uuid.UUID):
-                        data[k] = str(v)
-                subcollection_ref.add(data)
-        except (PermissionDenied, ServiceUnavailable, DeadlineExceeded, InvalidArgument) as exc:
-            logger.error("Failed to push buy order execution data to the firebase collection: %s", exc)
+            pushed = deliver(documents, client)
+            logger.info("Pushed %s %s documents", pushed, collection)
+            return pushed
+        except write_errors() as exc:
+            logger.error("Failed to push %s data to the firebase collection: %s", collection, exc)
     else:
         logger.info("No new order data today!")
+    return 0
+
 
-def push_sell_executions(order_list):
+def push_order(order_list, client=None) -> (int):
+    """
+    Pushes buy order and sell order data (Order objects from alpaca backend)
+    to the orders firebase collection, under the day each order filled
+    """
+    return push_orders('orders', 'orders', order_list, client, by_order_date=True)
+
+
+def push_buy_executions(order_list, client=None):
+    """
+    Pushes buy order execution data to the database
+    """
+    push_orders('buy_executions', 'buy_orders', order_list, client)
+
+
+def push_sell_executions(order_list, client=None):
     """
     Pushes sell order execution data to the database
     """
-    doc_ref = db.collection('sell_executions').document(str(date.today()))
+    push_orders('sell_executions', 'sell_orders', order_list, client)
 
-    subcollection_ref = doc_ref.collection('sell_orders')
 
-    if order_list is not None and len(order_list) > 0:
-        try:
-            for order in order_list:
-                data = vars(order)
-                for k,v in data.items():
-                    if isinstance(v, uuid.UUID):
-                        data[k] = str(v)
-                subcollection_ref.add(data)
-        except (PermissionDenied, ServiceUnavailable, DeadlineExceeded, InvalidArgument) as exc:
-            logger.error("Failed to push sell order execution data to the firebase collection: %s", exc)
-    else:
-        logger.info("No new order data today!")
+def push_run_metrics(summary: dict, client=None) -> (None):
+    """Pushes the metrics summary of a strategy run to today's run_metrics subcollection"""
+    try:
+        day = datetime.now(timezone.utc).date()
+        deliver([(scoped(f"run_metrics/{day}/runs/{summary['run_id']}"), summary)], client)
+    except write_errors() as exc:
+        logger.error("Failed to push run metrics to the firebase collection: %s", exc)
+
+
+def get_checkpoint(name: str, client=None) -> (datetime|None):
+    """
+    Returns the export checkpoint stored under `name`, None if there is none yet.
+    Raises RuntimeError if it can't be read, an export must not guess its start
+    """
+    client = client or get_db()
+    try:
+        with metrics.measure("firestore.get"):
+            snapshot = client.document(scoped(f"export_checkpoints/{name}")).get()
+    except write_errors() as exc:
+        logger.error("Failed to read the %s export checkpoint: %s", name, exc)
+        raise RuntimeError(f"Error occured while reading the {name} export checkpoint") from exc
+    if not snapshot.exists:
+        return None
+    return datetime.fromisoformat(snapshot.to_dict()["after"])
+
+
+def set_checkpoint(name: str, after: datetime, client=None) -> (None):
+    """
+    Stores the export checkpoint `name`, the next export starts at `after`.
+    Queued as a barrier behind the documents it covers, so it never lands
+    before them nor when one of them was parked
+    """
+    try:
+        deliver([(scoped(f"export_checkpoints/{name}"), {
+            "after": after.isoformat(), "updated": datetime.now(timezone.utc).isoformat(),
+            })], client, barrier=True)
+    except write_errors() as exc:
+        logger.error("Failed to store the %s export checkpoint: %s", name, exc)
 
 
 # DD78F
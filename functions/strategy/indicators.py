@@ -0,0 +1,294 @@
+"""Module computes RSI and MACD locally for many tickers at once with NumPy"""
+import numpy as np
+
+# Same parameters poly_api.get_indicator requests from Polygon
+RSI_WINDOW = 3
+MACD_SHORT_WINDOW = 12
+MACD_LONG_WINDOW = 26
+MACD_SIGNAL_WINDOW = 9
+
+
+def stack_closes(bars: dict[str, list[float]]) -> (tuple[list[str], np.ndarray]):
+    """
+    Stacks close prices per ticker into one (tickers, bars) array.
+    Series are right-aligned so the last column is the latest bar for every ticker,
+    shorter histories are NaN padded on the left
+    """
+    symbols = list(bars)
+    width = max((len(closes) for closes in bars.values()), default=0)
+    closes = np.full((len(symbols), width), np.nan)
+    for row, symbol in enumerate(symbols):
+        series = bars[symbol]
+        if series:
+            closes[row, width - len(series):] = series
+    return symbols, closes
+
+
+def smooth(values: np.ndarray, window: int, alpha: float) -> (np.ndarray):
+    """
+    Recursive smoothing along the bar axis, seeded with the simple average
+    of the first `window` valid values of each row (TA-Lib/Polygon style).
+    NaN values are skipped and the output is NaN until the seed is complete
+    """
+    rows, width = values.shape
+    out = np.full((rows, width), np.nan)
+    state = np.zeros(rows)
+    count = np.zeros(rows)
+    for col in range(width):
+        current = values[:, col]
+        valid = ~np.isnan(current)
+        count += valid
+        seeding = valid & (count <= window)
+        seeded = valid & (count > window)
+        # running mean while seeding, then the usual recursive update
+        state[seeding] += (current[seeding] - state[seeding]) / count[seeding]
+        state[seeded] += alpha * (current[seeded] - state[seeded])
+        out[:, col] = np.where(count >= window, state, np.nan)
+    return out
+
+
+def ema(values: np.ndarray, window: int) -> (np.ndarray):
+    """Exponential moving average along the bar axis"""
+    return smooth(values, window, 2.0 / (window + 1))
+
+
+def rsi(closes: np.ndarray, window: int = RSI_WINDOW) -> (np.ndarray):
+    """Wilder RSI for every ticker and bar of a (tickers, bars) close array"""
+    deltas = np.full(closes.shape, np.nan)
+    deltas[:, 1:] = np.diff(closes, axis=1)
+    gains = np.where(deltas > 0, deltas, np.where(np.isnan(deltas), np.nan, 0.0))
+    losses = np.where(deltas < 0, -deltas, np.where(np.isnan(deltas), np.nan, 0.0))
+    avg_gain = smooth(gains, window, 1.0 / window)
+    avg_loss = smooth(losses, window, 1.0 / window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    # no losses over the window means the RSI is pinned at 100
+    return np.where((avg_loss == 0) & ~np.isnan(avg_gain), 100.0, result)
+
+
+def macd(closes: np.ndarray, short_window: int = MACD_SHORT_WINDOW,
+         long_window: int = MACD_LONG_WINDOW,
+         signal_window: int = MACD_SIGNAL_WINDOW) -> (tuple[np.ndarray,np.ndarray,np.ndarray]):
+    """Returns MACD value, signal and histogram arrays for a (tickers, bars) close array"""
+    value = ema(closes, short_window) - ema(closes, long_window)
+    signal = ema(value, signal_window)
+    return value, signal, value - signal
+
+
+def latest_indicators(bars: dict[str, list[float]]) -> (dict[str, dict[str, float]]):
+    """
+    Computes the latest RSI and MACD readings for every ticker in one pass.
+    Tickers without enough history to seed an indicator are left out
+    """
+    symbols, closes = stack_closes(bars)
+    if closes.size == 0:
+        return {}
+    rsi_now = rsi(closes)[:, -1]
+    value, signal, hist = (series[:, -1] for series in macd(closes))
+    readings = {}
+    for row, symbol in enumerate(symbols):
+        if np.isnan(rsi_now[row]) or np.isnan(hist[row]):
+            continue
+        readings[symbol] = {
+            "rsi": float(rsi_now[row]),
+            "macd": float(value[row]),
+            "signal": float(signal[row]),
+            "hist": float(hist[row]),
+        }
+    return readings
+
+
+# Incremental state of one ticker, the smoothers' sample counts all follow from `count`
+STATE_FIELDS = ("count", "last_close", "gain", "loss", "short", "long", "signal")
+# Closes needed before every reading is seeded
+READY_COUNT = max(RSI_WINDOW + 1, MACD_LONG_WINDOW + MACD_SIGNAL_WINDOW - 1)
+RSI_ALPHA = 1.0 / RSI_WINDOW
+SHORT_ALPHA = 2.0 / (MACD_SHORT_WINDOW + 1)
+LONG_ALPHA = 2.0 / (MACD_LONG_WINDOW + 1)
+SIGNAL_ALPHA = 2.0 / (MACD_SIGNAL_WINDOW + 1)
+
+
+def smooth_step(state: float, value: float, count: int, window: int, alpha: float) -> (float):
+    """one step of smooth() for the count-th value of a series"""
+    if count <= window:
+        return state + (value - state) / count
+    return state + alpha * (value - state)
+
+
+def advance(state: tuple, close: float) -> (tuple):
+    """returns the state (ordered as STATE_FIELDS) after one more close"""
+    count, last_close, gain, loss, short, long, signal = state
+    count += 1
+    if count > 1:
+        delta = close - last_close
+        gain = smooth_step(gain, max(delta, 0.0), count - 1, RSI_WINDOW, RSI_ALPHA)
+        loss = smooth_step(loss, max(-delta, 0.0), count - 1, RSI_WINDOW, RSI_ALPHA)
+    short = smooth_step(short, close, count, MACD_SHORT_WINDOW, SHORT_ALPHA)
+    long = smooth_step(long, close, count, MACD_LONG_WINDOW, LONG_ALPHA)
+    if count >= MACD_LONG_WINDOW:
+        signal = smooth_step(signal, short - long, count - MACD_LONG_WINDOW + 1,
+                             MACD_SIGNAL_WINDOW, SIGNAL_ALPHA)
+    return count, close, gain, loss, short, long, signal
+
+
+def read(state: tuple) -> (dict[str, float]|None):
+    """RSI and MACD readings of a state, None until every indicator is seeded"""
+    count, _, gain, loss, short, long, signal = state
+    if count < READY_COUNT:
+        return None
+    value = short - long
+    rsi_value = 100.0 if loss == 0 else 100.0 - 100.0 / (1.0 + gain / loss)
+    return {"rsi": rsi_value, "macd": value, "signal": signal, "hist": value - signal}
+
+
+class IndicatorState():
+    """
+    Running RSI and MACD of one ticker, updated one close at a time in constant
+    time and memory with the same math as the vectorized functions above
+    """
+    __slots__ = STATE_FIELDS
+
+    def __init__(self, count: int = 0, last_close: float = 0.0, gain: float = 0.0,
+                 loss: float = 0.0, short: float = 0.0, long: float = 0.0,
+                 signal: float = 0.0):
+        self.count = int(count)
+        self.last_close = last_close
+        self.gain = gain
+        self.loss = loss
+        self.short = short
+        self.long = long
+        self.signal = signal
+
+    @classmethod
+    def from_history(cls, closes: list[float]) -> ("IndicatorState"):
+        """seeds a state from historical closes, oldest first"""
+        state = cls()
+        for close in closes:
+            state.update(float(close))
+        return state
+
+    def as_tuple(self) -> (tuple):
+        """the state ordered as STATE_FIELDS, IndicatorState(*values) restores it"""
+        return (self.count, self.last_close, self.gain, self.loss,
+                self.short, self.long, self.signal)
+
+    def update(self, close: float) -> ("IndicatorState"):
+        """adds the close of a finished bar"""
+        (self.count, self.last_close, self.gain, self.loss,
+         self.short, self.long, self.signal) = advance(self.as_tuple(), close)
+        return self
+
+    def reading(self) -> (dict[str, float]|None):
+        """latest RSI and MACD readings, None until every indicator is seeded"""
+        return read(self.as_tuple())
+
+    def preview(self, close: float) -> (dict[str, float]|None):
+        """readings as if a bar closed at `close` now, without changing the state"""
+        return read(advance(self.as_tuple(), close))
+
+    def __getstate__(self):
+        return self.as_tuple()
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+def smooth_rows(state: np.ndarray, value: np.ndarray, count: np.ndarray,
+                window: int, alpha: float) -> (np.ndarray):
+    """smooth_step() for many tickers at once"""
+    seeding = state + (value - state) / np.maximum(count, 1)
+    return np.where(count <= window, seeding, state + alpha * (value - state))
+
+
+class IndicatorBook():
+    """
+    Incremental indicator states of many tickers packed into one
+    (tickers, STATE_FIELDS) float64 table, 56 bytes per ticker.
+    Updates for a batch of tickers are vectorized
+    """
+    def __init__(self, symbols: list[str]|None = None, table: np.ndarray|None = None):
+        self.index = {symbol: row for row, symbol in enumerate(symbols or [])}
+        self.table = (np.zeros((len(self.index), len(STATE_FIELDS)))
+                      if table is None else np.array(table, dtype=np.float64))
+
+    @classmethod
+    def from_history(cls, bars: dict[str, list[float]]) -> ("IndicatorBook"):
+        """seeds a book from historical closes per ticker, oldest first"""
+        book = cls(list(bars))
+        for symbol, closes in bars.items():
+            book.table[book.index[symbol]] = IndicatorState.from_history(closes).as_tuple()
+        return book
+
+    @property
+    def symbols(self) -> (list[str]):
+        return list(self.index)
+
+    @property
+    def nbytes(self) -> (int):
+        return self.table.nbytes
+
+    def rows(self, symbols: list[str]) -> (np.ndarray):
+        """table rows of the given tickers, unknown tickers get a fresh row"""
+        new = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.index]
+        if new:
+            self.index.update((symbol, len(self.index) + i) for i, symbol in enumerate(new))
+            self.table = np.vstack([self.table, np.zeros((len(new), len(STATE_FIELDS)))])
+        return np.array([self.index[symbol] for symbol in symbols], dtype=np.intp)
+
+    def state(self, symbol: str) -> (IndicatorState):
+        """copy of one ticker's state"""
+        return IndicatorState(*self.table[self.index[symbol]].tolist())
+
+    def update(self, closes: dict[str, float]) -> (None):
+        """adds the close of a finished bar for every given ticker"""
+        rows = self.rows(list(closes))
+        self.table[rows] = self.advance(rows, np.fromiter(closes.values(), float, len(rows)))
+
+    def advance(self, rows: np.ndarray, closes: np.ndarray) -> (np.ndarray):
+        """advance() for the given rows, returns the new rows without storing them"""
+        count, last_close, gain, loss, short, long, signal = self.table[rows].T
+        count = count + 1
+        delta = closes - last_close
+        has_delta = count > 1
+        gain = np.where(has_delta, smooth_rows(gain, np.maximum(delta, 0.0), count - 1,
+                                               RSI_WINDOW, RSI_ALPHA), gain)
+        loss = np.where(has_delta, smooth_rows(loss, np.maximum(-delta, 0.0), count - 1,
+                                               RSI_WINDOW, RSI_ALPHA), loss)
+        short = smooth_rows(short, closes, count, MACD_SHORT_WINDOW, SHORT_ALPHA)
+        long = smooth_rows(long, closes, count, MACD_LONG_WINDOW, LONG_ALPHA)
+        signal = np.where(count >= MACD_LONG_WINDOW,
+                          smooth_rows(signal, short - long, count - MACD_LONG_WINDOW + 1,
+                                      MACD_SIGNAL_WINDOW, SIGNAL_ALPHA), signal)
+        return np.column_stack([count, closes, gain, loss, short, long, signal])
+
+    def readings(self, table: np.ndarray|None = None, symbols: list[str]|None = None
+                 ) -> (dict[str, dict[str, float]]):
+        """latest readings of every seeded ticker, same shape as latest_indicators()"""
+        if table is None:
+            table, symbols = self.table, self.symbols
+        count, _, gain, loss, short, long, signal = table.T
+        value = short - long
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi_now = np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+        return {
+            symbol: {"rsi": float(rsi_now[row]), "macd": float(value[row]),
+                     "signal": float(signal[row]), "hist": float(value[row] - signal[row])}
+            for row, symbol in enumerate(symbols or []) if count[row] >= READY_COUNT
+        }
+
+    def preview(self, closes: dict[str, float]) -> (dict[str, dict[str, float]]):
+        """readings as if bars closed at the given prices now, without changing the book"""
+        symbols = [symbol for symbol in closes if symbol in self.index]
+        rows = np.array([self.index[symbol] for symbol in symbols], dtype=np.intp)
+        prices = np.array([closes[symbol] for symbol in symbols], dtype=np.float64)
+        return self.readings(self.advance(rows, prices), symbols)
+
+    def save(self, path: str) -> (None):
+        """writes the book to an .npz file"""
+        np.savez(path, symbols=np.array(self.symbols, dtype=str), table=self.table)
+
+    @classmethod
+    def load(cls, path: str) -> ("IndicatorBook"):
+        """reads a book written by save()"""
+        with np.load(path) as saved:
+            return cls(saved["symbols"].tolist(), saved["table"])
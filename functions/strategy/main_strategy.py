@@ -1,24 +1,47 @@
 """Contains code to facilitate execution of the algo-trading strategy"""
 import os
+import hashlib
 import logging
-from datetime import datetime
+import math
+import threading
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+import numpy as np
 import requests
-from dotenv import load_dotenv
-from ratelimit import limits, sleep_and_retry
+from dotenv import dotenv_values, find_dotenv
 from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import MarketOrderRequest, GetOrdersRequest
-from alpaca.trading.models import Order, Position, TradeAccount
+from alpaca.trading.models import Order, Position, TradeAccount, TradeUpdate
 from alpaca.trading.enums import OrderSide, TimeInForce, QueryOrderStatus
-from .api_integrations import poly_api, fmp_api
-from . import firestore_db
+from .api_integrations import poly_api, fmp_api, alpaca_api, rate_limiter
+from . import archive, firestore_db, indicators, rules, market_cache, bulk_orders, candidates, metrics
+from .account import AccountSnapshot, ACCOUNT_MAX_AGE
+from .order_book import OrderBook, TradeUpdatesListener, CLOSED_STATUSES, FILL_EVENTS
+from .rules import StrategyParams, DEFAULT_PARAMS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Variables the process was started with win over the .env file, like load_dotenv does
+PROCESS_ENV = frozenset(os.environ)
+
+def load_env_file() -> (None):
+    """
+    (Re)reads the .env file into the environment, so a warm instance picks up
+    rotated secrets. Variables the process was started with are never replaced
+    """
+    for name, value in dotenv_values(find_dotenv()).items():
+        if name not in PROCESS_ENV and value is not None:
+            os.environ[name] = value
+
 def get_env() -> (dict):
     """access environment variables for API Secrets"""
-    load_dotenv()
+    load_env_file()
     env_variable_names = ['ALPACA_KEY', 'ALPACA_SECRET', 'MASSIVE_API_KEY', 'FMP_KEY']
     env_variables = {}
     for name in env_variable_names:
@@ -26,119 +49,309 @@ def get_env() -> (dict):
     return env_variables
 
 AlpacaOrderData = tuple[TradeAccount, list[Order]]
+# Seconds a fetched quote is reused before hitting the data API again
+QUOTE_TTL = 10.0
+# Seconds cached Polygon readings (hourly indicators) and FMP feeds stay valid
+INDICATOR_TTL = 3600.0
+FEED_TTL = 86400.0
+# Threads evaluating signals concurrently, the API rate limiters cap the real throughput
+SIGNAL_WORKERS = 8
+# Seconds the sell run waits for signal evaluation before skipping the rest
+SELL_EVAL_TIMEOUT = 120.0
+# Seconds a buy run waits for its orders' fills to arrive on the trade updates stream
+FILL_WAIT = 5.0
+# Firestore checkpoint name of the end-of-day order export
+ORDER_EXPORT = "orders"
+# FMP feeds merged into the watchlist, the first feed listing a symbol wins
+WATCHLIST_FEEDS = ("active", "gainer", "loser")
+# Watchlist filters: traded value of the day and quoted spread as a fraction of mid
+MIN_DOLLAR_VOLUME = 1_000_000.0
+MAX_SPREAD = 0.01
+
+def hour_bucket() -> (str):
+    """current UTC hour, the timestamp part of hourly cache keys"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H")
+
+@dataclass
+class MarketSnapshot():
+    """Quotes and indicator readings fetched once and shared by several portfolios"""
+    fetched_at: float = field(default_factory=time.time)
+    quotes: dict[str, dict] = field(default_factory=dict)
+    readings: dict[str, dict[str, float]] = field(default_factory=dict)
 
 class StrategyHandler():
     """
     Contains methods for order creation and execution, plus strategy logic
     """
-    def __init__(self, client: TradingClient, secret: dict):
+    def __init__(self, client: TradingClient, secret: dict,
+                 account_max_age: float = ACCOUNT_MAX_AGE,
+                 params: StrategyParams = DEFAULT_PARAMS):
         self.trading_client = client
         self.secret = secret
+        self.params = params
+        self.account = AccountSnapshot(self.get_account, account_max_age)
+        self.order_book = OrderBook()
+        self.order_book.listeners.append(self.on_trade_update)
+        self.indicator_cache: dict[str, dict[str, float]] = {}
+        self.quote_cache: dict[str, tuple[float, dict]] = {}
+        self.session = alpaca_api.create_session(secret)
+        self.cache = market_cache.get_cache()
+        self.snapshot: MarketSnapshot|None = None
 
     def check_fund(self, account_details) -> (bool):
         """checks portfolio value and returns true if (Cash > 25000 for PDT"""
-        portfolio_value = account_details.cash
-        return float(portfolio_value) >= 25000
+        return bool(rules.has_funds(float(account_details.cash), self.params))
 
-    def check_spend(self, allocation_limit, account_details, spent_already) -> (bool):
+    def check_spend(self, account_details, spent_already) -> (bool):
         """
-        Returns true if you have available daily stock allocation
+        Returns true if you have available daily stock allocation. The allocation
+        is a share of the run's opening cash, the run's own spend is only
+        counted in spent_already
         """
-        portfolio_value = account_details.cash
-        max_spend = float(portfolio_value) * allocation_limit
-        return spent_already < max_spend
+        return bool(rules.within_allocation(float(account_details.opening_cash), spent_already,
+                                            self.params))
 
-    def check_if_buy(self, allocation_limit, spent_already, account_details):
+    def check_if_buy(self, spent_already, account_details) -> (bool):
         """ 
-        Returns true if you can buy stocks for the day
+        Returns true if you can buy stocks for the day: the PDT minimum is
+        kept after the run's spend and the daily allocation isn't used up
         """
-        check_fund = self.check_fund(account_details)
-        check_spend = self.check_spend(allocation_limit,account_details,spent_already)
-
-        return check_fund and check_spend
+        return bool(rules.can_buy(float(account_details.opening_cash), spent_already, self.params))
     
-    @sleep_and_retry
-    @limits(calls=5, period=61)
+    def start_run(self) -> (None):
+        """
+        Drops state that must not leak between strategy runs of a reused handler,
+        the HTTP session and short-TTL quote cache are kept
+        """
+        self.indicator_cache.clear()
+        self.account.reset()
+
+    def share_market_data(self, snapshot: MarketSnapshot) -> (None):
+        """
+        Uses market data fetched by another process: its readings replace the
+        bar fetch and its quotes fill the quote cache. The shared quotes don't
+        expire, every portfolio of a run sizes its orders from the same prices
+        however late its worker gets to it
+        """
+        self.snapshot = snapshot
+        for symbol, quote in snapshot.quotes.items():
+            self.quote_cache[symbol] = (math.inf, quote)
+
+    def load_indicators(self, tickers: list[str]) -> (None):
+        """
+        Computes RSI and MACD locally for all tickers from one bulk bar fetch.
+        Tickers that can't be computed fall back to the Polygon API
+        """
+        if self.snapshot is not None:
+            shared = {ticker.upper(): self.snapshot.readings[ticker.upper()] for ticker in tickers
+                      if ticker.upper() in self.snapshot.readings}
+            self.indicator_cache.update(shared)
+            tickers = [ticker for ticker in tickers if ticker.upper() not in shared]
+        if not tickers:
+            return
+        try:
+            closes = self.bar_history(tickers)
+        except RuntimeError as exc:
+            logger.error("Bulk bar fetch failed, using Polygon indicators: %s", exc)
+            return
+        self.indicator_cache.update(indicators.latest_indicators(closes))
+
+    def bar_history(self, tickers: list[str]) -> (dict[str, list[float]]):
+        """Returns hourly closes per ticker, the last one may be of the running hour"""
+        return {ticker: series[1].tolist() for ticker, series in self.bar_series(tickers).items()}
+
+    def bar_series(self, tickers: list[str]) -> (dict[str, np.ndarray]):
+        """
+        Returns hourly bars per ticker as a (2, bars) array of bar start times
+        (epoch seconds) and closes. Today's history is kept in the disk cache,
+        so later runs only fetch the bars since the last cached one
+        """
+        tickers = [ticker.upper() for ticker in tickers]
+        today = str(date.today())
+        keys = {ticker: ("alpaca", ticker, "1Hour", alpaca_api.BAR_LOOKBACK_DAYS, today)
+                for ticker in tickers}
+        history = {}
+        for ticker, key in keys.items():
+            cached = self.cache.get(key, FEED_TTL)
+            if isinstance(cached, np.ndarray) and cached.shape[1]:
+                history[ticker] = cached
+        missing = [ticker for ticker in tickers if ticker not in history]
+        fetched = alpaca_api.get_bars(missing, self.session) if missing else {}
+        if history:
+            # re-fetch the last cached bar too, it may have been incomplete
+            since = min(series[0, -1] for series in history.values())
+            fetched.update(alpaca_api.get_bars(
+                list(history), self.session, start=datetime.fromtimestamp(since, timezone.utc)
+                ))
+        bar_series = {}
+        for ticker in tickers:
+            series = history.get(ticker, np.empty((2, 0)))
+            bars = fetched.get(ticker, [])
+            if bars:
+                new = np.array([[np.datetime64(bar["t"].rstrip("Z"), "s").astype(np.int64)
+                                 for bar in bars], [bar["c"] for bar in bars]], dtype=float)
+                series = np.concatenate([series[:, series[0] < new[0, 0]], new], axis=1)
+                self.cache.put(keys[ticker], series)
+            if series.shape[1]:
+                bar_series[ticker] = series
+        return bar_series
+
     def get_rsi(self, ticker:str) -> float|None:
+        """Returns the hourly RSI of a ticker"""
+        cached = self.indicator_cache.get(ticker.upper())
+        if cached:
+            return cached["rsi"]
+        key = ("polygon", ticker.upper(), "hour", "rsi3", hour_bucket())
+        stored = self.cache.get(key, INDICATOR_TTL)
+        if stored is not None:
+            return float(stored[0])
+        rsi = self.fetch_rsi(ticker)
+        if rsi is not None:
+            self.cache.put(key, np.array([rsi]))
+        return rsi
+
+    def get_macd(self, ticker: str) -> tuple|None:
+        """Returns the hourly MACD value, signal and histogram of a ticker, None if unknown"""
+        cached = self.indicator_cache.get(ticker.upper())
+        if cached:
+            return cached["macd"], cached["signal"], cached["hist"]
+        key = ("polygon", ticker.upper(), "hour", "macd12-26-9", hour_bucket())
+        stored = self.cache.get(key, INDICATOR_TTL)
+        if stored is not None:
+            return tuple(float(value) for value in stored)
+        macd = self.fetch_macd(ticker)
+        if macd is not None:
+            self.cache.put(key, np.array(macd))
+        return macd
+
+    def fetch_rsi(self, ticker:str) -> float|None:
+        """Fetches the hourly RSI of a ticker from Polygon"""
         rsi = poly_api.get_indicator(ticker, "rsi")
-        if type(rsi) == int:
+        if isinstance(rsi, (int, float)):
             return float(rsi)
+        return None
 
-    @sleep_and_retry
-    @limits(calls=5, period=61)
-    def get_macd(self, ticker: str) -> tuple:
+    def fetch_macd(self, ticker: str) -> tuple|None:
+        """Fetches the hourly MACD value, signal and histogram of a ticker from Polygon"""
         data = poly_api.get_indicator(ticker, "macd")
-        if type(data) == tuple:
-            value = data[0]
-            signal = data[1] 
-            hist = data [2]
-        return float(value), float(signal), float(hist)
+        if isinstance(data, tuple) and len(data) == 3 and None not in data:
+            value, signal, hist = data
+            return float(value), float(signal), float(hist)
+        return None
+
+    def get_quotes(self, tickers: list[str]) -> (dict[str, dict]):
+        """
+        Returns the latest quotes of all tickers keyed by symbol, only tickers
+        without a fresh cached quote are fetched (in one batched request)
+        """
+        tickers = [ticker.upper() for ticker in tickers]
+        now = time.monotonic()
+        stale = [ticker for ticker in tickers
+                 if now - self.quote_cache.get(ticker, (-QUOTE_TTL, None))[0] >= QUOTE_TTL]
+        if stale:
+            try:
+                quotes = alpaca_api.get_latest_quotes(stale, self.session)
+            except RuntimeError as exc:
+                logger.error("Error occured while fetching Alpaca stock quotes: %s", exc)
+                quotes = {}
+            for symbol, quote in quotes.items():
+                self.quote_cache[symbol] = (now, quote)
+        return {ticker: self.quote_cache[ticker][1] for ticker in tickers
+                if ticker in self.quote_cache}
 
     def get_quote(self, ticker:str):
         """
         Gets latest stock quote from alpacapy
         """
         ticker = ticker.upper()
-        url = f"https://data.alpaca.markets/v2/stocks/quotes/latest?symbols={ticker}&feed=iex"
-        headers = {"accept": "application/json",
-                   "APCA-API-KEY-ID": self.secret['ALPACA_KEY'],
-                   "APCA-API-SECRET-KEY":self.secret['ALPACA_SECRET']
-                   }
-        try:
-            response = requests.get(url, headers=headers, timeout=4)
-            if response.status_code == 200:
-                result = response.json()
-        except requests.HTTPError:
-            logger.error(
-                "HTTP error encountered while fetching Alpaca stock quote: %s", 
-                response.raise_for_status()
-                )
-        return result
+        return {"quotes": self.get_quotes([ticker])}
 
-    @sleep_and_retry
-    @limits(calls=200, period=61)
-    def buy_signal(self, ticker: str, allocation: float,
-                    spent_already: float) -> (tuple[str,float]):
-        """
-        Returns buy, sell, do nothing, and no funds remaining signals for a watchlist 
-        ticker and the amount of cash remaining for the day
-        """
-        #getting new account details every call to account for changes
-        account_details = self.trading_client.get_account()
-        if type(account_details.cash) == int: # pyright: ignore
-            cash_available = float(account_details.cash) # pyright: ignore
-        if self.check_if_buy(allocation, spent_already, account_details):
-            value, signal, hist = self.get_macd(ticker) 
-            if value > signal and hist > 0.0:
-                rsi = self.get_rsi(ticker)
-                if rsi and rsi < 35.00:
-                    return ("buy", cash_available)
-            return ("do nothing", cash_available)
-        return ("no funds", cash_available) #no funds remaining
+    def ask_price(self, ticker: str) -> (float|None):
+        """
+        Latest ask price of a ticker, None if Alpaca has no usable quote for it
+        (e.g. a halted or newly listed symbol)
+        """
+        quote = self.get_quotes([ticker]).get(ticker.upper()) or {}
+        try:
+            price = float(quote.get("ap") or 0)
+        except (TypeError, ValueError):
+            price = 0.0
+        return price if price > 0 else None
+
+    def on_trade_update(self, update: TradeUpdate) -> (None):
+        """keeps the account ledger in step with the fills of buy orders"""
+        order = update.order
+        if order.side != OrderSide.BUY:
+            return
+        if update.event in FILL_EVENTS:
+            self.settle_order(str(order.id))
+        elif order.status in CLOSED_STATUSES:
+            self.account.release(str(order.id))
+
+    def settle_order(self, order_id: str) -> (None):
+        """books an order's fills and the estimated cost of its open rest in the account"""
+        _, spent = self.order_book.filled(order_id)
+        self.account.settle(order_id, spent, self.order_book.remaining(order_id))
+
+    @rate_limiter.throttled("alpaca_trading")
+    @metrics.timed("alpaca_trading.get_account")
+    def get_account(self) -> (TradeAccount):
+        """Fetches the latest account details from alpaca"""
+        return self.trading_client.get_account() # pyright: ignore
+
+    def indicator_signal(self, ticker: str) -> (str):
+        """
+        Returns buy or do nothing for a watchlist ticker based on its MACD and RSI
+        """
+        macd = self.get_macd(ticker)
+        if macd is None:
+            return "do nothing"
+        value, signal, hist = macd
+        if rules.macd_bullish(value, signal, hist):
+            rsi = self.get_rsi(ticker)
+            if rsi and rules.rsi_oversold(rsi, self.params):
+                return "buy"
+        return "do nothing"
+
+    def evaluate_buy_signals(self, tickers: list[str]) -> (dict[str, str]):
+        """
+        Evaluates the indicator signal of every ticker concurrently,
+        returns the signals keyed by ticker. Tickers whose evaluation fails
+        are logged and left out
+        """
+        with ThreadPoolExecutor(max_workers=SIGNAL_WORKERS) as pool:
+            futures = {ticker: pool.submit(self.indicator_signal, ticker) for ticker in tickers}
+        signals = {}
+        for ticker, future in futures.items():
+            try:
+                signals[ticker] = future.result()
+            except Exception as exc: # one ticker's upstream error must not stop the run
+                logger.error("Buy signal of %s failed: %s", ticker, exc)
+        return signals
 
     def quantity_calc(self, signal:str, ticker:str, portval: float) -> (float|None):
         """
         Returns stock quantity to buy or sell
         """
         if signal == "buy":
-            quote = self.get_quote(ticker)
-            ticker = ticker.upper()
-            unitprice = quote["quotes"][ticker]["ap"]
-            if float(unitprice) < 500.00 and float(unitprice) > 0:
-                buying_price = portval*0.05
-                quantity = buying_price/unitprice
-                truncated_qty = int(quantity) #preventing fractional orders
-                return truncated_qty
-            if 500.00 < float(unitprice) and float(unitprice) < 10000.00:
-                return 1.00 #fail-safe making sure to buy at least 1
+            unitprice = self.ask_price(ticker)
+            if unitprice is None:
+                logger.warning("No ask price for %s, skipping it", ticker)
+                return None
+            #whole shares only, at least 1 above the price cut
+            quantity = rules.buy_quantity(unitprice, portval, self.params)
+            if quantity > 0:
+                return quantity
         elif signal == "sell":
-            position = self.trading_client.get_open_position(ticker)
+            with metrics.measure("alpaca_trading.get_open_position"):
+                position = self.trading_client.get_open_position(ticker)
             if type(position) == Position and type(position.qty_available) == str:
                 return float(position.qty_available)
-            print("Position not available")
+            logger.warning("Position in %s not available", ticker)
         return None
 
-    def create_order_data(self, symb, qt, order_type) -> (MarketOrderRequest):
+    @staticmethod
+    def create_order_data(symb, qt, order_type) -> (MarketOrderRequest):
         """
         Creates final format of the market order
 
@@ -161,9 +374,13 @@ class StrategyHandler():
 
         return market_order_data
 
-    def execute_order(self, market_order_data: MarketOrderRequest) -> (Order|None):
+    @rate_limiter.throttled("alpaca_trading")
+    @metrics.timed("alpaca_trading.submit_order")
+    def execute_order(self, market_order_data: MarketOrderRequest,
+                      price: float|None = None) -> (Order|None):
         """
-        Executes a market order 
+        Executes a market order and tracks it in the order book,
+        `price` is the unit price the order was sized at
 
         Returns: Order
         """
@@ -171,68 +388,158 @@ class StrategyHandler():
             market_order = self.trading_client.submit_order(order_data = market_order_data)
             logger.info("Market order placed!")
             if type(market_order) == Order:
+                self.order_book.track(market_order, price)
                 return market_order 
         except requests.HTTPError:
             logger.error("Error occured while submitting market order: %s", requests.HTTPError)
             raise
 
+    def execute_orders(self, orders: list[MarketOrderRequest],
+                       prices: dict[str, float]|None = None) -> (bulk_orders.BatchResult):
+        """
+        Submits market orders concurrently (the shared trading rate limiter paces
+        the submissions) and reconciles their statuses in one get_orders sweep.
+        `prices` maps symbols to the unit price their orders were sized at
+        """
+        prices = prices or {}
+        result = bulk_orders.submit_batch(
+            lambda order_data: self.execute_order(order_data, prices.get(order_data.symbol)),
+            orders, SIGNAL_WORKERS,
+            )
+        bulk_orders.reconcile(self.trading_client, result)
+        for order in result.orders:
+            self.order_book.refresh(order)
+        logger.info("Order batch: %s", result.summary())
+        return result
+
+    def take_profit_signal(self, position: Position) -> (bool):
+        """True if the position reached the take-profit level, needs no market data"""
+        if position.unrealized_plpc is None:
+            return False
+        return bool(rules.take_profit_hit(float(position.unrealized_plpc), self.params))
+
     def sell_signal(self, position: Position) -> (str|None):
         """
-        Checks a position and returns a sell signal if the TA or the ROI matches
+        Checks a position and returns a sell signal if the ROI or the TA matches,
+        the ROI is checked first since it needs no indicator fetch
         """
+        if self.take_profit_signal(position):
+            return "sell"
         macd = self.get_macd(position.symbol)
+        if macd is None:
+            return None
         value = macd[0]
         signal = macd[1]
         hist = macd[2]
-        if value < signal and hist < 0.0:
+        if rules.macd_bearish(value, signal, hist):
             rsi = self.get_rsi(position.symbol)
-            if rsi and rsi > 65.00:
+            if rsi and rules.rsi_overbought(rsi, self.params):
                 return "sell"
-        if type(position.unrealized_plpc)==str:
-            p_and_l = float(position.unrealized_plpc)
-        if p_and_l >= 0.05:
-            return "sell"
 
         return None
 
+    def evaluate_sell_signals(self, positions: list[Position],
+                              timeout: float = SELL_EVAL_TIMEOUT) -> (dict[str, str|None]):
+        """
+        Evaluates the sell signal of every position concurrently and returns the
+        signals keyed by symbol. A position whose evaluation fails gets no signal,
+        positions not evaluated within timeout are left out
+        """
+        expired = threading.Event()
+
+        def evaluate(position: Position) -> (str|None):
+            if expired.is_set():
+                return None
+            try:
+                return self.sell_signal(position)
+            except Exception as exc: # one ticker's upstream error must not stop the run
+                logger.error("Sell signal of %s failed: %s", position.symbol, exc)
+                return None
+
+        pool = ThreadPoolExecutor(max_workers=SIGNAL_WORKERS)
+        futures = {pool.submit(evaluate, position): position.symbol for position in positions}
+        done, pending = wait(futures, timeout=timeout)
+        expired.set()
+        # queued evaluations are dropped, running ones end after their current fetch
+        pool.shutdown(wait=True, cancel_futures=True)
+        if pending:
+            logger.warning("Sell signals for %s positions timed out", len(pending))
+        return {futures[future]: future.result() for future in done}
+
 class WatchlistHandler():
     """
     Contains methods that decide which stocks the strategy is focusing on for the day and 
-    methods to check existing wachlist positions
+    methods to check existing wachlist positions. Pass session to share an
+    Alpaca data session, e.g. the StrategyHandler's
     """
-    def __init__(self, secret, max_stock_price=5000.0, max_watchlist_len=30):
+    def __init__(self, secret, max_stock_price=5000.0, max_watchlist_len=30,
+                 feeds: tuple[str, ...] = WATCHLIST_FEEDS, score: str = "dollar_volume",
+                 min_dollar_volume: float = MIN_DOLLAR_VOLUME, max_spread: float = MAX_SPREAD,
+                 session: requests.Session|None = None):
         self.secret = secret
+        self.session = session if session is not None else alpaca_api.create_session(secret)
         self.max_stock_price = max_stock_price
         self.max_watchlist_len = max_watchlist_len
+        self.feeds = feeds
+        self.score = score
+        self.min_dollar_volume = min_dollar_volume
+        self.max_spread = max_spread
+        self.cache = market_cache.get_cache()
+
+    def get_feed(self, feed: str) -> (list):
+        """returns one FMP market movers feed, cached for the day"""
+        key = ("fmp", f"{feed}s", "day", 0, str(date.today()))
+        stock_list = self.cache.get(key, FEED_TTL)
+        if not stock_list:
+            stock_list = fmp_api.get_jsonparsed_data(feed, self.secret['FMP_KEY'])
+            if stock_list:
+                self.cache.put(key, stock_list)
+        return stock_list if stock_list else []
 
     def create_watchlist(self) -> (list ):
-        """returns the watchlist of 30 stocks to focus on"""
-        stock_list = fmp_api.get_jsonparsed_data("active", self.secret['FMP_KEY'])
-        return stock_list if stock_list else []
+        """returns the records of every configured feed, a symbol may appear more than once"""
+        return [stock for feed in self.feeds for stock in self.get_feed(feed)]
 
     def approve_watchlist(self, stock_list: list[dict]) -> (list):
-        """Approves watchlist"""
-        watchlist = []
-        for stock in stock_list:
-            if stock["price"] <= self.max_stock_price:
-                watchlist.append(stock)
-
-        if len(watchlist) > self.max_watchlist_len:
-            watchlist = watchlist[:self.max_watchlist_len]
-
-        return watchlist
+        """
+        Approves watchlist: drops repeated symbols, filters by price, liquidity
+        and spread and keeps the max_watchlist_len best by score, best first
+        """
+        table = candidates.CandidateTable.from_feeds([stock_list])
+        if len(table):
+            try:
+                table.add_snapshots(alpaca_api.get_snapshots(
+                    list(table.symbols), self.session))
+            except RuntimeError as exc:
+                logger.error("Ranking the watchlist without liquidity and spread: %s", exc)
+        ranked = candidates.rank(table, self.max_watchlist_len, self.score, self.max_stock_price,
+                                self.min_dollar_volume, self.max_spread)
+        return ranked.records()
+
+    def candidates(self) -> (list):
+        """
+        Returns the ranked watchlist, computed once per trading day and then
+        read from the cache by every later run
+        """
+        key = ("watchlist", self.score, "day", self.max_watchlist_len, str(date.today()))
+        ranked = self.cache.get(key, FEED_TTL)
+        if ranked is None:
+            ranked = self.approve_watchlist(self.create_watchlist())
+            if ranked:
+                self.cache.put(key, ranked)
+        return ranked
 
 class StrategyExecution():
     """
     Contains methods to automate trading strategy execution,
     controls the order/trade websocket connection and holds the program state. 
-    Args - what % of port to allot per day
+    Args - the strategy parameters, params.allocation_limit is the % of port to allot per day
     """
-    def __init__(self, allocation_limit: float, client: TradingClient, secret: dict):
-        self.allocation_limit = allocation_limit
+    def __init__(self, client: TradingClient, secret: dict,
+                 params: StrategyParams = DEFAULT_PARAMS):
         self.trading_client = client
-        self.strategy_handler = StrategyHandler(client, secret)
-        self.watchlist_handler = WatchlistHandler(secret)
+        self.strategy_handler = StrategyHandler(client, secret, params=params)
+        self.watchlist_handler = WatchlistHandler(secret, session=self.strategy_handler.session)
 
     def buy_strategy(self) -> (list|None):
         """
@@ -241,89 +548,187 @@ class StrategyExecution():
         returns total amount spent and orders placed that day
         """
         logger.info("Buy strat has begun!")
-        spent_already = 0.0
-        stocklist = self.watchlist_handler.create_watchlist()
-        watchlist = self.watchlist_handler.approve_watchlist(stocklist) 
-        orderlist = []
+        self.strategy_handler.start_run()
+        watchlist = self.watchlist_handler.candidates()
+        symbols = [stock["symbol"] for stock in watchlist]
+        self.strategy_handler.load_indicators(symbols)
+        self.strategy_handler.get_quotes(symbols)
+        book = self.strategy_handler.order_book
+        # signals are computed concurrently, orders are sized one at a time so every
+        # purchase sees the estimated spend of the ones before it, then sent as a batch
+        signals = self.strategy_handler.evaluate_buy_signals(symbols)
+        planned, prices, spent_already = [], {}, 0.0
         for stock in watchlist:
             ticker = stock["symbol"]
-            signal, port_val = self.strategy_handler.buy_signal(
-                ticker, self.allocation_limit, spent_already
-                )
-            if signal == "buy":
-                qty = self.strategy_handler.quantity_calc(signal, ticker, port_val)
-                if qty is not None:
-                    logger.info("Buying %s stocks of %s", qty, ticker)
-                    order_data = self.strategy_handler.create_order_data(
-                        stock["symbol"], qty, "buy"
-                        )
-                    order = self.strategy_handler.execute_order(order_data)
-                    orderlist.append(order)
-                    if order and order.filled_avg_price is not None:
-                        spent_already += float(order.filled_avg_price)
-                    else:
-                        quote = self.strategy_handler.get_quote(ticker)
-                        unitprice = quote["quotes"][ticker]["ap"]
-                        spent_already += float(unitprice)*qty
-            if signal == "no funds":
+            if signals.get(ticker) != "buy":
+                continue
+            if not self.can_buy(spent_already):
                 logger.info("Finished buying for the day")
                 break
-        if spent_already > 0:
-            logger.info("Amount spent: %s", spent_already)
-            return orderlist
-        if spent_already == 0:
+            sized = self.plan_buy(ticker)
+            if sized is None:
+                continue
+            order_data, unitprice = sized
+            planned.append(order_data)
+            prices[order_data.symbol] = unitprice
+            spent_already += unitprice * float(order_data.qty) # pyright: ignore
+        if not planned:
             logger.info("No stocks to buy today!")
             return None
-        raise RuntimeError("Unknown Error calculating total amount spent on daily purchases")
+        orderlist = self.submit_buys(planned, prices).orders
+        order_ids = [str(order.id) for order in orderlist]
+        if book.connected_at is not None and not book.wait(order_ids, FILL_WAIT):
+            logger.info("Some orders are still open, spend includes their estimated cost")
+        logger.info("Amount spent: %s", book.committed(order_ids))
+        return book.latest(orderlist) or None
+
+    def can_buy(self, spent_already: float) -> (bool):
+        """True if the account has funds and daily allocation left"""
+        return self.strategy_handler.check_if_buy(
+            spent_already, self.strategy_handler.account.current()
+            )
+
+    def plan_buy(self, ticker: str) -> (tuple[MarketOrderRequest, float]|None):
+        """
+        Sizes a buy order from the cached quote and reserves its estimated cost
+        under its client order id. Returns the order request and the unit price
+        """
+        port_val = float(self.strategy_handler.account.current().cash)
+        qty = self.strategy_handler.quantity_calc("buy", ticker, port_val)
+        # served from the quote cache quantity_calc just filled
+        unitprice = self.strategy_handler.ask_price(ticker)
+        if qty is None or unitprice is None:
+            return None
+        logger.info("Buying %s stocks of %s", qty, ticker)
+        order_data = self.strategy_handler.create_order_data(ticker, qty, "buy").model_copy(
+            update={"client_order_id": str(uuid.uuid4())})
+        self.strategy_handler.account.reserve(order_data.client_order_id, unitprice * qty) # pyright: ignore
+        return order_data, unitprice
+
+    def submit_buys(self, planned: list[MarketOrderRequest],
+                    prices: dict[str, float]) -> (bulk_orders.BatchResult):
+        """
+        Submits planned buys as one batch and moves their reservations from the
+        client order ids to the placed orders, which the fills then settle
+        """
+        result = self.strategy_handler.execute_orders(planned, prices)
+        for order_data in planned:
+            self.strategy_handler.account.release(order_data.client_order_id) # pyright: ignore
+        for order in result.orders:
+            self.strategy_handler.settle_order(str(order.id))
+        return result
 
     def sell_strategy(self) -> (list|None):
         """
         Executes the sell and roi strategy functions
         """
         logger.info("Sell strat has begun!")
+        self.strategy_handler.start_run()
         try:
-            positions = self.trading_client.get_all_positions()
+            with metrics.measure("alpaca_trading.get_all_positions"):
+                positions = self.trading_client.get_all_positions()
         except requests.HTTPError:
             logger.error("Error getting position from alpaca client: %s", requests.HTTPError)
             raise
 
-        sell_orders = []
-        if len(positions) > 0:
-            for position in positions:
-                if type(position) == Position:
-                    sell_signal = self.strategy_handler.sell_signal(position)
-                    if sell_signal == "sell":
-                        order_data = self.strategy_handler.create_order_data(
-                            position.symbol, position.qty_available, "sell"
-                            )
-                        order = self.strategy_handler.execute_order(order_data)
-                        sell_orders.append(order)
-                        logger.info("Sell order placed: %s", order)
+        positions = [position for position in positions if type(position) == Position]
+        # take-profit needs no market data, only the rest gets indicators
+        to_sell, remaining = [], []
+        for position in positions:
+            if self.strategy_handler.take_profit_signal(position):
+                to_sell.append(position)
+            else:
+                remaining.append(position)
+        if remaining:
+            self.strategy_handler.load_indicators([position.symbol for position in remaining])
+            signals = self.strategy_handler.evaluate_sell_signals(remaining)
+            to_sell += [position for position in remaining
+                        if signals.get(position.symbol) == "sell"]
+
+        sell_orders = self.strategy_handler.execute_orders([
+            self.strategy_handler.create_order_data(
+                position.symbol, position.qty_available, "sell"
+                )
+            for position in to_sell
+            ]).orders
+        for order in sell_orders:
+            logger.info("Sell order placed: %s", order)
 
         return sell_orders
 
-    def create_data(self)-> (tuple[TradeAccount, list[Order]]):
+    def create_data(self, synced_after: datetime|None = None
+                    ) -> (tuple[TradeAccount, Iterator[list[Order]]]):
         """ 
-        Creates and returns end-of-day data for storage in DB
+        Creates and returns end-of-day data for storage in DB: the account and
+        pages of the orders closed since the last export checkpoint. The orders
+        come from the order book only if it synced with the stream after
+        `synced_after`, i.e. during the current invocation
         """
-        trading_account = self.trading_client.get_account()
+        with metrics.measure("alpaca_trading.get_account"):
+            trading_account = self.trading_client.get_account()
         if type(trading_account) != TradeAccount:
             raise Exception("Unsupported Trade Account Response")
 
-        current_date = datetime.now().date()
-        yesterday_datetime = datetime.combine(current_date, datetime.min.time())
-        order_request = GetOrdersRequest(
-            status=QueryOrderStatus("closed"),
-            limit=500,
-            after=yesterday_datetime
-        )
-        orders = self.trading_client.get_orders(order_request)
-        
-        if type(orders) != list[Order]:
-            raise Exception("Unsupported Orders Response")
-
-        return trading_account, orders 
-
+        since = self.export_since()
+        book = self.strategy_handler.order_book
+        if synced_after is not None and book.covers(since, synced_after):
+            # the trade updates stream saw every order since the checkpoint
+            orders = book.closed_orders(since)
+            pages = (orders[start:start + bulk_orders.ORDERS_PAGE_LIMIT]
+                     for start in range(0, len(orders), bulk_orders.ORDERS_PAGE_LIMIT))
+            return trading_account, pages
+        return trading_account, bulk_orders.iter_order_pages(self.trading_client, since)
+
+    def export_since(self) -> (datetime):
+        """
+        start of the next order export: the stored checkpoint, else midnight UTC
+        today. Raises RuntimeError if the checkpoint can't be read
+        """
+        checkpoint = firestore_db.get_checkpoint(ORDER_EXPORT)
+        if checkpoint is not None:
+            return checkpoint
+        current_date = datetime.now(timezone.utc).date()
+        return datetime.combine(current_date, datetime.min.time(), timezone.utc)
+
+    def oldest_open_order(self) -> (datetime|None):
+        """submission time of the oldest order that can still fill"""
+        rate_limiter.acquire("alpaca_trading")
+        with metrics.measure("alpaca_trading.get_orders"):
+            orders = self.trading_client.get_orders(GetOrdersRequest(
+                status=QueryOrderStatus.OPEN, direction="asc", limit=1,
+                ))
+        orders = [order for order in orders if type(order) == Order] # pyright: ignore
+        return orders[0].submitted_at if orders else None
+
+    def export_orders(self, pages: Iterable[list[Order]],
+                      archive_to: archive.PortfolioArchive|None = None) -> (int):
+        """
+        Streams order pages into Firestore (and the columnar archive, if given)
+        and moves the export checkpoint after every stored page, so a rerun only
+        exports new orders. The checkpoint never passes an order that is still
+        open. Returns the orders exported
+        """
+        open_since = self.oldest_open_order()
+        exported = 0
+        checkpoint = None
+        for page in pages:
+            # only a direct write (the outbox unavailable) comes back short, a queued
+            # page that fails later holds the checkpoint back in the outbox
+            if firestore_db.push_order(page) < len(page):
+                logger.error("Order export stopped at the checkpoint, the page was not stored")
+                break
+            exported += len(page)
+            if archive_to is not None:
+                archive_to.append_orders(page)
+            checkpoint = max(order.submitted_at for order in page)
+            if open_since is not None:
+                checkpoint = min(checkpoint, open_since)
+            firestore_db.set_checkpoint(ORDER_EXPORT, checkpoint)
+        if checkpoint is not None:
+            # the exported orders are no longer needed in the live book
+            self.strategy_handler.order_book.prune(checkpoint)
+        logger.info("Exported %s orders", exported)
+        return exported
 
     def push_data(self, side: str, orders: list[Order]):
         """
@@ -337,32 +742,84 @@ class StrategyExecution():
 
 class ClientInstance:
     """Used to initialize a client instance for every instance of a strategy operation"""
-    def __init__(self):
-        self.env_vars = get_env()
+    def __init__(self, env_vars: dict|None = None, params: StrategyParams = DEFAULT_PARAMS,
+                 paper: bool = True):
+        self.env_vars = env_vars if env_vars is not None else get_env()
         self.client = TradingClient(
-            self.env_vars['ALPACA_KEY'], self.env_vars['ALPACA_SECRET'], paper=True
+            self.env_vars['ALPACA_KEY'], self.env_vars['ALPACA_SECRET'], paper=paper
+            )
+        # every trading response adapts the limiter, alpaca-py retries the 429s itself
+        self.client._session.hooks["response"].append( # pyright: ignore
+            rate_limiter.response_hook("alpaca_trading"))
+        self.strategyexec = StrategyExecution(self.client, self.env_vars, params=params)
+        self.trade_updates = TradeUpdatesListener(
+            self.strategyexec.strategy_handler.order_book, self.env_vars, paper=paper
             )
-        self.strategyexec = StrategyExecution(0.02, self.client, self.env_vars)
 
     def execute_buy_strategy(self):
         """initialize a buy instance and push results"""
-        buy_orders = self.strategyexec.buy_strategy()
-        if buy_orders:
-            self.strategyexec.push_data("buy", buy_orders)
+        with metrics.run("buy", firestore_db.push_run_metrics):
+            self.trade_updates.start()
+            buy_orders = self.strategyexec.buy_strategy()
+            if buy_orders:
+                self.strategyexec.push_data("buy", buy_orders)
 
     def execute_sell_strategy(self):
         """initialize a sell instanceand push results"""
-        sell_orders = self.strategyexec.sell_strategy()
-        if sell_orders:
-            self.strategyexec.push_data("sell", sell_orders)
+        with metrics.run("sell", firestore_db.push_run_metrics):
+            self.trade_updates.start()
+            sell_orders = self.strategyexec.sell_strategy()
+            if sell_orders:
+                self.strategyexec.push_data("sell", sell_orders)
 
     def push_port_orders(self):
         """fetch and push portfolio and pure-order data"""
-        data = self.strategyexec.create_data() 
-        if data is not None:
-            account_info, order_list = data
-        firestore_db.push_portfolio(account_info)
-        firestore_db.push_order(order_list)
+        with metrics.run("push", firestore_db.push_run_metrics):
+            started = datetime.now(timezone.utc)
+            # a warm instance's stream may be behind after being frozen between invocations
+            self.trade_updates.sync()
+            account_info, order_pages = self.strategyexec.create_data(synced_after=started)
+            firestore_db.push_portfolio(account_info)
+            archive_to = archive.get_archive()
+            if archive_to is not None:
+                archive_to.append_account(account_info)
+            self.strategyexec.export_orders(order_pages, archive_to)
+
+_instance_lock = threading.Lock()
+_instance: tuple[str, ClientInstance]|None = None
+
+def credential_fingerprint(env_vars: dict) -> (str):
+    """hash identifying a set of API secrets without keeping them in plain text"""
+    joined = "|".join(f"{name}={env_vars[name]}" for name in sorted(env_vars))
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+def get_client_instance() -> (ClientInstance):
+    """
+    Returns the ClientInstance cached in this (warm) process, so authenticated
+    clients, HTTP sessions and caches are reused across invocations.
+    A new instance is built when the credentials change
+    """
+    global _instance
+    env_vars = get_env()
+    fingerprint = credential_fingerprint(env_vars)
+    with _instance_lock:
+        if _instance is None or _instance[0] != fingerprint:
+            if _instance is not None:
+                logger.info("Credentials changed, rebuilding client instance")
+                _instance[1].trade_updates.stop()
+                poly_api.get_client.cache_clear()
+            _instance = (fingerprint, ClientInstance(env_vars))
+        return _instance[1]
+
+def invalidate_client_instance() -> (None):
+    """Drops the cached ClientInstance, the next invocation builds a fresh one"""
+    global _instance
+    with _instance_lock:
+        if _instance is not None:
+            # Alpaca allows one trade updates connection per account
+            _instance[1].trade_updates.stop()
+        _instance = None
+        poly_api.get_client.cache_clear()
 
 def test_db_con():
     """
@@ -370,7 +827,7 @@ def test_db_con():
     """
     env_vars = get_env()
     trading_client = TradingClient(env_vars['ALPACA_KEY'], env_vars['ALPACA_SECRET'], paper=True)
-    strategyexec = StrategyExecution(0.02, trading_client, env_vars)
-    ta, orders = strategyexec.create_data()
+    strategyexec = StrategyExecution(trading_client, env_vars)
+    ta, order_pages = strategyexec.create_data()
     firestore_db.push_portfolio(ta)
-    firestore_db.push_order(orders)
+    strategyexec.export_orders(order_pages)
@@ -0,0 +1,127 @@
+"""
+Module keeps fetched market data on local disk so repeat runs skip the APIs.
+
+Entries are keyed by (source, symbol, timespan, window, timestamp). Arrays are
+stored as .npy files and read back memory-mapped, record lists (e.g. FMP feeds)
+as JSON. Entries expire by age (checked on read) and the directory is trimmed
+to a size budget by dropping the least recently used files.
+"""
+import functools
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# /tmp is the only writable location on Cloud Functions
+CACHE_DIR = os.getenv("MARKET_CACHE_DIR", os.path.join(tempfile.gettempdir(), "market_cache"))
+CACHE_MAX_BYTES = int(os.getenv("MARKET_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Trim the directory every this many writes
+EVICT_EVERY = 50
+
+CacheKey = tuple[str, str, str, str|int, str]
+
+
+class MarketCache():
+    """
+    On-disk cache for bars, indicators and feeds shared by the live strategy
+    and the backtest tooling
+    """
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.writes = 0
+
+    def path(self, key: CacheKey, suffix: str) -> (str):
+        """file path of a cache key"""
+        source, *parts = (re.sub(r"[^A-Za-z0-9._-]", "_", str(part)) for part in key)
+        return os.path.join(self.root, source, "-".join(parts) + suffix)
+
+    def get(self, key: CacheKey, ttl: float) -> (np.ndarray|list|dict|None):
+        """returns the cached value if it's younger than ttl seconds, else None"""
+        for suffix in (".npy", ".json"):
+            path = self.path(key, suffix)
+            try:
+                age = time.time() - os.path.getmtime(path)
+                if age > ttl:
+                    return None
+                os.utime(path, (time.time(), os.path.getmtime(path))) # access time for LRU
+                if suffix == ".npy":
+                    return np.load(path, mmap_mode="r")
+                with open(path, encoding="utf-8") as file:
+                    return json.load(file)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as exc:
+                logger.warning("Dropping unreadable cache entry %s: %s", path, exc)
+                self.remove(path)
+        return None
+
+    def put(self, key: CacheKey, value: np.ndarray|list|dict) -> (None):
+        """
+        stores a value, written to a temp file first so readers never see partial data.
+        A value that can't be written (disk full, not serializable) is logged and skipped
+        """
+        is_array = isinstance(value, np.ndarray)
+        path = self.path(key, ".npy" if is_array else ".json")
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                if is_array:
+                    np.save(file, value, allow_pickle=False)
+                else:
+                    file.write(json.dumps(value, default=str).encode("utf-8"))
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as exc:
+            logger.warning("Failed to write cache entry %s: %s", path, exc)
+            if tmp_path is not None:
+                self.remove(tmp_path)
+            return
+        self.writes += 1
+        if self.writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def remove(self, path: str) -> (None):
+        """deletes a cache file if it still exists"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            logger.warning("Failed to remove cache file %s: %s", path, exc)
+
+    def evict(self) -> (int):
+        """drops least recently used entries until the cache fits max_bytes"""
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+            removed += 1
+        if removed:
+            logger.info("Evicted %s market cache entries", removed)
+        return removed
+
+
+@functools.cache
+def get_cache() -> (MarketCache):
+    """returns the process-wide market data cache"""
+    return MarketCache()
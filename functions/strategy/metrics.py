@@ -0,0 +1,181 @@
+"""
+Module records where a strategy run spends its time.
+
+Inside a run every instrumented upstream call records its latency, outcome and
+response size under an endpoint name ("alpaca_trading.get_account", ...), and
+every rate limiter acquisition its wait. The run ends with one summary with
+p50/p95 latency per endpoint and the limiter wait per API, logged and handed to
+a sink (Firestore). Outside a run, or with STRATEGY_METRICS=0, the hooks only
+check a module global.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("STRATEGY_METRICS", "1") != "0"
+
+
+class Call():
+    """
+    Handle of one measured call, set `bytes` to the size of its response and
+    `failed` if it returned an error response instead of raising
+    """
+    __slots__ = ("bytes", "failed")
+
+    def __init__(self):
+        self.bytes = 0
+        self.failed = False
+
+
+# Handed out when nothing is recorded, writes to it are dropped
+_UNRECORDED = Call()
+
+
+def percentile(values: list[float], share: float) -> (float):
+    """nearest-rank percentile of sorted values"""
+    return values[min(len(values) - 1, max(0, round(share * len(values)) - 1))]
+
+
+class RunRecorder():
+    """Call and limiter statistics of one run, safe to update from several threads"""
+    def __init__(self, name: str):
+        self.name = name
+        self.run_id = uuid.uuid4().hex
+        self.started = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.bytes: dict[str, int] = {}
+        self.waits: dict[str, list[float]] = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, nbytes: int = 0, error: bool = False) -> (None):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if nbytes:
+                self.bytes[endpoint] = self.bytes.get(endpoint, 0) + nbytes
+            if error:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def record_wait(self, api: str, seconds: float) -> (None):
+        with self.lock:
+            self.waits.setdefault(api, []).append(seconds)
+
+    def summary(self) -> (dict):
+        """
+        Per-endpoint latency percentiles, per-API limiter waits and the limiters'
+        current budgets, times in seconds
+        """
+        # imported here, the limiter reports its waits to this module
+        from .api_integrations import rate_limiter
+        with self.lock:
+            latencies = {endpoint: sorted(values) for endpoint, values in self.latencies.items()}
+            waits = {api: list(values) for api, values in self.waits.items()}
+            errors, nbytes = dict(self.errors), dict(self.bytes)
+        endpoints = {endpoint: {
+            "calls": len(values),
+            "errors": errors.get(endpoint, 0),
+            "total": sum(values),
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "max": values[-1],
+            "bytes": nbytes.get(endpoint, 0),
+            } for endpoint, values in latencies.items()}
+        limiter = {api: {
+            "acquired": len(values),
+            "waited": sum(1 for value in values if value > 0),
+            "total": sum(values),
+            "max": max(values),
+            } for api, values in waits.items()}
+        return {
+            "run": self.name,
+            "run_id": self.run_id,
+            "started": self.started.isoformat(),
+            "elapsed": time.perf_counter() - self.start,
+            "call_time": sum(stats["total"] for stats in endpoints.values()),
+            "limiter_wait": sum(stats["total"] for stats in limiter.values()),
+            "endpoints": endpoints,
+            "limiter": limiter,
+            "limits": rate_limiter.state(),
+        }
+
+
+_recorder: RunRecorder|None = None
+
+
+@contextmanager
+def run(name: str, sink: Callable[[dict], object]|None = None) -> (Iterator[RunRecorder|None]):
+    """
+    Records the calls made until the block exits, then logs the summary and
+    passes it to `sink`. Yields None when metrics are disabled
+    """
+    global _recorder
+    if not ENABLED:
+        yield None
+        return
+    recorder, previous = RunRecorder(name), _recorder
+    _recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _recorder = previous
+        summary = recorder.summary()
+        logger.info("Run metrics: %s", json.dumps(summary, default=str))
+        if sink is not None:
+            sink(summary)
+
+
+@contextmanager
+def measure(endpoint: str) -> (Iterator[Call]):
+    """times the block as one call of `endpoint`, an exception counts as an error"""
+    recorder = _recorder
+    if recorder is None:
+        yield _UNRECORDED
+        return
+    call = Call()
+    start = time.perf_counter()
+    error = False
+    try:
+        yield call
+    except BaseException:
+        error = True
+        raise
+    finally:
+        recorder.record(endpoint, time.perf_counter() - start, call.bytes, error or call.failed)
+
+
+def timed(endpoint: str):
+    """Decorator recording every call of the function as a call of `endpoint`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            error = True
+            try:
+                result = func(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                recorder.record(endpoint, time.perf_counter() - start, error=error)
+        return wrapper
+    return decorator
+
+
+def record_wait(api: str, seconds: float) -> (None):
+    """records one rate limiter acquisition and the seconds it waited"""
+    recorder = _recorder
+    if recorder is not None:
+        recorder.record_wait(api, seconds)
@@ -0,0 +1,259 @@
+"""
+Module keeps a live book of the account's orders and fills from Alpaca's
+trade updates stream.
+
+Orders the strategy submits are tracked with the price they were sized at.
+Fill events replace that estimate with the executed price and quantity as they
+arrive, so spend and position accounting needs no quote or order lookups and
+the end-of-day order list can be read from the book.
+"""
+import asyncio
+import logging
+import threading
+from collections.abc import Callable, Iterable
+from datetime import datetime, timezone
+from alpaca.trading.enums import OrderStatus, TradeEvent
+from alpaca.trading.models import Order, TradeUpdate
+from alpaca.trading.stream import TradingStream
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Statuses after which an order won't fill any further
+CLOSED_STATUSES = frozenset({
+    OrderStatus.FILLED, OrderStatus.CANCELED, OrderStatus.EXPIRED,
+    OrderStatus.REJECTED, OrderStatus.REPLACED, OrderStatus.DONE_FOR_DAY,
+    })
+FILL_EVENTS = frozenset({TradeEvent.FILL, TradeEvent.PARTIAL_FILL})
+# Seconds to wait for the stream to confirm a sync request
+SYNC_WAIT = 5.0
+
+
+class OrderBook():
+    """
+    Latest state and fills of every order seen on the trade updates stream or
+    tracked at submission. Listeners are called with every applied update
+    """
+    def __init__(self):
+        self.orders: dict[str, Order] = {}
+        self.estimates: dict[str, float] = {}
+        self.fills: dict[str, dict[str, tuple[float, float]]] = {}
+        self.positions: dict[str, float] = {}
+        self.listeners: list[Callable[[TradeUpdate], None]] = []
+        self.connected_at: datetime|None = None
+        self.synced_at: datetime|None = None
+        self.changed = threading.Condition()
+
+    def track(self, order: Order, price: float|None = None) -> (None):
+        """adds a submitted order, `price` is the unit price it was sized at"""
+        order_id = str(order.id)
+        with self.changed:
+            self.orders.setdefault(order_id, order)
+            if price is not None:
+                self.estimates[order_id] = price
+
+    def refresh(self, order: Order) -> (None):
+        """stores an order fetched over REST unless the book already has a newer version"""
+        order_id = str(order.id)
+        with self.changed:
+            known = self.orders.get(order_id)
+            if known is None or known.updated_at <= order.updated_at:
+                self.orders[order_id] = order
+                self.changed.notify_all()
+
+    def apply(self, update: TradeUpdate) -> (None):
+        """applies one trade update event"""
+        order = update.order
+        order_id = str(order.id)
+        with self.changed:
+            self.orders[order_id] = order
+            if update.event in FILL_EVENTS and update.qty is not None and update.price is not None:
+                # executions are keyed so a replayed event isn't counted twice
+                execution = str(update.execution_id or update.timestamp)
+                self.fills.setdefault(order_id, {})[execution] = (update.qty, update.price)
+                if update.position_qty is not None and order.symbol:
+                    self.positions[order.symbol] = update.position_qty
+            self.changed.notify_all()
+        for listener in self.listeners:
+            listener(update)
+
+    def filled(self, order_id: str) -> (tuple[float, float]):
+        """
+        Executed quantity and notional (price x qty) of an order. Orders without
+        fill events, e.g. filled before the stream connected, use their average price
+        """
+        with self.changed:
+            executions = list(self.fills.get(order_id, {}).values())
+            order = self.orders.get(order_id)
+        if not executions and order is not None and order.filled_avg_price is not None:
+            qty = float(order.filled_qty or 0)
+            return qty, qty * float(order.filled_avg_price)
+        return (sum(qty for qty, _ in executions),
+                sum(qty * price for qty, price in executions))
+
+    def remaining(self, order_id: str) -> (float):
+        """estimated cost of the unfilled quantity of an open order"""
+        with self.changed:
+            order = self.orders.get(order_id)
+            price = self.estimates.get(order_id)
+        if order is None or price is None or order.status in CLOSED_STATUSES:
+            return 0.0
+        filled_qty, _ = self.filled(order_id)
+        return max(float(order.qty or 0) - filled_qty, 0.0) * price
+
+    def committed(self, order_ids: Iterable[str]) -> (float):
+        """
+        Cash committed by the given orders: the executed notional of their fills
+        plus the estimated cost of what is still open
+        """
+        return sum(self.filled(order_id)[1] + self.remaining(order_id) for order_id in order_ids)
+
+    def latest(self, orders: list[Order]) -> (list[Order]):
+        """the newest known version of each order"""
+        with self.changed:
+            return [self.orders.get(str(order.id), order) for order in orders]
+
+    def covers(self, since: datetime, synced_after: datetime) -> (bool):
+        """
+        True if the stream has been listening since before `since` and the book
+        caught up with it after `synced_after`. A frozen (warm) instance keeps
+        its connection but falls behind, so a sync of the current invocation is needed
+        """
+        return self.connected_at is not None and self.connected_at <= since and \
+            self.synced_at is not None and self.synced_at >= synced_after
+
+    def prune(self, before: datetime) -> (int):
+        """
+        Drops the closed orders submitted before `before`, e.g. those already
+        exported, so a long-lived book doesn't grow. Returns the orders dropped
+        """
+        with self.changed:
+            stale = [order_id for order_id, order in self.orders.items()
+                     if order.status in CLOSED_STATUSES and order.submitted_at < before]
+            for order_id in stale:
+                del self.orders[order_id]
+                self.estimates.pop(order_id, None)
+                self.fills.pop(order_id, None)
+        return len(stale)
+
+    def closed_orders(self, after: datetime) -> (list[Order]):
+        """closed orders submitted after `after`, oldest first"""
+        with self.changed:
+            orders = [order for order in self.orders.values()
+                      if order.status in CLOSED_STATUSES and order.submitted_at >= after]
+        return sorted(orders, key=lambda order: order.submitted_at)
+
+    def wait(self, order_ids: list[str], timeout: float) -> (bool):
+        """blocks until the given orders are closed, False if the timeout passed first"""
+        def closed():
+            return all(order_id in self.orders and self.orders[order_id].status in CLOSED_STATUSES
+                       for order_id in order_ids)
+        with self.changed:
+            return self.changed.wait_for(closed, timeout)
+
+
+class ConfirmedTradingStream(TradingStream):
+    """
+    TradingStream reporting when the server confirms the trade updates
+    subscription and when the connection closes
+    """
+    def __init__(self, *args, on_listening: Callable[[], None], on_closed: Callable[[], None],
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_listening = on_listening
+        self.on_closed = on_closed
+
+    async def _dispatch(self, msg: dict) -> (None):
+        if msg.get("stream") == "listening" and \
+                "trade_updates" in (msg.get("data") or {}).get("streams", []):
+            self.on_listening()
+        await super()._dispatch(msg)
+
+    async def close(self) -> (None):
+        self.on_closed()
+        await super().close()
+
+
+class TradeUpdatesListener():
+    """Runs Alpaca's trade updates stream in a background thread and feeds an OrderBook"""
+    def __init__(self, book: OrderBook, secret: dict, paper: bool = True,
+                 url_override: str|None = None):
+        self.book = book
+        self.stream = ConfirmedTradingStream(secret['ALPACA_KEY'], secret['ALPACA_SECRET'],
+                                             paper=paper, url_override=url_override,
+                                             on_listening=self.on_listening,
+                                             on_closed=self.on_closed)
+        self.stream.subscribe_trade_updates(self.on_update)
+        self.thread: threading.Thread|None = None
+
+    async def on_update(self, update: TradeUpdate) -> (None):
+        """stream handler"""
+        try:
+            self.book.apply(update)
+        except (ValueError, TypeError) as exc:
+            logger.error("Failed to apply trade update: %s", exc)
+
+    def on_listening(self) -> (None):
+        """
+        the book covers the account from the moment the subscription is confirmed,
+        and is caught up with the stream whenever a confirmation arrives
+        """
+        now = datetime.now(timezone.utc)
+        with self.book.changed:
+            if self.book.connected_at is None:
+                self.book.connected_at = now
+                logger.info("Listening for trade updates")
+            self.book.synced_at = now
+            self.book.changed.notify_all()
+
+    def sync(self, timeout: float = SYNC_WAIT) -> (bool):
+        """
+        Asks the server to confirm the subscription again and waits for the reply.
+        The stream delivers in order, so once it's back every update sent before
+        it is in the book. False if the stream isn't running or didn't reply
+        """
+        loop = getattr(self.stream, "_loop", None)
+        if self.book.connected_at is None or loop is None or not loop.is_running():
+            return False
+        requested = datetime.now(timezone.utc)
+        try:
+            asyncio.run_coroutine_threadsafe(
+                self.stream._subscribe_trade_updates(), loop # pyright: ignore
+                ).result(timeout)
+        except Exception as exc:
+            logger.warning("Failed to sync trade updates: %s", exc)
+            return False
+        with self.book.changed:
+            return self.book.changed.wait_for(
+                lambda: self.book.synced_at is not None and self.book.synced_at >= requested,
+                timeout)
+
+    def on_closed(self) -> (None):
+        """updates are missed until the stream subscribes again"""
+        self.book.connected_at = None
+
+    def run(self) -> (None):
+        """thread target, the book stops covering the account if the stream dies"""
+        try:
+            self.stream.run()
+        except Exception as exc:
+            logger.error("Trade updates stream died: %s", exc)
+        finally:
+            self.on_closed()
+
+    def start(self) -> (None):
+        """starts listening if it isn't already, returns straight away"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.run, name="trade-updates", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10.0) -> (None):
+        """stops the stream and waits for the thread to finish"""
+        self.on_closed()
+        if self.thread is None:
+            return
+        if getattr(self.stream, "_loop", None) is not None:
+            self.stream.stop()
+        self.thread.join(timeout)
+        self.thread = None
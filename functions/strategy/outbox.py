@@ -0,0 +1,288 @@
+"""
+Module keeps a local write-ahead outbox for Firestore documents.
+
+Strategy runs append documents to a SQLite file, which is a cheap local write,
+and a background flusher drains it to Firestore in append-ordered batches. Failed batches stay
+in the outbox and are retried with jittered exponential backoff, entries that
+keep failing are parked after MAX_ATTEMPTS instead of blocking the rest.
+
+Parked entries get another round of attempts whenever the outbox is opened and
+are dropped once a later write of the same document is delivered. Barrier
+entries (the export checkpoints) vouch for everything queued before them, so
+one queued behind a parked entry is dropped rather than delivered: the
+checkpoint stays where it was and the next export sends those documents again.
+"""
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from datetime import date, datetime
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# /tmp is the only writable location on Cloud Functions
+OUTBOX_PATH = os.getenv("FIRESTORE_OUTBOX", os.path.join(tempfile.gettempdir(), "firestore_outbox.db"))
+# Firestore caps a WriteBatch at 500 operations
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 300.0
+# Seconds the flusher sleeps when nothing is due
+FLUSH_INTERVAL = 5.0
+
+Document = tuple[str, dict]
+Writer = Callable[[list[Document]], object]
+ErrorTypes = Callable[[], tuple[type[Exception], ...]]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    data TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    barrier INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def encode(value):
+    """JSON default hook, keeps datetimes typed through the outbox"""
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    return str(value)
+
+
+def decode(value: dict):
+    """JSON object hook reversing encode()"""
+    if "$datetime" in value:
+        return datetime.fromisoformat(value["$datetime"])
+    if "$date" in value:
+        return date.fromisoformat(value["$date"])
+    return value
+
+
+def backoff(attempts: int) -> (float):
+    """seconds before the next try, full jitter over an exponential cap"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempts))
+
+
+class Outbox():
+    """Append-only SQLite queue of (document path, data) pairs"""
+    def __init__(self, path: str = OUTBOX_PATH, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(outbox)")}
+        if "barrier" not in columns:
+            # outbox files written before barriers existed
+            self.db.execute("ALTER TABLE outbox ADD COLUMN barrier INTEGER NOT NULL DEFAULT 0")
+        self.requeue()
+
+    def append(self, documents: list[Document], barrier: bool = False) -> (int):
+        """
+        stores documents for delivery, returns how many were queued. Barrier
+        documents are only delivered if nothing queued before them was parked
+        """
+        rows = [(path, json.dumps(data, default=encode), int(barrier)) for path, data in documents]
+        with self.lock:
+            with self.db:
+                self.db.executemany("INSERT INTO outbox (path, data, barrier) VALUES (?, ?, ?)",
+                                    rows)
+        return len(rows)
+
+    def requeue(self) -> (int):
+        """gives the parked entries another round of attempts, returns how many"""
+        with self.lock:
+            with self.db:
+                requeued = self.db.execute(
+                    "UPDATE outbox SET attempts = 0, next_attempt = 0 WHERE attempts >= ?",
+                    (self.max_attempts,)).rowcount
+        if requeued:
+            logger.warning("Retrying %s parked outbox entries", requeued)
+        return requeued
+
+    def pending(self) -> (int):
+        """entries waiting for delivery, parked entries excluded"""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM outbox WHERE attempts < ?",
+                                   (self.max_attempts,)).fetchone()[0]
+
+    def parked(self) -> (int):
+        """entries that gave up after max_attempts, kept in the file for inspection"""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM outbox WHERE attempts >= ?",
+                                   (self.max_attempts,)).fetchone()[0]
+
+    def next_due(self) -> (float|None):
+        """epoch time the oldest pending entry may be tried, None if nothing is pending"""
+        with self.lock:
+            row = self.db.execute("SELECT next_attempt FROM outbox WHERE attempts < ? "
+                                  "ORDER BY id LIMIT 1", (self.max_attempts,)).fetchone()
+        return None if row is None else row[0]
+
+    def flush(self, write: Writer, errors: ErrorTypes, limit: int = BATCH_SIZE) -> (int):
+        """
+        Writes the oldest entries as one batch with `write` and deletes them, in
+        append order so a later write never lands before an earlier one. A failed
+        batch is rescheduled, errors other than the `errors()` types are logged
+        as unexpected but count as an attempt all the same. Returns the entries
+        delivered, dropped or parked
+        """
+        with self.flush_lock:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT id, path, data, attempts, next_attempt, barrier FROM outbox "
+                    "WHERE attempts < ? ORDER BY id LIMIT ?",
+                    (self.max_attempts, limit)).fetchall()
+                parked = self.db.execute("SELECT id, path FROM outbox WHERE attempts >= ?",
+                                         (self.max_attempts,)).fetchall()
+            # entries waiting for a retry hold back everything appended after them
+            now = time.time()
+            rows = list(itertools.takewhile(lambda row: row[4] <= now, rows))
+            if not rows:
+                return 0
+            try:
+                self.deliver(write, rows, parked)
+            except Exception as exc:
+                if not isinstance(exc, errors()):
+                    logger.error("Unexpected outbox flush error: %r", exc)
+                attempts = max(row[3] for row in rows) + 1
+                if attempts >= self.max_attempts and len(rows) > 1:
+                    logger.error("A batch of %s outbox entries failed %s times, writing "
+                                 "them one by one: %s", len(rows), attempts, exc)
+                    return self.isolate(write, rows, attempts, parked)
+                delay = backoff(attempts)
+                if attempts >= self.max_attempts:
+                    logger.error("Parking an outbox entry after %s attempts: %s", attempts, exc)
+                else:
+                    logger.warning("Outbox flush failed, retrying %s entries in %.1fs: %s",
+                                   len(rows), delay, exc)
+                self.reschedule(rows, attempts, time.time() + delay)
+                return 0
+            return len(rows)
+
+    def deliver(self, write: Writer, rows: list[tuple], parked: list[tuple[int, str]]) -> (None):
+        """
+        Writes outbox rows and deletes them. Barriers queued behind a parked
+        (id, path) entry that isn't written again before them are deleted
+        unwritten, parked copies of the written documents are deleted as obsolete
+        """
+        written, held = [], []
+        rewritten: dict[str, int] = {}
+        for row in rows:
+            if row[5] and any(row_id < row[0] and rewritten.get(path, 0) < row_id
+                              for row_id, path in parked):
+                held.append(row)
+                continue
+            written.append(row)
+            rewritten[row[1]] = row[0]
+        if held:
+            logger.error("Dropping %s checkpoints queued behind parked outbox entries, "
+                         "the export resumes from the last stored one", len(held))
+        if written:
+            write([(row[1], json.loads(row[2], object_hook=decode)) for row in written])
+        with self.lock:
+            with self.db:
+                self.db.executemany("DELETE FROM outbox WHERE id = ?", [(row[0],) for row in rows])
+                if parked:
+                    self.db.executemany(
+                        "DELETE FROM outbox WHERE path = ? AND id < ? AND attempts >= ?",
+                        [(row[1], row[0], self.max_attempts) for row in written])
+
+    def isolate(self, write: Writer, rows: list[tuple], attempts: int,
+                parked: list[tuple[int, str]]) -> (int):
+        """writes a failing batch entry by entry and parks only the entries that fail"""
+        for row in rows:
+            try:
+                self.deliver(write, [row], parked)
+                parked = [(row_id, path) for row_id, path in parked
+                          if path != row[1] or row_id > row[0]]
+            except Exception as exc:
+                logger.error("Parking outbox entry %s after %s attempts: %s", row[1], attempts, exc)
+                self.reschedule([row], attempts, time.time())
+                parked = parked + [(row[0], row[1])]
+        return len(rows)
+
+    def reschedule(self, rows: list[tuple], attempts: int, next_attempt: float) -> (None):
+        with self.lock:
+            with self.db:
+                self.db.executemany(
+                    "UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id = ?",
+                    [(attempts, next_attempt, row[0]) for row in rows])
+
+    def drain(self, write: Writer, errors: ErrorTypes, timeout: float) -> (bool):
+        """flushes until the outbox is empty or the timeout passes, True if it emptied"""
+        deadline = time.monotonic() + timeout
+        while self.pending():
+            if self.flush(write, errors):
+                continue
+            due = self.next_due()
+            wait = 0.0 if due is None else due - time.time()
+            if time.monotonic() + wait >= deadline:
+                return False
+            time.sleep(max(wait, 0.0))
+        return True
+
+    def close(self) -> (None):
+        with self.lock:
+            self.db.close()
+
+
+class OutboxFlusher():
+    """Background thread draining an outbox, woken up early by new appends"""
+    def __init__(self, outbox: Outbox, write: Writer, errors: ErrorTypes,
+                 interval: float = FLUSH_INTERVAL):
+        self.outbox = outbox
+        self.write = write
+        self.errors = errors
+        self.interval = interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread: threading.Thread|None = None
+
+    def start(self) -> ("OutboxFlusher"):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name="outbox-flusher", daemon=True)
+            self.thread.start()
+        return self
+
+    def wake(self) -> (None):
+        """asks the flusher to look at the outbox now"""
+        self.wakeup.set()
+
+    def run(self) -> (None):
+        while not self.stopping.is_set():
+            try:
+                if self.outbox.flush(self.write, self.errors):
+                    continue
+                due = self.outbox.next_due()
+                wait = self.interval if due is None else min(self.interval, max(due - time.time(), 0.0))
+            except Exception as exc: # keep the flusher alive, entries stay queued
+                logger.error("Outbox flusher error: %s", exc)
+                wait = self.interval
+            self.wakeup.wait(wait)
+            self.wakeup.clear()
+
+    def stop(self, timeout: float = 10.0) -> (None):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
@@ -0,0 +1,220 @@
+"""
+Module runs the strategy for many portfolios (accounts and strategy variants).
+
+Portfolios are listed in a JSON registry, each names the environment variables
+holding its Alpaca keys, its strategy parameters and its Firestore namespace.
+A scheduled run fetches the market data (watchlist, bars, quotes) once in the
+parent process and fans the portfolios out across a process pool, every worker
+gets the shared MarketSnapshot instead of fetching it again. The market data
+keys are shared too, so every worker gets an equal part of their rate limits.
+
+Registry format: [{"name": "momentum", "key_env": "MOMENTUM_ALPACA_KEY",
+"secret_env": "MOMENTUM_ALPACA_SECRET", "params": {"rsi_buy": 30}}, ...]
+
+Usage: python -m functions.strategy.portfolios buy|sell|push [--registry PATH]
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+from types import ModuleType
+from typing import TYPE_CHECKING
+from . import firestore_db, metrics
+from .api_integrations import rate_limiter
+from .rules import StrategyParams, DEFAULT_PARAMS
+
+if TYPE_CHECKING:
+    from .main_strategy import MarketSnapshot
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REGISTRY_PATH = os.getenv("PORTFOLIO_REGISTRY", "portfolios.json")
+# Seconds a worker waits for its queued Firestore writes after a run
+OUTBOX_DRAIN_TIMEOUT = 30.0
+ACTIONS = ("buy", "sell", "push")
+# Runs mostly wait on the network, so more workers than cores still pay off
+PORTFOLIO_WORKERS = 8
+# Rate limiters of the APIs whose keys all portfolios share, split between the workers
+SHARED_KEY_APIS = ("polygon", "alpaca_data", "fmp")
+
+
+def strategy() -> (ModuleType):
+    """
+    main_strategy, imported on first use: reading the registry and a push
+    run's parent process don't need alpaca-py
+    """
+    from . import main_strategy
+    return main_strategy
+
+
+@dataclass(frozen=True)
+class Portfolio():
+    """One account and strategy variant, `namespace` "" writes to the top-level collections"""
+    name: str
+    key_env: str = "ALPACA_KEY"
+    secret_env: str = "ALPACA_SECRET"
+    params: StrategyParams = DEFAULT_PARAMS
+    paper: bool = True
+    namespace: str = ""
+
+    def secret(self) -> (dict):
+        """API secrets of the portfolio, the market data keys are shared"""
+        env_vars = strategy().get_env()
+        env_vars['ALPACA_KEY'] = str(os.getenv(self.key_env))
+        env_vars['ALPACA_SECRET'] = str(os.getenv(self.secret_env))
+        return env_vars
+
+
+DEFAULT_PORTFOLIO = Portfolio("default")
+
+
+def load_registry(path: str = REGISTRY_PATH) -> (list[Portfolio]):
+    """
+    Reads the portfolio registry, every entry is namespaced by its name unless
+    it sets one. Without a registry file only the default portfolio runs
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            entries = json.load(file)
+    except FileNotFoundError:
+        return [DEFAULT_PORTFOLIO]
+    portfolios = []
+    for entry in entries:
+        entry = dict(entry)
+        params = StrategyParams(**entry.pop("params", {}))
+        entry.setdefault("namespace", entry["name"])
+        portfolios.append(Portfolio(params=params, **entry))
+    names = [portfolio.namespace for portfolio in portfolios]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Portfolio namespaces must be unique, got {names}")
+    return portfolios
+
+
+def held_symbols(portfolios: list[Portfolio]) -> (list[str]):
+    """
+    symbols of the open positions of all portfolios, one positions call per account.
+    An account that fails is logged and its symbols are left out
+    """
+    from alpaca.trading.client import TradingClient
+    from alpaca.trading.models import Position
+
+    def positions(portfolio: Portfolio) -> (list[str]):
+        try:
+            secret = portfolio.secret()
+            client = TradingClient(secret['ALPACA_KEY'], secret['ALPACA_SECRET'],
+                                   paper=portfolio.paper)
+            rate_limiter.acquire("alpaca_trading")
+            with metrics.measure("alpaca_trading.get_all_positions"):
+                held = client.get_all_positions()
+        except Exception as exc:
+            logger.error("Failed to fetch positions of %s: %s", portfolio.name, exc)
+            return []
+        return [position.symbol for position in held if type(position) == Position]
+    with ThreadPoolExecutor(max_workers=min(len(portfolios), 8)) as pool:
+        held = pool.map(positions, portfolios)
+    return sorted(set(itertools.chain.from_iterable(held)))
+
+
+def fetch_market_data(action: str, portfolios: list[Portfolio]) -> ("MarketSnapshot|None"):
+    """
+    Fetches what every portfolio's run needs once: the watchlist, its quotes and
+    indicator readings for a buy run, readings of all held symbols for a sell run
+    """
+    if action not in ("buy", "sell"):
+        return None
+    main_strategy = strategy()
+    secret = portfolios[0].secret()
+    handler = main_strategy.StrategyHandler(None, secret) # pyright: ignore
+    if action == "buy":
+        # fills the day's watchlist cache the workers read
+        symbols = [stock["symbol"] for stock in
+                   main_strategy.WatchlistHandler(secret, session=handler.session).candidates()]
+    else:
+        symbols = held_symbols(portfolios)
+    handler.load_indicators(symbols)
+    quotes = handler.get_quotes(symbols) if action == "buy" and symbols else {}
+    return main_strategy.MarketSnapshot(time.time(), quotes, dict(handler.indicator_cache))
+
+
+_worker_snapshot: "MarketSnapshot|None" = None
+
+
+def init_worker(snapshot: "MarketSnapshot|None", share: float = 1.0) -> (None):
+    """
+    process pool initializer, keeps the shared market data for every run of the
+    worker and limits it to its share of the shared keys' rate limits
+    """
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+    rate_limiter.set_share(SHARED_KEY_APIS, share)
+
+
+def run_portfolio(portfolio: Portfolio, action: str) -> (dict):
+    """runs one action for one portfolio in a worker and returns a result row"""
+    start = time.perf_counter()
+    firestore_db.set_namespace(portfolio.namespace)
+    result = {"portfolio": portfolio.name, "action": action, "status": "ok"}
+    instance = None
+    try:
+        instance = strategy().ClientInstance(portfolio.secret(), portfolio.params,
+                                             portfolio.paper)
+        if _worker_snapshot is not None:
+            instance.strategyexec.strategy_handler.share_market_data(_worker_snapshot)
+        if action == "buy":
+            instance.execute_buy_strategy()
+        elif action == "sell":
+            instance.execute_sell_strategy()
+        elif action == "push":
+            instance.push_port_orders()
+    except Exception as exc: # one failing account must not stop the others
+        logger.error("Portfolio %s failed to %s: %s", portfolio.name, action, exc)
+        result["status"] = "failed"
+        result["error"] = str(exc)
+    finally:
+        if instance is not None:
+            instance.trade_updates.stop()
+        firestore_db.drain(OUTBOX_DRAIN_TIMEOUT)
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+def run_portfolios(action: str, portfolios: list[Portfolio],
+                   workers: int|None = None) -> (list[dict]):
+    """
+    Runs an action for every portfolio across a process pool (one worker per
+    portfolio up to PORTFOLIO_WORKERS) and returns one result row per portfolio
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action {action}, expected one of {ACTIONS}")
+    start = time.perf_counter()
+    snapshot = fetch_market_data(action, portfolios)
+    workers = min(workers or PORTFOLIO_WORKERS, len(portfolios))
+    # spawn, the parent may hold threads (stream, flusher) and SQLite handles
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                             initializer=init_worker, initargs=(snapshot, 1 / workers)) as pool:
+        results = list(pool.map(run_portfolio, portfolios, itertools.repeat(action)))
+    failed = [result["portfolio"] for result in results if result["status"] != "ok"]
+    logger.info("Ran %s for %s portfolios in %.1fs, failed: %s",
+                action, len(portfolios), time.perf_counter() - start, failed or "none")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a strategy action for every portfolio")
+    parser.add_argument("action", choices=ACTIONS)
+    parser.add_argument("--registry", default=REGISTRY_PATH)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    for result in run_portfolios(args.action, load_registry(args.registry), args.workers):
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Module holds the strategy thresholds and the trading rules built on them"""
+from dataclasses import dataclass, asdict
+import numpy as np
+
+
+@dataclass(frozen=True)
+class StrategyParams():
+    """Tunable thresholds of the strategy, defaults are the live settings"""
+    rsi_buy: float = 35.0           # buy when RSI is below
+    rsi_sell: float = 65.0          # sell when RSI is above
+    take_profit: float = 0.05       # sell when unrealized P&L reaches
+    allocation_limit: float = 0.02  # share of cash to spend per day
+    position_size: float = 0.05     # share of cash per position
+    price_cut: float = 500.0        # above this price only 1 share is bought
+    max_price: float = 10000.0      # never buy above this price
+    min_cash: float = 25000.0       # PDT minimum to keep trading
+
+    def as_dict(self) -> (dict):
+        """returns the parameters as a plain dict"""
+        return asdict(self)
+
+
+DEFAULT_PARAMS = StrategyParams()
+
+# The rules take scalars or NumPy arrays, so live trading and backtests share them
+
+def macd_bullish(value, signal, hist):
+    """MACD above its signal line with a positive histogram"""
+    return (value > signal) & (hist > 0.0)
+
+
+def macd_bearish(value, signal, hist):
+    """MACD below its signal line with a negative histogram"""
+    return (value < signal) & (hist < 0.0)
+
+
+def rsi_oversold(rsi, params: StrategyParams = DEFAULT_PARAMS):
+    """RSI below the buy threshold"""
+    return rsi < params.rsi_buy
+
+
+def rsi_overbought(rsi, params: StrategyParams = DEFAULT_PARAMS):
+    """RSI above the sell threshold"""
+    return rsi > params.rsi_sell
+
+
+def take_profit_hit(p_and_l, params: StrategyParams = DEFAULT_PARAMS):
+    """Unrealized P&L (as a fraction) at or above the take-profit level"""
+    return p_and_l >= params.take_profit
+
+
+def has_funds(cash, params: StrategyParams = DEFAULT_PARAMS):
+    """Cash at or above the PDT minimum"""
+    return cash >= params.min_cash
+
+
+def within_allocation(cash, spent_already, params: StrategyParams = DEFAULT_PARAMS):
+    """Less than the daily allocation of the day's opening cash spent"""
+    return spent_already < cash * params.allocation_limit
+
+
+def can_buy(cash, spent_already, params: StrategyParams = DEFAULT_PARAMS):
+    """
+    Enough cash for PDT after the day's spend and daily allocation left,
+    `cash` is the cash the day started with
+    """
+    return has_funds(cash - spent_already, params) & within_allocation(cash, spent_already, params)
+
+
+def buy_quantity(unitprice, portval, params: StrategyParams = DEFAULT_PARAMS):
+    """
+    Whole shares to buy at unitprice: position_size of portval below the price cut,
+    1 share between the price cut and max_price, otherwise 0
+    """
+    unitprice = np.asarray(unitprice, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sized = np.floor(portval * params.position_size / unitprice)
+    quantity = np.where((unitprice > 0) & (unitprice < params.price_cut), sized,
+                        np.where((unitprice > params.price_cut) & (unitprice < params.max_price),
+                                 1.0, 0.0))
+    return quantity if quantity.ndim else float(quantity)
@@ -0,0 +1,137 @@
+"""
+Module turns Alpaca models into flat Firestore records.
+
+A serializer function is generated once per model class from its field
+annotations: plain fields (str, numbers, bools, datetimes) are copied as they
+are and only UUID, enum, Decimal and nested model fields get a converter.
+Records carry a schema version and the source object is never modified.
+"""
+import enum
+import types
+import typing
+import uuid
+from collections.abc import Callable
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from pydantic import BaseModel
+
+# Bump when the record layout changes so readers can tell old documents apart
+SCHEMA_VERSION = 1
+SCHEMA_FIELD = "schema_version"
+
+# Types Firestore stores natively, fields of only these types are copied as is
+PLAIN_TYPES = (str, int, float, bool, datetime, date, type(None))
+
+
+def order_date(order) -> (date|None):
+    """UTC day an order filled, else the day it was submitted, None without either"""
+    moment = getattr(order, "filled_at", None) or getattr(order, "submitted_at", None)
+    return moment.astimezone(timezone.utc).date() if moment is not None else None
+
+
+def convert_value(value):
+    """Firestore-ready version of any value, used for fields that aren't plain"""
+    # before the plain types, most Alpaca enums are str subclasses
+    if isinstance(value, enum.Enum):
+        return value.value
+    if value is None or isinstance(value, PLAIN_TYPES):
+        return value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return serialize(value)
+    if isinstance(value, (list, tuple)):
+        return [convert_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): convert_value(item) for key, item in value.items()}
+    return str(value)
+
+
+class EnumValues(dict):
+    """
+    Member to value lookup of an enum field, much cheaper than Enum.value.
+    Called as lookup(value, value) so None and values set without validation pass through
+    """
+    def __init__(self, enum_type: type[enum.Enum]):
+        super().__init__((member, member.value) for member in enum_type)
+
+
+def leaf_types(annotation) -> (set):
+    """the concrete types a field annotation allows"""
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        return set().union(*(leaf_types(arg) for arg in typing.get_args(annotation)))
+    return {origin or annotation}
+
+
+def field_converter(annotation) -> (Callable|None):
+    """converter of a field, None if its values can be stored as they are"""
+    leaves = leaf_types(annotation)
+    if all(isinstance(leaf, type) and issubclass(leaf, PLAIN_TYPES)
+           and not issubclass(leaf, enum.Enum) for leaf in leaves):
+        return None
+    if len(leaves - {type(None)}) == 1:
+        leaf = next(iter(leaves - {type(None)}))
+        if leaf is uuid.UUID or leaf is Decimal:
+            return str
+        if isinstance(leaf, type) and issubclass(leaf, enum.Enum):
+            return EnumValues(leaf)
+    return convert_value
+
+
+def compile_serializer(model: type[BaseModel]) -> (Callable[[BaseModel], dict]):
+    """
+    Generates the record builder of a model class: one function that copies the
+    instance's fields in a single C-level dict copy and then only rewrites the
+    fields that have a converter
+    """
+    namespace: dict = {"SCHEMA_VERSION": SCHEMA_VERSION}
+    lines = []
+    for index, (name, info) in enumerate(model.model_fields.items()):
+        converter = field_converter(info.annotation)
+        if converter is None:
+            continue
+        if isinstance(converter, EnumValues):
+            namespace[f"convert_{index}"] = converter.get
+            lines.append(f"    record[{name!r}] = convert_{index}(value := record[{name!r}], value)")
+        else:
+            namespace[f"convert_{index}"] = converter
+            lines.append(f"    if (value := record[{name!r}]) is not None:")
+            lines.append(f"        record[{name!r}] = convert_{index}(value)")
+    source = "\n".join([
+        "def serialize_model(obj):",
+        "    record = obj.__dict__.copy()",
+        *lines,
+        f"    record[{SCHEMA_FIELD!r}] = SCHEMA_VERSION",
+        "    return record",
+        ])
+    exec(compile(source, f"<serializer {model.__name__}>", "exec"), namespace)
+    return namespace["serialize_model"]
+
+
+def serialize_attributes(obj) -> (dict):
+    """record of a plain object, converted field by field from a copy of its attributes"""
+    record = {name: convert_value(value) for name, value in vars(obj).items()}
+    record[SCHEMA_FIELD] = SCHEMA_VERSION
+    return record
+
+
+# Serializer per class, looked up by exact type (isinstance on pydantic models is slow)
+SERIALIZERS: dict[type, Callable[[typing.Any], dict]] = {}
+
+
+def serializer_for(cls: type) -> (Callable[[typing.Any], dict]):
+    """returns the serializer of a class, compiled on first use for pydantic models"""
+    serializer = SERIALIZERS.get(cls)
+    if serializer is None:
+        serializer = (compile_serializer(cls) if issubclass(cls, BaseModel)
+                      else serialize_attributes)
+        SERIALIZERS[cls] = serializer
+    return serializer
+
+
+def serialize(obj) -> (dict):
+    """Flat record of an Alpaca model (Order, TradeAccount, ...) or any other object"""
+    return serializer_for(type(obj))(obj)
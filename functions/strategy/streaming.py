@@ -0,0 +1,222 @@
+"""
+Module runs the strategy event-driven from Alpaca's live bar and quote streams.
+
+Instead of the scheduled buy/sell snapshots, a long-running process subscribes to
+minute bars and quotes for the approved watchlist and the open positions. Every
+bar updates the ticker's hourly indicator state in constant time (the running hour
+is previewed with its latest close and committed when the hour rolls over) and is
+run through the StrategyHandler buy/sell rules straight away.
+
+Usage: python -m functions.strategy.streaming
+"""
+import asyncio
+import functools
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+from alpaca.data.enums import DataFeed
+from alpaca.data.live.stock import StockDataStream
+from alpaca.data.models import Bar, Quote
+from alpaca.trading.models import Order, Position
+from .indicators import IndicatorState
+from .main_strategy import StrategyExecution, ClientInstance
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds in an hourly bar
+HOUR = 3600
+
+
+class StreamingStrategy():
+    """
+    Drives a StrategyExecution from the Alpaca market data websocket.
+    Pass url_override to point the stream at a local stand-in
+    """
+    def __init__(self, execution: StrategyExecution, secret: dict,
+                 url_override: str|None = None, feed: DataFeed = DataFeed.IEX):
+        self.execution = execution
+        self.handler = execution.strategy_handler
+        self.stream = StockDataStream(secret['ALPACA_KEY'], secret['ALPACA_SECRET'],
+                                      feed=feed, url_override=url_override)
+        self.states: dict[str, IndicatorState] = {}
+        self.running_hour: dict[str, datetime] = {}
+        self.running_close: dict[str, float] = {}
+        self.watchlist: set[str] = set()
+        self.positions: dict[str, Position] = {}
+        self.bought: set[str] = set()
+        self.busy: set[str] = set()
+        self.tasks: set[asyncio.Task] = set()
+        self.orders: dict[str, list[Order]] = {"buy": [], "sell": []}
+        self.order_lock = threading.Lock()
+
+    def seed(self, closes: dict[str, list[float]]) -> (None):
+        """seeds the indicator state of every ticker from its hourly closes"""
+        for symbol, history in closes.items():
+            self.states[symbol.upper()] = IndicatorState.from_history(history)
+
+    def seed_bars(self, bars: dict[str, np.ndarray], now: datetime) -> (None):
+        """
+        Seeds the indicator state from hourly bars (start times and closes) of
+        the hours completed by `now`. A bar of the running hour becomes the
+        running close, so the minute bars of that hour carry on from it
+        """
+        cutoff = now.timestamp() - HOUR
+        for symbol, series in bars.items():
+            symbol = symbol.upper()
+            complete = series[0] <= cutoff
+            self.states[symbol] = IndicatorState.from_history(series[1, complete].tolist())
+            if not complete[-1]:
+                self.running_hour[symbol] = datetime.fromtimestamp(series[0, -1], timezone.utc)
+                self.running_close[symbol] = float(series[1, -1])
+
+    def prepare(self) -> (list[str]):
+        """
+        Loads the approved watchlist and open positions and seeds their indicators,
+        returns the symbols to subscribe to
+        """
+        self.handler.start_run()
+        watchlist = self.execution.watchlist_handler.candidates()
+        self.watchlist = {stock["symbol"].upper() for stock in watchlist}
+        self.positions = {position.symbol: position
+                          for position in self.execution.trading_client.get_all_positions()
+                          if type(position) == Position}
+        symbols = sorted(self.watchlist | set(self.positions))
+        self.seed_bars(self.handler.bar_series(symbols), datetime.now(timezone.utc))
+        return symbols
+
+    async def on_quote(self, quote: Quote) -> (None):
+        """keeps the handler's quote cache current, quantity_calc reads from it"""
+        self.handler.quote_cache[quote.symbol] = (time.monotonic(), {
+            "ap": quote.ask_price, "as": quote.ask_size,
+            "bp": quote.bid_price, "bs": quote.bid_size,
+            })
+
+    async def on_bar(self, bar: Bar) -> (None):
+        """
+        Updates the indicators of the bar's ticker and hands its evaluation to a
+        worker thread. The stream awaits handlers one at a time, so the handler
+        returns at once; bars of a ticker still being decided are only folded in
+        """
+        reading = self.update_state(bar)
+        if reading is None or bar.symbol in self.busy:
+            return
+        self.handler.indicator_cache[bar.symbol] = reading
+        self.busy.add(bar.symbol)
+        task = asyncio.create_task(asyncio.to_thread(self.decide, bar.symbol, bar.close))
+        self.tasks.add(task)
+        task.add_done_callback(functools.partial(self.decided, bar.symbol))
+
+    def decided(self, symbol: str, task: asyncio.Task) -> (None):
+        """releases the ticker once its evaluation ended"""
+        self.tasks.discard(task)
+        self.busy.discard(symbol)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Evaluating %s failed: %s", symbol, task.exception())
+
+    def update_state(self, bar: Bar) -> (dict[str, float]|None):
+        """
+        Folds a minute bar into the hourly indicator state and returns the readings
+        as of this bar
+        """
+        symbol = bar.symbol
+        hour = bar.timestamp.replace(minute=0, second=0, microsecond=0)
+        state = self.states.setdefault(symbol, IndicatorState())
+        previous = self.running_hour.get(symbol)
+        if previous is not None and hour > previous:
+            state.update(self.running_close[symbol])
+        self.running_hour[symbol] = hour
+        self.running_close[symbol] = bar.close
+        return state.preview(bar.close)
+
+    def decide(self, symbol: str, price: float) -> (None):
+        """runs the sell rules for held tickers and the buy rules for the watchlist"""
+        if symbol in self.positions:
+            self.decide_sell(symbol, price)
+        elif symbol in self.watchlist and symbol not in self.bought:
+            if self.handler.indicator_signal(symbol) == "buy":
+                self.decide_buy(symbol)
+
+    def decide_buy(self, symbol: str) -> (None):
+        """
+        Places a buy order, orders are serialized to keep the allocation check correct.
+        The spend so far comes from the order book's fills. A ticker is bought
+        once per session, unless its order failed: then its next buy signal retries
+        """
+        with self.order_lock:
+            spent_already = self.handler.order_book.committed(
+                str(order.id) for order in self.orders["buy"])
+            if not self.execution.can_buy(spent_already):
+                logger.info("No funds left, ignoring buy signal for %s", symbol)
+                return
+            sized = self.execution.plan_buy(symbol)
+            if sized is None:
+                # no usable quote or no whole share affordable, skipped for the session
+                self.bought.add(symbol)
+                return
+            order_data, unitprice = sized
+            orders = self.execution.submit_buys([order_data], {symbol: unitprice}).orders
+            if not orders:
+                logger.warning("Buy order of %s failed, retrying on its next signal", symbol)
+                return
+            self.bought.add(symbol)
+            self.orders["buy"].append(orders[0])
+
+    def decide_sell(self, symbol: str, price: float) -> (None):
+        """sells a position if its live P&L or indicators give a sell signal"""
+        position = self.positions[symbol]
+        entry = float(position.avg_entry_price)
+        live = position.model_copy(
+            update={"unrealized_plpc": str(price / entry - 1.0) if entry else None})
+        if self.handler.sell_signal(live) != "sell":
+            return
+        with self.order_lock:
+            if self.positions.pop(symbol, None) is None:
+                return
+            orders = self.handler.execute_orders([
+                self.handler.create_order_data(symbol, position.qty_available, "sell")
+                ]).orders
+            if not orders:
+                # held again, so a later bar retries the sell
+                self.positions[symbol] = position
+                logger.warning("Sell order of %s failed, retrying on its next signal", symbol)
+                return
+            self.orders["sell"].append(orders[0])
+
+    def run(self) -> (None):
+        """prepares the symbols and streams them until the stream is stopped"""
+        symbols = self.prepare()
+        if not symbols:
+            logger.info("Nothing to stream")
+            return
+        self.listen(symbols)
+
+    def listen(self, symbols: list[str]) -> (None):
+        """subscribes to bars and quotes and blocks until the stream is stopped"""
+        self.stream.subscribe_quotes(self.on_quote, *symbols)
+        self.stream.subscribe_bars(self.on_bar, *symbols)
+        logger.info("Streaming %s symbols", len(symbols))
+        try:
+            self.stream.run()
+        finally:
+            for side, orders in self.orders.items():
+                self.execution.push_data(side, self.handler.order_book.latest(orders))
+
+    def stop(self) -> (None):
+        """stops the stream, run() returns once it has closed"""
+        self.stream.stop()
+
+
+def main():
+    trading = ClientInstance()
+    trading.trade_updates.start()
+    try:
+        StreamingStrategy(trading.strategyexec, trading.env_vars).run()
+    finally:
+        trading.trade_updates.stop()
+
+
+if __name__ == "__main__":
+    main()
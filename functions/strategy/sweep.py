@@ -0,0 +1,175 @@
+"""
+Module runs the backtester over many strategy parameter sets in parallel.
+
+The market data (bars and precomputed indicators) is placed in shared memory once,
+worker processes map it read-only instead of receiving a copy each. Every worker
+backtests one StrategyParams at a time and the results are collected into one
+columnar table, one row per parameter set.
+
+Usage: python -m functions.strategy.sweep BARS_PATH --param rsi_buy=30,35,40
+       --param take_profit=0.03,0.05 [--random 100] [--out sweep.parquet]
+"""
+import argparse
+import itertools
+import logging
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields, replace
+from multiprocessing import shared_memory, util
+import numpy as np
+import pandas as pd
+from .backtest import Backtester, MarketData, load_bars
+from .rules import StrategyParams, DEFAULT_PARAMS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PARAM_NAMES = tuple(field.name for field in fields(StrategyParams))
+
+
+def grid(space: dict[str, list[float]], base: StrategyParams = DEFAULT_PARAMS
+         ) -> (list[StrategyParams]):
+    """every combination of the given parameter values"""
+    names = list(space)
+    return [replace(base, **dict(zip(names, values)))
+            for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_search(space: dict[str, list[float]], samples: int, seed: int|None = None,
+                  base: StrategyParams = DEFAULT_PARAMS) -> (list[StrategyParams]):
+    """samples parameter sets uniformly between the smallest and largest given value"""
+    rng = random.Random(seed)
+    return [replace(base, **{name: rng.uniform(min(values), max(values))
+                             for name, values in space.items()})
+            for _ in range(samples)]
+
+
+class SharedMarketData():
+    """
+    Copies MarketData arrays into shared memory blocks once and describes
+    them so other processes can attach read-only views without copying
+    """
+    def __init__(self, data: MarketData):
+        self.blocks = []
+        self.spec = {"symbols": data.symbols, "arrays": {}}
+        arrays = dict(data.arrays, timestamps=data.timestamps)
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.spec["arrays"][name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self) -> (None):
+        """releases the shared memory blocks"""
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+_worker_data: MarketData|None = None
+_worker_blocks: list[shared_memory.SharedMemory] = []
+
+
+def attach(spec: dict) -> (MarketData):
+    """builds MarketData on read-only views of shared memory blocks"""
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec["arrays"].items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _worker_blocks.append(block)
+        view = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        view.flags.writeable = False
+        arrays[name] = view
+    timestamps = arrays.pop("timestamps")
+    return MarketData(spec["symbols"], timestamps, arrays)
+
+
+def init_worker(spec: dict) -> (None):
+    """
+    process pool initializer, attaches the shared market data once per worker
+    and detaches it again when the worker exits
+    """
+    global _worker_data
+    _worker_data = attach(spec)
+    # pool workers leave through os._exit, which skips atexit but runs these
+    util.Finalize(None, close_worker, exitpriority=10)
+
+
+def close_worker() -> (None):
+    """drops the worker's views and closes its handles on the shared memory blocks"""
+    global _worker_data
+    _worker_data = None
+    while _worker_blocks:
+        block = _worker_blocks.pop()
+        try:
+            block.close()
+        except BufferError as exc: # a view outlived the market data
+            logger.warning("Shared memory block %s still in use: %s", block.name, exc)
+
+
+def run_one(params: StrategyParams, options: dict) -> (dict):
+    """backtests one parameter set in a worker and returns a result row"""
+    result = Backtester(_worker_data, params, **options).run() # pyright: ignore
+    return {**params.as_dict(), **result.summary()}
+
+
+def run_sweep(data: MarketData, param_sets: list[StrategyParams], workers: int|None = None,
+              **options) -> (pd.DataFrame):
+    """
+    Backtests every parameter set across a process pool (all cores by default)
+    and returns the summary table sorted by total return
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(param_sets) // (8 * workers))
+    shared = SharedMarketData(data)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(shared.spec,)) as pool:
+            rows = list(pool.map(run_one, param_sets, itertools.repeat(options),
+                                 chunksize=chunksize))
+    finally:
+        shared.close()
+    summary = pd.DataFrame(rows)
+    if summary.empty:
+        return summary
+    return summary.sort_values("total_return", ascending=False, ignore_index=True)
+
+
+def parse_space(values: list[str]) -> (dict[str, list[float]]):
+    """parses name=v1,v2 command line arguments into a search space"""
+    space = {}
+    for value in values:
+        name, _, options = value.partition("=")
+        if name not in PARAM_NAMES:
+            raise ValueError(f"Unknown strategy parameter {name}, expected one of {PARAM_NAMES}")
+        space[name] = [float(option) for option in options.split(",")]
+    return space
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep strategy parameters over local bars")
+    parser.add_argument("path", help="CSV/Parquet bar file or directory of them")
+    parser.add_argument("--param", action="append", default=[], help="name=v1,v2,...")
+    parser.add_argument("--random", type=int, help="sample this many sets instead of the grid")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--benchmark", default="SPY")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--out", help="write the summary table (.parquet or .csv)")
+    args = parser.parse_args()
+
+    space = parse_space(args.param)
+    param_sets = (random_search(space, args.random, args.seed) if args.random
+                  else grid(space))
+    data = load_bars(args.path)
+    logger.info("Sweeping %s parameter sets over %s symbols", len(param_sets), len(data.symbols))
+    summary = run_sweep(data, param_sets, args.workers, benchmark=args.benchmark)
+    print(summary.head(20).to_string())
+    if args.out and args.out.endswith(".parquet"):
+        summary.to_parquet(args.out, index=False)
+    elif args.out:
+        summary.to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
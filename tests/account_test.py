@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+from fakes import FakeOrdersClient
+from strategy.account import AccountSnapshot
+from strategy import rules
+from strategy.main_strategy import StrategyHandler
+from strategy.rules import StrategyParams
+
+SECRET = {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret"}
+
+
+class ReportedCash():
+    """Alpaca account stand-in whose reported cash the test moves"""
+    def __init__(self, cash):
+        self.cash = cash
+        self.fetches = 0
+
+    def __call__(self):
+        self.fetches += 1
+        return SimpleNamespace(cash=str(self.cash))
+
+
+def test_resync_does_not_count_fills_alpaca_already_debited():
+    alpaca = ReportedCash(100000.0)
+    snapshot = AccountSnapshot(alpaca, max_age=0)
+    snapshot.current()
+    snapshot.reserve("a", 500.0)
+    snapshot.settle("a", 300.0, remaining=200.0)  # 300 filled, 200 still open
+    assert snapshot.cash == 100000 - 500
+
+    alpaca.cash -= 300.0  # Alpaca books the fill
+    assert snapshot.current().cash == 100000 - 300 - 200
+    snapshot.settle("a", 480.0)  # the rest fills at a better price
+    assert snapshot.cash == 100000 - 480
+    assert snapshot.opening_cash == 100000
+    assert alpaca.fetches == 2
+
+    snapshot.reset()
+    assert snapshot.current().cash == snapshot.opening_cash == 100000 - 300
+
+
+def test_allocation_is_checked_against_the_opening_cash():
+    handler = StrategyHandler(FakeOrdersClient([]), SECRET)
+    handler.account.current()
+    # the run's own reservations lower the available cash, not the allocation
+    handler.account.reserve("a", 1980.0)
+    assert handler.account.cash == 100000 - 1980
+    assert handler.check_if_buy(1980.0, handler.account)
+    assert not handler.check_if_buy(2000.0, handler.account)
+
+
+def test_live_buy_check_uses_the_shared_rules():
+    params = StrategyParams(min_cash=99000.0, allocation_limit=0.02)
+    handler = StrategyHandler(FakeOrdersClient([]), SECRET, params=params)
+    account = handler.account.current()
+    for spent in (0.0, 500.0, 1980.0, 2500.0):
+        assert handler.check_if_buy(spent, account) == bool(rules.can_buy(100000.0, spent, params))
+    # the PDT minimum has to hold after the run's spend
+    assert handler.check_if_buy(500.0, account) and not handler.check_if_buy(1980.0, account)
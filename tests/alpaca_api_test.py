@@ -0,0 +1,83 @@
+import time
+import requests
+from fakes import FakeDataSession, FakeOrdersClient
+from strategy import main_strategy
+from strategy.api_integrations import alpaca_api
+
+SECRET = {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret", "FMP_KEY": "fmp"}
+
+
+def quote(ask):
+    return {"ap": ask, "bp": ask - 0.01, "as": 1, "bs": 1}
+
+
+def test_latest_quotes_are_fetched_in_one_request():
+    session = FakeDataSession({"AAA": quote(1.0), "BBB": quote(2.0)})
+    quotes = alpaca_api.get_latest_quotes(["aaa", "bbb", "ccc"], session)
+    assert quotes == {"AAA": quote(1.0), "BBB": quote(2.0)}
+    assert session.requests == [("quotes/latest", {"symbols": "AAA,BBB,CCC", "feed": "iex"})]
+
+
+def test_handler_refetches_only_quotes_past_their_ttl():
+    handler = main_strategy.StrategyHandler(FakeOrdersClient([]), SECRET)
+    handler.session = FakeDataSession({"AAA": quote(1.0), "BBB": quote(2.0), "CCC": quote(3.0)})
+    assert set(handler.get_quotes(["AAA", "BBB"])) == {"AAA", "BBB"}
+    # every ticker still fresh: served from the cache without a request
+    assert handler.get_quotes(["aaa"]) == {"AAA": quote(1.0)}
+    assert len(handler.session.requests) == 1
+
+    fetched, cached = handler.quote_cache["BBB"]
+    handler.quote_cache["BBB"] = (fetched - main_strategy.QUOTE_TTL, cached)
+    handler.session.quotes["BBB"] = quote(2.5)
+    before = time.monotonic()
+    quotes = handler.get_quotes(["AAA", "BBB", "CCC"])
+    assert quotes["BBB"] == quote(2.5) and quotes["AAA"] == quote(1.0)
+    assert handler.session.requests[-1][1]["symbols"] == "BBB,CCC"
+    assert handler.quote_cache["BBB"][0] >= before
+
+
+class TimedOutSession():
+    def get(self, url, params=None, timeout=None):
+        raise requests.Timeout("read timed out")
+
+
+def test_bar_fetch_timeout_falls_back_to_polygon():
+    handler = main_strategy.StrategyHandler(FakeOrdersClient([]), SECRET)
+    handler.session = TimedOutSession()
+    handler.load_indicators(["AAA"])
+    assert handler.indicator_cache == {}
+
+
+def test_quote_fetch_timeout_leaves_tickers_without_quotes():
+    execution = main_strategy.StrategyExecution(FakeOrdersClient([]), SECRET)
+    execution.strategy_handler.session = TimedOutSession()
+    assert execution.strategy_handler.get_quotes(["AAA", "BBB"]) == {}
+    assert execution.plan_buy("aaa") is None
+
+
+def test_watchlist_reuses_the_strategy_data_session(monkeypatch):
+    created = []
+    create_session = alpaca_api.create_session
+    monkeypatch.setattr(alpaca_api, "create_session",
+                        lambda secret: created.append(secret) or create_session(secret))
+    execution = main_strategy.StrategyExecution(FakeOrdersClient([]), SECRET)
+    watchlist = execution.watchlist_handler
+    assert watchlist.session is execution.strategy_handler.session and len(created) == 1
+
+    watchlist.session = FakeDataSession()
+    stocks = [{"symbol": "AAA", "price": 10.0}, {"symbol": "BBB", "price": 20.0}]
+    watchlist.approve_watchlist(stocks)
+    watchlist.approve_watchlist(stocks)
+    assert [path for path, _ in watchlist.session.requests] == ["stocks/snapshots"] * 2
+    assert len(created) == 1
+
+
+def test_buys_skip_tickers_without_a_usable_quote():
+    execution = main_strategy.StrategyExecution(FakeOrdersClient([]), SECRET)
+    handler = execution.strategy_handler
+    handler.session = FakeDataSession({"AAA": quote(10.0), "ZERO": quote(0.0)})
+    assert execution.plan_buy("halted") is None
+    assert execution.plan_buy("zero") is None
+    assert handler.account.pending == {}
+    order_data, price = execution.plan_buy("aaa")
+    assert price == 10.0 and list(handler.account.pending) == [order_data.client_order_id]
@@ -0,0 +1,84 @@
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from fakes import FakeOrdersClient, make_order
+from strategy import archive
+
+
+def test_archive_stores_accounts_and_orders_by_day(tmp_path):
+    store = archive.PortfolioArchive(str(tmp_path))
+    today = datetime.now(timezone.utc).date()
+    for offset, equity in ((2, 100.0), (1, 110.0)):
+        day = today - timedelta(days=offset)
+        store.write("accounts", day, "default", pa.Table.from_pydict(
+            {"date": [day], "portfolio": ["default"], "captured_at": [datetime.now(timezone.utc)],
+             **{name: [equity] for name in archive.ACCOUNT_FIELDS}},
+            schema=archive.schemas()["accounts"]))
+    account = FakeOrdersClient([]).get_account()
+    account.equity = "121"
+    assert store.append_account(account)
+    assert store.append_account(account)  # a rerun replaces the day's snapshot
+    curve = store.equity_curve()
+    assert curve["equity"].tolist() == [100.0, 110.0, 121.0]
+    assert len(store.equity_curve(start=today)) == 1
+
+    now = datetime.now(timezone.utc)
+    buy = make_order(now - timedelta(days=1), symbol="AAA", qty="10", filled_avg_price="5")
+    orders = [buy, make_order(now, symbol="AAA", side="sell", qty="4", filled_avg_price="6"),
+              make_order(now, symbol="BBB", qty="2", filled_avg_price="10"),
+              make_order(now, symbol="BBB", status="canceled", qty="7")]
+    assert store.append_orders(orders[:2]) == 2
+    assert store.append_orders(orders[1:]) == 3  # the sell again is stored once
+    assert store.scan("orders").num_rows == 4
+    assert store.scan("orders", start=now.date()).num_rows == 3
+
+    pnl = store.symbol_pnl(marks={"AAA": 7.0}).set_index("symbol")
+    assert pnl.loc["AAA", "held_qty"] == 6
+    assert pnl.loc["AAA", "pnl"] == 24 - 50 + 42
+    assert np.isnan(pnl.loc["BBB", "pnl"])  # no mark for the shares still held
+
+
+def test_compare_to_benchmark_carries_the_last_close():
+    curve = pd.DataFrame({"date": pd.to_datetime(["2024-01-02", "2024-01-03", "2024-01-04"]),
+                          "equity": [100.0, 110.0, 99.0]})
+    spy = pd.Series([400.0, 420.0], index=pd.to_datetime(["2024-01-01", "2024-01-03"]))
+    frame = archive.compare_to_benchmark(curve, spy)
+    assert frame["benchmark"].tolist() == [400.0, 420.0, 420.0]
+    assert np.allclose(frame["excess_cumulative"], [0.0, 0.05, -0.06])
+
+
+def test_archive_logs_orders_it_cannot_store(tmp_path, caplog):
+    store = archive.PortfolioArchive(str(tmp_path))
+    now = datetime.now(timezone.utc)
+    yesterday = now - timedelta(days=1)
+    good = make_order(now, qty="1", filled_avg_price="5")
+    undated = SimpleNamespace(id="undated", symbol="AAA", side="buy", type="market",
+                              status="filled", qty="1", filled_qty="1", filled_avg_price="5",
+                              notional=None, submitted_at=None, filled_at=None)
+    # pyarrow rejects the string in the timestamp column of yesterday's partition
+    mistyped = SimpleNamespace(**{**vars(undated), "id": "mistyped", "filled_at": yesterday,
+                                  "submitted_at": "yesterday"})
+    broken = SimpleNamespace(**{**vars(undated), "id": "broken", "filled_at": "today"})
+
+    assert store.append_orders([good, undated, mistyped, broken]) == 2
+    assert sorted(store.scan("orders", start=now.date()).column("id").to_pylist()) == \
+        sorted([str(good.id), "undated"])
+    assert "Failed to archive the orders of" in caplog.text
+    assert "Not archiving order broken" in caplog.text
+    # a failing write of the account snapshot only logs too
+    store.write = lambda *args: (_ for _ in ()).throw(TypeError("unsupported"))
+    assert not store.append_account(FakeOrdersClient([]).get_account())
+
+
+def test_archive_needs_a_configured_root(monkeypatch, tmp_path, caplog):
+    archive.get_archive.cache_clear()
+    monkeypatch.setattr(archive, "ARCHIVE_ROOT", None)
+    assert archive.get_archive() is None
+    assert archive.get_archive() is None
+    assert caplog.text.count("PORTFOLIO_ARCHIVE is not set") == 1
+    archive.get_archive.cache_clear()
+    monkeypatch.setattr(archive, "ARCHIVE_ROOT", str(tmp_path))
+    assert archive.get_archive().root == str(tmp_path)
+    archive.get_archive.cache_clear()
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from strategy import backtest
+from strategy.rules import StrategyParams
+
+
+def hourly_sessions(days):
+    index = pd.date_range("2024-01-02", periods=days, freq="B")
+    hours = [day + pd.Timedelta(hours=hour) for day in index for hour in range(15, 21)]
+    return pd.DatetimeIndex(hours).to_numpy()
+
+
+def test_backtest_trades_rules_and_tracks_benchmark(tmp_path):
+    timestamps = hourly_sessions(60)
+    rng = np.random.default_rng(7)
+    close = 40 * np.exp(np.cumsum(rng.normal(0, 0.02, (20, timestamps.size)), axis=1))
+    symbols = [f"S{i}" for i in range(19)] + ["SPY"]
+    frame = pd.DataFrame({
+        "timestamp": np.tile(timestamps, len(symbols)),
+        "symbol": np.repeat(symbols, timestamps.size),
+        "close": close.ravel(),
+        "volume": 1000.0,
+    })
+    frame.to_csv(tmp_path / "bars.csv", index=False)
+
+    data = backtest.load_bars(str(tmp_path / "bars.csv"))
+    result = backtest.Backtester(data, benchmark="SPY").run()
+
+    assert result.equity.size == 60
+    assert result.benchmark[0] == 100000.0
+    assert not result.trades.empty
+    assert "SPY" not in set(result.trades["symbol"])
+    assert set(result.trades["side"]) <= {"buy", "sell"}
+
+
+def test_backtest_keeps_cash_below_pdt_minimum():
+    timestamps = hourly_sessions(40)
+    close = np.linspace(10, 5, timestamps.size)[None, :] * np.ones((3, 1))
+    data = backtest.MarketData.from_closes(["A", "B", "C"], timestamps, close)
+    result = backtest.Backtester(data, params=StrategyParams(min_cash=1e9)).run()
+
+    assert result.trades.empty
+    assert np.all(result.equity == 100000.0)
@@ -0,0 +1,74 @@
+import uuid
+import requests
+from datetime import datetime, timedelta, timezone
+from alpaca.common.exceptions import APIError
+from alpaca.trading.models import Order
+from strategy import bulk_orders
+from strategy.main_strategy import StrategyHandler
+
+SUBMITTED = datetime(2024, 3, 1, 15, tzinfo=timezone.utc)
+
+
+class FakeTradingClient():
+    """Accepts every order except symbol BAD, get_orders serves the filled versions"""
+    def __init__(self):
+        self.orders = []
+        self.pages = []
+
+    def submit_order(self, order_data):
+        if order_data.symbol == "BAD":
+            raise APIError('{"message": "insufficient buying power"}')
+        order = Order(
+            id=uuid.uuid4(), client_order_id=order_data.client_order_id,
+            created_at=SUBMITTED, updated_at=SUBMITTED,
+            submitted_at=SUBMITTED + timedelta(seconds=len(self.orders)),
+            order_class="simple", time_in_force="day", status="accepted",
+            extended_hours=False, symbol=order_data.symbol, qty=str(order_data.qty),
+            filled_qty="0", side=order_data.side, type="market")
+        self.orders.append(order)
+        return order
+
+    def get_orders(self, filter):
+        self.pages.append(filter)
+        matching = [order for order in self.orders if order.submitted_at > filter.after]
+        return [order.model_copy(update={
+            "status": "filled", "filled_qty": order.qty, "filled_avg_price": "10.5",
+            "updated_at": SUBMITTED + timedelta(minutes=1)}) for order in matching[:filter.limit]]
+
+
+def test_batch_reports_outcomes_after_paginated_reconcile():
+    client = FakeTradingClient()
+    handler = StrategyHandler(client, {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret"})
+    requests = [handler.create_order_data(symbol, 2, "buy") for symbol in ("AAA", "BAD", "CCC", "DDD")]
+
+    result = bulk_orders.submit_batch(handler.execute_order, requests)
+    bulk_orders.reconcile(client, result, page_limit=2)
+
+    assert [outcome.symbol for outcome in result.outcomes] == ["AAA", "BAD", "CCC", "DDD"]
+    assert len(client.pages) == 2
+    bad = result.outcomes[1]
+    assert bad.status == "failed" and "buying power" in bad.error and bad.order is None
+    for outcome in result.outcomes[:1] + result.outcomes[2:]:
+        assert outcome.status == "filled"
+        assert outcome.filled_qty == 2 and outcome.filled_avg_price == 10.5
+        assert outcome.latency > 0
+    summary = result.summary()
+    assert summary["filled"] == 3 and summary["failed"] == 1 and summary["orders"] == 4
+    assert handler.order_book.committed(str(order.id) for order in result.orders) == 0.0
+    for order in result.orders:
+        handler.order_book.refresh(order)
+    assert handler.order_book.committed(str(order.id) for order in result.orders) == 3 * 21.0
+
+
+def test_batch_records_every_kind_of_submit_error():
+    handler = StrategyHandler(FakeTradingClient(), {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret"})
+    errors = {"AAA": requests.ConnectionError("connection reset"),
+              "BBB": ValueError("response failed validation")}
+
+    def submit(order_data):
+        raise errors[order_data.symbol]
+
+    result = bulk_orders.submit_batch(
+        submit, [handler.create_order_data(symbol, 1, "buy") for symbol in errors])
+    assert [(outcome.status, outcome.error) for outcome in result.outcomes] == [
+        ("failed", "connection reset"), ("failed", "response failed validation")]
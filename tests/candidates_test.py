@@ -0,0 +1,35 @@
+import numpy as np
+from strategy import candidates
+
+
+def snapshot(volume, bid, ask):
+    return {"dailyBar": {"v": volume}, "latestQuote": {"bp": bid, "ap": ask}}
+
+
+def test_feeds_are_merged_filtered_and_ranked():
+    actives = [{"symbol": "AAA", "price": 10.0, "changesPercentage": 1.0},
+               {"symbol": "BBB", "price": 20.0, "changesPercentage": -2.0},
+               {"symbol": "WIDE", "price": 5.0, "changesPercentage": 0.5},
+               {"symbol": "PRICY", "price": 9000.0, "changesPercentage": 0.1}]
+    gainers = [{"symbol": "bbb", "price": 21.0, "changesPercentage": 9.0},
+               {"symbol": "THIN", "price": 3.0, "changesPercentage": 30.0},
+               {"symbol": "NEW", "price": 4.0, "changesPercentage": 12.0}]
+    table = candidates.CandidateTable.from_feeds([actives, gainers])
+    assert list(table.symbols) == ["AAA", "BBB", "WIDE", "PRICY", "THIN", "NEW"]
+    assert table.columns["price"][1] == 20.0  # the first feed wins
+
+    table.add_snapshots({"AAA": snapshot(500_000, 9.99, 10.01), "BBB": snapshot(1_000_000, 19.99, 20.01),
+                         "WIDE": snapshot(1_000_000, 4.5, 5.5), "THIN": snapshot(10, 2.99, 3.01)})
+    ranked = candidates.rank(table, 3, max_price=5000.0, min_dollar_volume=1_000_000.0,
+                             max_spread=0.01)
+    # NEW has no snapshot, it passes the filters but ranks after the known volumes
+    assert [record["symbol"] for record in ranked.records()] == ["BBB", "AAA", "NEW"]
+    assert "volume" not in ranked.records()[2]
+
+
+def test_top_keeps_feed_order_for_ties():
+    table = candidates.CandidateTable(np.array(list("ABCDE")),
+                                      {"price": np.ones(5)})
+    score = np.array([1.0, np.nan, 3.0, 1.0, 1.0])
+    assert table.top(score, 3).tolist() == [2, 0, 3]
+    assert table.top(score, 10).tolist() == [2, 0, 3, 4, 1]
@@ -0,0 +1,39 @@
+from strategy import main_strategy
+
+
+class FakeListener():
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeClientInstance():
+    def __init__(self, env_vars):
+        self.env_vars = env_vars
+        self.trade_updates = FakeListener()
+
+
+def test_instance_is_reused_until_the_env_file_rotates_a_secret(monkeypatch, tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text("ALPACA_KEY=old\nALPACA_SECRET=secret\n")
+    for name in ("ALPACA_KEY", "ALPACA_SECRET", "MASSIVE_API_KEY"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("FMP_KEY", "from-process")
+    monkeypatch.setattr(main_strategy, "PROCESS_ENV", frozenset({"FMP_KEY"}))
+    monkeypatch.setattr(main_strategy, "find_dotenv", lambda: str(env_file))
+    monkeypatch.setattr(main_strategy, "ClientInstance", FakeClientInstance)
+    monkeypatch.setattr(main_strategy, "_instance", None)
+
+    first = main_strategy.get_client_instance()
+    assert main_strategy.get_client_instance() is first
+    assert first.env_vars["ALPACA_KEY"] == "old"
+
+    env_file.write_text("ALPACA_KEY=new\nALPACA_SECRET=secret\nFMP_KEY=from-file\n")
+    second = main_strategy.get_client_instance()
+    assert second is not first and first.trade_updates.stopped
+    assert second.env_vars["ALPACA_KEY"] == "new"
+    # variables the process was started with win over the file
+    assert second.env_vars["FMP_KEY"] == "from-process"
+    assert main_strategy.get_client_instance() is second
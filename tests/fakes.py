@@ -0,0 +1,254 @@
+"""In-memory stand-ins for external services used by the tests"""
+import asyncio
+import json
+import threading
+import uuid
+import msgpack
+import requests
+from alpaca.trading.models import Order, TradeAccount
+from websockets.asyncio.server import serve
+
+
+class FakeSnapshot():
+    def __init__(self, data):
+        self.data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return self.data
+
+
+class FakeDocument():
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def set(self, data):
+        self.store.writes += 1
+        self.store.documents[self.path] = dict(data)
+
+    def get(self):
+        return FakeSnapshot(self.store.documents.get(self.path))
+
+    def collection(self, name):
+        return FakeCollection(self.store, f"{self.path}/{name}")
+
+
+class FakeCollection():
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+
+    def document(self, doc_id):
+        return FakeDocument(self.store, f"{self.path}/{doc_id}")
+
+    def add(self, data):
+        self.store.auto_id += 1
+        self.document(f"auto-{self.store.auto_id}").set(data)
+
+    def stream(self):
+        prefix = f"{self.path}/"
+        return [data for path, data in self.store.documents.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]]
+
+
+class FakeBatch():
+    def __init__(self, store):
+        self.store = store
+        self.operations = []
+
+    def set(self, ref, data):
+        if len(self.operations) >= 500:
+            raise ValueError("Batch exceeds the Firestore 500 operation limit")
+        self.operations.append((ref, data))
+
+    def commit(self):
+        self.store.commits += 1
+        for ref, data in self.operations:
+            ref.set(data)
+
+
+class FakeFirestore():
+    """Minimal Firestore client that keeps documents in a dict keyed by path"""
+    def __init__(self):
+        self.documents = {}
+        self.writes = 0
+        self.commits = 0
+        self.auto_id = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def document(self, path):
+        return FakeDocument(self, path)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+class AlpacaStreamStandIn():
+    """
+    Local websocket server speaking the Alpaca market data stream protocol (msgpack):
+    connect, auth, subscribe, then it sends the given messages one frame each
+    """
+    def __init__(self, messages):
+        self.messages = messages
+        self.subscriptions = []
+        self.url = None
+        self.loop = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    async def handle(self, websocket):
+        await websocket.send(msgpack.packb([{"T": "success", "msg": "connected"}]))
+        msgpack.unpackb(await websocket.recv())
+        await websocket.send(msgpack.packb([{"T": "success", "msg": "authenticated"}]))
+        subscription = msgpack.unpackb(await websocket.recv())
+        self.subscriptions.append(subscription)
+        await websocket.send(msgpack.packb([{"T": "subscription", **{
+            channel: subscription.get(channel, []) for channel in ("bars", "quotes", "trades")}}]))
+        for message in self.messages:
+            await websocket.send(msgpack.packb([message]))
+        await websocket.wait_closed()
+
+    def serve_forever(self):
+        async def main():
+            self.loop = asyncio.get_running_loop()
+            self.stopped = asyncio.Event()
+            async with serve(self.handle, "127.0.0.1", 0) as server:
+                port = list(server.sockets)[0].getsockname()[1]
+                self.url = f"ws://127.0.0.1:{port}"
+                self.ready.set()
+                await self.stopped.wait()
+        asyncio.run(main())
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait(5)
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.thread.join(5)
+
+
+class TradingStreamStandIn(AlpacaStreamStandIn):
+    """
+    Local websocket server speaking the Alpaca trade updates protocol (JSON): auth,
+    listen, then it confirms the subscription once `confirm` is set and drops
+    the connection once `drop` is set. A later listen is answered with the
+    `pending` updates, the ones a frozen client hasn't read yet, then a confirmation
+    """
+    def __init__(self):
+        super().__init__([])
+        self.confirm = threading.Event()
+        self.drop = threading.Event()
+        self.pending: list[dict] = []
+
+    async def handle(self, websocket):
+        listening = json.dumps({"stream": "listening", "data": {"streams": ["trade_updates"]}})
+        json.loads(await websocket.recv())
+        await websocket.send(json.dumps({"stream": "authorization",
+                                         "data": {"status": "authorized"}}))
+        self.subscriptions.append(json.loads(await websocket.recv()))
+        await asyncio.to_thread(self.confirm.wait, 5)
+        await websocket.send(listening)
+        deadline = asyncio.get_running_loop().time() + 5
+        while not self.drop.is_set() and asyncio.get_running_loop().time() < deadline:
+            try:
+                message = await asyncio.wait_for(websocket.recv(), 0.05)
+            except asyncio.TimeoutError:
+                continue
+            self.subscriptions.append(json.loads(message))
+            while self.pending:
+                await websocket.send(json.dumps(self.pending.pop(0)))
+            await websocket.send(listening)
+        await websocket.close()
+
+
+def stream_bar(symbol, close, timestamp):
+    return {"T": "b", "S": symbol, "o": close, "h": close, "l": close, "c": close, "v": 100,
+            "n": 1, "vw": close, "t": msgpack.Timestamp.from_datetime(timestamp)}
+
+
+def stream_quote(symbol, ask, bid, timestamp):
+    return {"T": "q", "S": symbol, "ap": ask, "as": 1, "ax": "V", "bp": bid, "bs": 1, "bx": "V",
+            "c": ["R"], "z": "C", "t": msgpack.Timestamp.from_datetime(timestamp)}
+
+
+def make_order(submitted_at, status="filled", symbol="AAA", side="buy", qty="1", **fields):
+    """Alpaca Order model with the required fields filled in"""
+    return Order(**{
+        "id": uuid.uuid4(), "client_order_id": str(uuid.uuid4()), "created_at": submitted_at,
+        "updated_at": submitted_at, "submitted_at": submitted_at, "order_class": "simple",
+        "time_in_force": "day", "status": status, "extended_hours": False, "symbol": symbol,
+        "qty": qty, "filled_qty": qty if status == "filled" else "0", "side": side,
+        "type": "market", **fields,
+        })
+
+
+class FakeOrdersClient():
+    """Serves get_orders from a list of orders like Alpaca does: filtered, sorted, capped"""
+    def __init__(self, orders):
+        self.orders = orders
+        self.requests = []
+
+    def get_account(self):
+        return TradeAccount(id=uuid.uuid4(), account_number="PA1", status="ACTIVE", cash="100000")
+
+    def get_orders(self, filter):
+        self.requests.append(filter)
+        closed = {"filled", "canceled", "expired", "rejected", "replaced", "done_for_day"}
+        orders = [order for order in self.orders
+                  if (filter.after is None or order.submitted_at > filter.after)
+                  and (filter.status in (None, "all")
+                       or (filter.status == "closed") == (order.status.value in closed))]
+        orders.sort(key=lambda order: order.submitted_at, reverse=filter.direction != "asc")
+        return orders[:filter.limit]
+
+
+class FakeResponse():
+    """requests.Response stand-in with a JSON body"""
+    def __init__(self, payload, status_code=200, headers=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(payload).encode("utf-8")
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+
+class FakeDataSession():
+    """
+    Serves the Alpaca data API's latest quotes and bars endpoints from canned
+    quotes and bars like the real API: only the requested symbols, bars from
+    `start` on. Records the path and parameters of every request
+    """
+    def __init__(self, quotes=None, bars=None):
+        self.quotes = quotes or {}
+        self.bars = bars or {}
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        path = url.rsplit("/", 2)[-2:]
+        self.requests.append(("/".join(path), dict(params or {})))
+        symbols = params["symbols"].split(",")
+        if path[-1] == "latest":
+            return FakeResponse({"quotes": {symbol: self.quotes[symbol] for symbol in symbols
+                                            if symbol in self.quotes}})
+        if path[-1] == "bars":
+            return FakeResponse({"bars": {symbol: [bar for bar in self.bars[symbol]
+                                                   if bar["t"] >= params["start"]]
+                                          for symbol in symbols if symbol in self.bars},
+                                 "next_page_token": None})
+        return FakeResponse({"message": "not found"}, 404)
@@ -0,0 +1,53 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from fakes import FakeFirestore, make_order
+from strategy import firestore_db
+
+
+class FakeOrder():
+    def __init__(self, symbol):
+        self.id = uuid.uuid4()
+        self.symbol = symbol
+
+
+def test_push_order_batches_and_is_idempotent():
+    client = FakeFirestore()
+    orders = [FakeOrder(f"T{i}") for i in range(1200)]
+
+    firestore_db.push_order(orders, client)
+    firestore_db.push_order(orders, client)
+
+    stored = client.collection("orders").document(str(datetime.now(timezone.utc).date())).collection("orders").stream()
+    assert len(stored) == 1200
+    assert client.commits == 6
+    assert all(isinstance(data["id"], str) for data in stored)
+
+
+def test_document_id_without_order_id_is_stable():
+    data = {"symbol": "ABC", "qty": "1"}
+    assert firestore_db.document_id(data) == firestore_db.document_id(dict(data))
+    assert firestore_db.document_id({"id": "xyz"}) == "xyz"
+
+
+def test_exported_orders_are_filed_under_their_own_day():
+    client = FakeFirestore()
+    yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+    late = make_order(yesterday, filled_at=yesterday)
+    fresh = make_order(datetime.now(timezone.utc))
+
+    firestore_db.push_order([late], client)
+    firestore_db.push_order([late, fresh], client)  # resumed export sees the boundary order again
+
+    def stored(day):
+        return client.collection("orders").document(str(day)).collection("orders").stream()
+    assert [data["id"] for data in stored(yesterday.date())] == [str(late.id)]
+    assert [data["id"] for data in stored(datetime.now(timezone.utc).date())] == [str(fresh.id)]
+
+
+def test_failed_checkpoint_write_is_logged(monkeypatch, caplog):
+    def deliver(documents, client=None, barrier=False):
+        raise firestore_db.write_errors()[1]("firestore is down")
+
+    monkeypatch.setattr(firestore_db, "deliver", deliver)
+    firestore_db.set_checkpoint("orders", datetime.now(timezone.utc))
+    assert "Failed to store the orders export checkpoint" in caplog.text
@@ -0,0 +1,84 @@
+import numpy as np
+from strategy import indicators
+
+
+def reference_ema(values, window):
+    alpha = 2.0 / (window + 1)
+    out = [None] * len(values)
+    state = sum(values[:window]) / window
+    out[window - 1] = state
+    for i in range(window, len(values)):
+        state += alpha * (values[i] - state)
+        out[i] = state
+    return out
+
+
+def reference_rsi(closes, window):
+    deltas = [b - a for a, b in zip(closes, closes[1:])]
+    gain = sum(max(d, 0) for d in deltas[:window]) / window
+    loss = sum(max(-d, 0) for d in deltas[:window]) / window
+    for d in deltas[window:]:
+        gain = (gain * (window - 1) + max(d, 0)) / window
+        loss = (loss * (window - 1) + max(-d, 0)) / window
+    return 100.0 if loss == 0 else 100.0 - 100.0 / (1.0 + gain / loss)
+
+
+def random_closes(seed, length):
+    rng = np.random.default_rng(seed)
+    return list(100 + np.cumsum(rng.normal(0, 1, length)))
+
+
+def test_ema_matches_reference():
+    closes = random_closes(0, 60)
+    result = indicators.ema(np.array([closes]), 12)[0]
+    expected = reference_ema(closes, 12)
+    assert np.isnan(result[:11]).all()
+    np.testing.assert_allclose(result[11:], expected[11:])
+
+
+def test_latest_indicators_matches_reference_per_ticker():
+    bars = {"AAA": random_closes(1, 120), "BBB": random_closes(2, 80), "CCC": random_closes(3, 40)}
+    readings = indicators.latest_indicators(bars)
+    for symbol, closes in bars.items():
+        short = reference_ema(closes, 12)
+        long = reference_ema(closes, 26)
+        line = [s - l for s, l in zip(short[25:], long[25:])]
+        signal = reference_ema(line, 9)[-1]
+        assert np.isclose(readings[symbol]["rsi"], reference_rsi(closes, 3))
+        assert np.isclose(readings[symbol]["macd"], line[-1])
+        assert np.isclose(readings[symbol]["signal"], signal)
+        assert np.isclose(readings[symbol]["hist"], line[-1] - signal)
+
+
+def test_short_history_is_left_out():
+    readings = indicators.latest_indicators({"NEW": random_closes(4, 20), "OLD": random_closes(5, 50)})
+    assert "NEW" not in readings
+    assert "OLD" in readings
+
+
+def test_rsi_without_losses_is_100():
+    closes = np.array([[1.0, 2.0, 3.0, 4.0, 5.0]])
+    assert indicators.rsi(closes)[0, -1] == 100.0
+
+
+def test_incremental_states_match_full_recompute(tmp_path):
+    bars = {"AAA": random_closes(6, 80), "BBB": random_closes(7, 60), "NEW": random_closes(8, 10)}
+    book = indicators.IndicatorBook.from_history({s: closes[:-5] for s, closes in bars.items()})
+    states = {s: indicators.IndicatorState.from_history(closes[:-5]) for s, closes in bars.items()}
+    for step in range(-5, 0):
+        closes = {s: series[step] for s, series in bars.items()}
+        preview = book.preview(closes)
+        book.update(closes)
+        assert preview == book.readings()
+        for symbol, close in closes.items():
+            assert states[symbol].preview(close) == states[symbol].update(close).reading()
+
+    expected = indicators.latest_indicators(bars)
+    book.save(str(tmp_path / "book.npz"))
+    restored = indicators.IndicatorBook.load(str(tmp_path / "book.npz"))
+    assert set(restored.readings()) == set(expected) == {"AAA", "BBB"}
+    for symbol, reading in expected.items():
+        state = indicators.IndicatorState(*states[symbol].as_tuple())
+        for key, value in reading.items():
+            assert np.isclose(restored.readings()[symbol][key], value)
+            assert np.isclose(state.reading()[key], value)
@@ -0,0 +1,81 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from fakes import FakeDataSession, FakeOrdersClient
+from strategy import market_cache
+from strategy.main_strategy import StrategyHandler
+
+SECRET = {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret"}
+
+
+def age(cache, key, suffix, seconds):
+    path = cache.path(key, suffix)
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_entries_expire_after_their_ttl(tmp_path):
+    cache = market_cache.MarketCache(str(tmp_path))
+    bars, feed = ("alpaca", "AAA", "1Hour", 30, "d"), ("fmp", "actives", "day", 0, "d")
+    cache.put(bars, np.arange(4.0))
+    cache.put(feed, [{"symbol": "AAA"}])
+    assert cache.get(bars, 60).tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert cache.get(feed, 60) == [{"symbol": "AAA"}]
+
+    age(cache, bars, ".npy", 120)
+    age(cache, feed, ".json", 30)
+    assert cache.get(bars, 60) is None
+    assert cache.get(feed, 60) == [{"symbol": "AAA"}]
+
+
+def test_eviction_drops_the_least_recently_read_entries(tmp_path):
+    cache = market_cache.MarketCache(str(tmp_path), max_bytes=2500)
+    keys = [("alpaca", symbol, "1Hour", 30, "d") for symbol in ("AAA", "BBB", "CCC")]
+    for offset, key in enumerate(keys):
+        cache.put(key, np.zeros(100))  # ~900 bytes each
+        age(cache, key, ".npy", 300 - offset)
+    cache.get(keys[0], 3600)  # AAA is read last, BBB is now the oldest
+
+    assert cache.evict() == 1
+    assert cache.get(keys[1], 3600) is None
+    assert cache.get(keys[0], 3600) is not None and cache.get(keys[2], 3600) is not None
+
+
+def test_failed_writes_leave_no_temp_files(tmp_path, monkeypatch):
+    cache = market_cache.MarketCache(str(tmp_path))
+    bars, feed = ("alpaca", "AAA", "1Hour", 30, "d"), ("fmp", "actives", "day", 0, "d")
+
+    def disk_full(file, value, allow_pickle=True):
+        file.write(b"partial")
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(market_cache.np, "save", disk_full)
+    cache.put(bars, np.arange(4.0))
+    monkeypatch.undo()
+    cache.put(feed, {("AAA", "BBB"): 1})  # JSON objects only take string keys
+    assert [files for _, _, files in os.walk(tmp_path) if files] == []
+    assert cache.get(bars, 60) is None and cache.get(feed, 60) is None
+
+
+def hourly_bar(stamp, close):
+    return {"t": stamp.strftime("%Y-%m-%dT%H:%M:%SZ"), "o": close, "h": close, "l": close,
+            "c": close, "v": 100}
+
+
+def test_bar_history_only_fetches_bars_after_the_cached_ones(tmp_path, monkeypatch):
+    monkeypatch.setattr(market_cache, "get_cache", lambda: market_cache.MarketCache(str(tmp_path)))
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    stamps = [hour - timedelta(hours=offset) for offset in range(4, 0, -1)]
+    session = FakeDataSession(bars={"AAA": [hourly_bar(stamp, 10.0 + i)
+                                            for i, stamp in enumerate(stamps)]})
+    handler = StrategyHandler(FakeOrdersClient([]), SECRET)
+    handler.session = session
+    assert handler.bar_history(["aaa"]) == {"AAA": [10.0, 11.0, 12.0, 13.0]}
+
+    # the last bar was still forming and a new one closed since
+    session.bars["AAA"][-1] = hourly_bar(stamps[-1], 13.5)
+    session.bars["AAA"].append(hourly_bar(hour, 14.0))
+    assert handler.bar_history(["AAA"]) == {"AAA": [10.0, 11.0, 12.0, 13.5, 14.0]}
+    assert session.requests[-1][1]["start"] == hourly_bar(stamps[-1], 0)["t"]
+    assert len(session.requests) == 2
@@ -0,0 +1,39 @@
+import pytest
+from strategy import metrics
+from strategy.api_integrations import rate_limiter
+
+
+def test_run_summary_reports_latency_waits_and_errors():
+    @metrics.timed("fake.call")
+    def call(fail=False):
+        if fail:
+            raise RuntimeError("upstream failed")
+        return "ok"
+
+    summaries = []
+    with metrics.run("buy", summaries.append):
+        for _ in range(19):
+            call()
+        with pytest.raises(RuntimeError):
+            call(fail=True)
+        with metrics.measure("fake.download") as download:
+            download.bytes = 2048
+        rate_limiter.acquire("alpaca_data")
+    call()  # outside the run, not recorded
+
+    summary = summaries[0]
+    assert summary["run"] == "buy"
+    stats = summary["endpoints"]["fake.call"]
+    assert stats["calls"] == 20 and stats["errors"] == 1
+    assert stats["p50"] <= stats["p95"] <= stats["max"]
+    assert summary["endpoints"]["fake.download"]["bytes"] == 2048
+    assert summary["limiter"]["alpaca_data"]["acquired"] == 1
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    summaries = []
+    with metrics.run("sell", summaries.append) as recorder:
+        with metrics.measure("fake.call") as call:
+            call.bytes = 10
+    assert recorder is None and summaries == []
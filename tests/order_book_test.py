@@ -0,0 +1,122 @@
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from alpaca.trading.enums import OrderSide, OrderStatus, TradeEvent
+from alpaca.trading.models import Order, TradeUpdate
+from strategy.main_strategy import StrategyHandler
+from strategy.order_book import OrderBook, TradeUpdatesListener
+from fakes import TradingStreamStandIn
+
+SECRET = {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret"}
+SUBMITTED = datetime(2024, 3, 1, 15, tzinfo=timezone.utc)
+
+
+class FakeTradingClient():
+    def get_account(self):
+        return SimpleNamespace(cash="100000")
+
+
+def make_order(order_id, status, filled_qty="0"):
+    return Order(id=order_id, client_order_id="c", created_at=SUBMITTED, updated_at=SUBMITTED,
+                 submitted_at=SUBMITTED, order_class="simple", time_in_force="day",
+                 status=status, extended_hours=False, symbol="AAA", qty="10",
+                 filled_qty=filled_qty, side="buy", type="market")
+
+
+def fill(order, event, qty, price, execution_id):
+    return TradeUpdate(event=event, execution_id=execution_id, order=order,
+                       timestamp=SUBMITTED, position_qty=float(order.filled_qty), price=price, qty=qty)
+
+
+def test_spend_follows_fill_events():
+    handler = StrategyHandler(FakeTradingClient(), SECRET)
+    book = handler.order_book
+    order_id = uuid.uuid4()
+    order = make_order(order_id, OrderStatus.ACCEPTED)
+    book.track(order, 20.0)
+    handler.settle_order(str(order_id))
+    assert handler.account.current().cash == 100000 - 200
+
+    partial = fill(make_order(order_id, OrderStatus.PARTIALLY_FILLED, "4"),
+                   TradeEvent.PARTIAL_FILL, 4, 21.0, uuid.uuid4())
+    book.apply(partial)
+    book.apply(partial)  # replayed event
+    assert book.committed([str(order_id)]) == 4 * 21.0 + 6 * 20.0
+    assert handler.account.cash == 100000 - 84 - 120
+
+    book.apply(fill(make_order(order_id, OrderStatus.FILLED, "10"),
+                    TradeEvent.FILL, 6, 21.5, uuid.uuid4()))
+    assert book.filled(str(order_id)) == (10, 84 + 129)
+    assert handler.account.cash == 100000 - 213
+    assert book.positions == {"AAA": 10.0}
+    assert book.wait([str(order_id)], timeout=0)
+    assert book.latest([order])[0].status == OrderStatus.FILLED
+    assert [o.id for o in book.closed_orders(SUBMITTED - timedelta(hours=1))] == [order_id]
+    assert not book.covers(SUBMITTED, SUBMITTED)
+    assert book.orders[str(order_id)].side == OrderSide.BUY
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_book_covers_only_while_the_subscription_is_confirmed():
+    server = TradingStreamStandIn().start()
+    book = OrderBook()
+    listener = TradeUpdatesListener(book, SECRET, url_override=server.url)
+    listener.start()
+    try:
+        assert wait_until(lambda: server.subscriptions)
+        assert book.connected_at is None  # connected but not yet listening
+        server.confirm.set()
+        assert wait_until(lambda: book.connected_at is not None)
+        assert book.covers(datetime.now(timezone.utc), book.connected_at)
+        server.drop.set()
+        assert wait_until(lambda: book.connected_at is None)
+    finally:
+        listener.stop()
+        server.stop()
+    assert book.connected_at is None
+
+
+def test_book_behind_the_stream_covers_only_after_a_sync():
+    server = TradingStreamStandIn().start()
+    book = OrderBook()
+    listener = TradeUpdatesListener(book, SECRET, url_override=server.url)
+    server.confirm.set()
+    listener.start()
+    try:
+        assert wait_until(lambda: book.connected_at is not None)
+        # an update the client hasn't read, as after a freeze between invocations
+        order_id = uuid.uuid4()
+        filled = make_order(order_id, OrderStatus.FILLED, "10")
+        server.pending.append({"stream": "trade_updates", "data": fill(
+            filled, TradeEvent.FILL, 10, 20.0, uuid.uuid4()).model_dump(mode="json")})
+        invocation = datetime.now(timezone.utc)
+        assert not book.covers(invocation, invocation)  # connected, but not caught up
+
+        assert listener.sync()
+        assert book.covers(invocation, invocation)
+        assert book.orders[str(order_id)].status == OrderStatus.FILLED
+        assert server.subscriptions[-1]["action"] == "listen"
+        server.drop.set()
+        assert wait_until(lambda: book.connected_at is None)
+    finally:
+        listener.stop()
+        server.stop()
+    assert not listener.sync()
+
+
+def test_prune_drops_closed_orders_before_the_cutoff():
+    book = OrderBook()
+    closed, still_open = uuid.uuid4(), uuid.uuid4()
+    book.track(make_order(closed, OrderStatus.FILLED), 20.0)
+    book.track(make_order(still_open, OrderStatus.ACCEPTED), 20.0)
+    assert book.prune(SUBMITTED) == 0
+    assert book.prune(SUBMITTED + timedelta(seconds=1)) == 1
+    assert set(book.orders) == {str(still_open)}
+    assert set(book.estimates) == {str(still_open)}
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from fakes import FakeDocument, FakeFirestore, FakeOrdersClient, make_order
+from strategy import firestore_db, outbox
+from strategy.main_strategy import StrategyExecution
+
+SECRET = {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret", "FMP_KEY": "fmp"}
+
+
+def test_export_pages_every_order_and_resumes_from_checkpoint(monkeypatch, tmp_path):
+    db = FakeFirestore()
+    monkeypatch.setattr(firestore_db, "get_db", lambda: db)
+    box = outbox.Outbox(str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(firestore_db, "get_outbox", lambda: box)
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    # orders share submission times in threes, so page boundaries split ties
+    orders = [make_order(start + timedelta(seconds=i // 3 + 1)) for i in range(1203)]
+    client = FakeOrdersClient(orders)
+    execution = StrategyExecution(client, SECRET)
+
+    account, pages = execution.create_data()
+    assert execution.export_orders(pages) == 1203
+    assert firestore_db.drain(5)
+    stored = db.collection("orders").document(str(start.date())).collection("orders").stream()
+    assert len(stored) == 1203
+    checkpoint = firestore_db.get_checkpoint("orders", db)
+    assert checkpoint == orders[-1].submitted_at
+    assert str(account.cash) == "100000"
+
+    # a still open order holds the checkpoint back so it's exported once it closes
+    waiting = make_order(checkpoint + timedelta(seconds=1), status="new")
+    client.orders += [waiting, make_order(checkpoint + timedelta(seconds=2))]
+    _, pages = execution.create_data()
+    assert execution.export_orders(pages) == 4  # the orders at the checkpoint again plus the new one
+    assert firestore_db.drain(5)
+    assert len(db.collection("orders").document(str(start.date())).collection("orders").stream()) == 1204
+    assert firestore_db.get_checkpoint("orders", db) == waiting.submitted_at
+    firestore_db.get_flusher(box).stop()
+
+
+def test_unreadable_checkpoint_stops_the_export_without_moving_it(monkeypatch, tmp_path):
+    db = FakeFirestore()
+    monkeypatch.setattr(firestore_db, "get_db", lambda: db)
+    box = outbox.Outbox(str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(firestore_db, "get_outbox", lambda: box)
+    midnight = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    checkpoint = midnight - timedelta(hours=3)
+    firestore_db.set_checkpoint("orders", checkpoint)
+    assert firestore_db.drain(5)
+    # exported by nobody yet: from before midnight, after the stored checkpoint
+    late = make_order(midnight - timedelta(hours=1))
+    client = FakeOrdersClient([late, make_order(midnight + timedelta(seconds=1))])
+    execution = StrategyExecution(client, SECRET)
+
+    get = FakeDocument.get
+
+    def unavailable(document):
+        raise firestore_db.write_errors()[1]("firestore is down")
+    monkeypatch.setattr(FakeDocument, "get", unavailable)
+    with pytest.raises(RuntimeError):
+        execution.create_data()
+    monkeypatch.setattr(FakeDocument, "get", get)
+    assert firestore_db.get_checkpoint("orders", db) == checkpoint
+
+    _, pages = execution.create_data()
+    assert execution.export_orders(pages) == 2
+    assert firestore_db.drain(5)
+    stored = db.collection("orders").document(str(late.submitted_at.date())).collection("orders")
+    assert [data["id"] for data in stored.stream()] == [str(late.id)]
+    firestore_db.get_flusher(box).stop()
@@ -0,0 +1,110 @@
+import sqlite3
+from datetime import datetime, timezone
+from google.api_core.exceptions import ServiceUnavailable
+from fakes import FakeFirestore
+from strategy import firestore_db, outbox
+
+
+def test_outbox_retries_failed_batches_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "backoff", lambda attempts: 0.05)
+    db = FakeFirestore()
+    failures = [ServiceUnavailable("firestore is down")]
+
+    def write(documents):
+        if failures:
+            raise failures.pop()
+        firestore_db.write_batched(documents, db)
+
+    box = outbox.Outbox(str(tmp_path / "outbox.db"))
+    submitted = datetime(2024, 5, 1, 14, 30, tzinfo=timezone.utc)
+    box.append([(f"orders/2024-05-01/orders/{i}", {"submitted_at": submitted, "qty": "1"})
+                for i in range(600)])
+    box.append([("export_checkpoints/orders", {"after": submitted.isoformat()})])
+
+    assert box.flush(write, firestore_db.retry_errors) == 0
+    assert box.pending() == 601
+    flusher = outbox.OutboxFlusher(box, write, firestore_db.retry_errors, interval=0.01).start()
+    assert box.drain(write, firestore_db.retry_errors, timeout=5)
+    flusher.stop()
+
+    assert len(db.documents) == 601
+    assert db.documents["orders/2024-05-01/orders/7"]["submitted_at"] == submitted
+    assert db.commits == 2
+
+
+def test_outbox_parks_entries_that_keep_failing(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "backoff", lambda attempts: 0.0)
+
+    def write(documents):
+        raise ServiceUnavailable("firestore is down")
+
+    box = outbox.Outbox(str(tmp_path / "outbox.db"), max_attempts=3)
+    box.append([("portfolio/2024-05-01", {"cash": "100"})])
+    box.drain(write, firestore_db.retry_errors, timeout=1)
+    assert box.pending() == 0
+    assert box.parked() == 1
+
+
+def test_checkpoint_never_passes_parked_orders(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(outbox, "backoff", lambda attempts: 0.0)
+    db = FakeFirestore()
+    broken = {"orders/2024-05-01/orders/1"}
+
+    def write(documents):
+        if broken & {path for path, _ in documents}:
+            raise TypeError("cannot encode the document")  # not a retry error
+        firestore_db.write_batched(documents, db)
+
+    path = str(tmp_path / "outbox.db")
+    box = outbox.Outbox(path, max_attempts=2)
+    box.append([("orders/2024-05-01/orders/1", {"qty": "1"})])
+    box.append([("export_checkpoints/orders", {"after": "2024-05-01T15:00:00"})], barrier=True)
+    box.append([("portfolio/2024-05-01", {"cash": "100"})])
+
+    assert box.drain(write, firestore_db.retry_errors, timeout=1)
+    assert box.parked() == 1
+    assert set(db.documents) == {"portfolio/2024-05-01"}
+    assert "Dropping 1 checkpoints" in caplog.text
+
+    # the next export writes the order again, which replaces the parked copy
+    broken.clear()
+    box.append([("orders/2024-05-01/orders/1", {"qty": "1"})])
+    box.append([("export_checkpoints/orders", {"after": "2024-05-01T16:00:00"})], barrier=True)
+    assert box.drain(write, firestore_db.retry_errors, timeout=1)
+    assert box.parked() == 0
+    assert db.documents["export_checkpoints/orders"]["after"] == "2024-05-01T16:00:00"
+    box.close()
+
+
+def test_parked_entries_are_retried_when_the_outbox_is_reopened(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "backoff", lambda attempts: 0.0)
+    path = str(tmp_path / "outbox.db")
+    box = outbox.Outbox(path, max_attempts=2)
+    box.append([("portfolio/2024-05-01", {"cash": "100"})])
+
+    def write(documents):
+        raise ServiceUnavailable("firestore is down")
+
+    box.drain(write, firestore_db.retry_errors, timeout=1)
+    assert box.parked() == 1
+    box.close()
+
+    reopened = outbox.Outbox(path, max_attempts=2)
+    assert (reopened.pending(), reopened.parked()) == (1, 0)
+
+
+def test_outbox_files_without_barriers_are_migrated(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, "
+               "data TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+               "next_attempt REAL NOT NULL DEFAULT 0)")
+    db.execute("INSERT INTO outbox (path, data) VALUES ('portfolio/2024-05-01', '{}')")
+    db.commit()
+    db.close()
+
+    box = outbox.Outbox(path)
+    box.append([("export_checkpoints/orders", {"after": "x"})], barrier=True)
+    written = []
+    assert box.drain(written.extend, firestore_db.retry_errors, timeout=1)
+    assert [path for path, _ in written] == ["portfolio/2024-05-01", "export_checkpoints/orders"]
@@ -0,0 +1,125 @@
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+from fakes import FakeDataSession, FakeFirestore, FakeOrdersClient
+from strategy import firestore_db, outbox, portfolios
+from strategy import main_strategy
+from strategy.main_strategy import MarketSnapshot, StrategyHandler
+from strategy.api_integrations import rate_limiter
+
+SECRET = {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret"}
+
+
+def test_registry_namespaces_portfolios(tmp_path, monkeypatch):
+    path = tmp_path / "portfolios.json"
+    path.write_text(json.dumps([
+        {"name": "momentum", "key_env": "MOMENTUM_KEY", "params": {"rsi_buy": 30}},
+        {"name": "legacy", "namespace": ""},
+        ]))
+    monkeypatch.setenv("MOMENTUM_KEY", "momentum-key")
+    momentum, legacy = portfolios.load_registry(str(path))
+    assert momentum.namespace == "momentum" and momentum.params.rsi_buy == 30
+    assert momentum.secret()["ALPACA_KEY"] == "momentum-key"
+    assert legacy.namespace == ""
+    assert portfolios.load_registry(str(tmp_path / "missing.json")) == [portfolios.DEFAULT_PORTFOLIO]
+
+    db = FakeFirestore()
+    monkeypatch.setattr(firestore_db, "_namespace", "")
+    firestore_db.set_namespace("momentum")
+    firestore_db.push_portfolio(momentum, db)
+    firestore_db.set_namespace("")
+    firestore_db.push_portfolio(legacy, db)
+    today = datetime.now(timezone.utc).date()
+    assert set(db.documents) == {f"portfolios/momentum/portfolio/{today}", f"portfolio/{today}"}
+
+
+def test_shared_snapshot_replaces_the_bar_fetch(monkeypatch):
+    handler = StrategyHandler(None, SECRET)
+    monkeypatch.setattr(handler, "bar_history", lambda tickers: {ticker: [] for ticker in tickers})
+    reading = {"rsi": 25.0, "macd": 1.0, "signal": 0.5, "hist": 0.5}
+    handler.share_market_data(MarketSnapshot(quotes={"AAA": {"ap": 10.0}},
+                                             readings={"AAA": reading}))
+    handler.load_indicators(["aaa"])
+    assert handler.get_rsi("AAA") == 25.0
+    assert handler.get_quotes(["AAA"]) == {"AAA": {"ap": 10.0}}
+
+
+class SerialPool():
+    """ProcessPoolExecutor stand-in running the workers' calls in this process"""
+    def __init__(self, max_workers, mp_context, initializer, initargs):
+        initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, func, *iterables):
+        return [func(*args) for args in zip(*iterables)]
+
+
+def test_run_portfolios_shares_quotes_and_separates_outboxes(tmp_path, monkeypatch):
+    # fetched long before the workers get to it
+    snapshot = MarketSnapshot(fetched_at=time.time() - 60, quotes={"AAA": {"ap": 10.0}})
+    runs = []
+
+    class FakeClientInstance():
+        def __init__(self, secret, params, paper):
+            handler = StrategyHandler(FakeOrdersClient([]), SECRET)
+            handler.session = FakeDataSession({"AAA": {"ap": 11.0}})
+            self.strategyexec = SimpleNamespace(strategy_handler=handler)
+            self.trade_updates = SimpleNamespace(stop=lambda: None)
+
+        def execute_buy_strategy(self):
+            handler = self.strategyexec.strategy_handler
+            runs.append((firestore_db.namespace(), firestore_db.get_outbox().path,
+                         handler.get_quotes(["AAA"]), handler.session.requests))
+
+    monkeypatch.setattr(portfolios, "fetch_market_data", lambda action, registry: snapshot)
+    monkeypatch.setattr(portfolios, "ProcessPoolExecutor", SerialPool)
+    monkeypatch.setattr(main_strategy, "ClientInstance", FakeClientInstance)
+    monkeypatch.setattr(outbox, "OUTBOX_PATH", str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(firestore_db, "_namespace", "")
+    buckets = {api: rate_limiter.TokenBucket(calls=200, period=60) for api in rate_limiter.BUCKETS}
+    monkeypatch.setattr(rate_limiter, "BUCKETS", buckets)
+    registry = [portfolios.Portfolio("momentum", namespace="momentum"),
+                portfolios.Portfolio("value", namespace="value")]
+
+    results = portfolios.run_portfolios("buy", registry)
+    # the workers split the shared market data keys' quotas, not the accounts'
+    assert [buckets[api].state()["calls_per_min"] for api in portfolios.SHARED_KEY_APIS] == \
+        [pytest.approx(100)] * 3
+    assert buckets["alpaca_trading"].state()["calls_per_min"] == pytest.approx(200)
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    assert [run[0] for run in runs] == ["momentum", "value"]
+    assert [run[1] for run in runs] == [str(tmp_path / "outbox.momentum.db"),
+                                        str(tmp_path / "outbox.value.db")]
+    for _, _, quotes, requests in runs:
+        assert quotes == {"AAA": {"ap": 10.0}} and requests == []
+
+
+def test_held_symbols_leave_out_a_failing_account(monkeypatch):
+    from alpaca.trading import client as trading_client
+    from alpaca.trading.models import Position
+
+    class FakePositionsClient():
+        def __init__(self, key, secret, paper=True):
+            self.key = key
+
+        def get_all_positions(self):
+            if self.key == "broken-key":
+                raise RuntimeError("unauthorized")
+            return [Position(asset_id=uuid.uuid4(), symbol=symbol, exchange="NASDAQ",
+                             asset_class="us_equity", avg_entry_price="10", qty="1",
+                             side="long", cost_basis="10") for symbol in ("BBB", "AAA")]
+
+    monkeypatch.setattr(trading_client, "TradingClient", FakePositionsClient)
+    monkeypatch.setenv("GOOD_KEY", "good-key")
+    monkeypatch.setenv("BROKEN_KEY", "broken-key")
+    good = portfolios.Portfolio(name="good", key_env="GOOD_KEY")
+    broken = portfolios.Portfolio(name="broken", key_env="BROKEN_KEY")
+    assert portfolios.held_symbols([broken, good]) == ["AAA", "BBB"]
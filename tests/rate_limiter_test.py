@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from strategy import metrics
+from strategy.api_integrations import poly_api, rate_limiter
+from strategy.api_integrations.rate_limiter import TokenBucket
+
+
+class FakeResponse():
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_bucket_follows_limit_headers_and_retry_after():
+    bucket = TokenBucket(calls=200, period=61)
+    bucket.observe(200, {"X-RateLimit-Limit": "1000", "X-RateLimit-Remaining": "3"})
+    state = bucket.state()
+    assert state["calls_per_min"] == pytest.approx(1000) and state["from_headers"]
+    assert state["tokens"] < 4
+
+    bucket.observe(429, {"Retry-After": "0.2"})
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.2
+    assert bucket.state()["throttled"] == 1
+
+
+def test_shared_bucket_keeps_its_share_of_the_quota():
+    bucket = TokenBucket(calls=5, period=60)
+    bucket.set_share(1 / 8)
+    state = bucket.state()
+    assert state["calls_per_min"] == pytest.approx(5 / 8) and state["burst"] == 1.0
+    assert bucket.acquire() == 0.0
+    bucket.observe(200, {"X-RateLimit-Limit": "800"})
+    assert bucket.state()["calls_per_min"] == pytest.approx(100)
+
+
+def test_bucket_without_headers_backs_off_and_recovers(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "BACKOFF_BASE", 0.01)
+    bucket = TokenBucket(calls=60, period=60, max_rate=2.0)
+    bucket.observe(429)
+    assert bucket.state()["calls_per_min"] == pytest.approx(30)
+    for _ in range(10):
+        bucket.observe(200)
+    assert bucket.state()["calls_per_min"] == pytest.approx(60)
+
+
+def test_send_retries_rate_limited_requests(monkeypatch):
+    monkeypatch.setitem(rate_limiter.BUCKETS, "alpaca_data", TokenBucket(calls=10, period=1))
+    responses = [FakeResponse(429, {"Retry-After": "0"}), FakeResponse(200)]
+    response = rate_limiter.send("alpaca_data", lambda: responses.pop(0))
+    assert response.status_code == 200 and not responses
+
+
+def test_bucket_allows_a_burst_then_paces_threads_at_its_rate():
+    bucket = TokenBucket(calls=4, period=0.4)
+    assert [bucket.acquire() for _ in range(4)] == [0.0] * 4
+    waits = []
+    threads = [threading.Thread(target=lambda: waits.append(bucket.acquire())) for _ in range(4)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 4 more tokens refill at 10 per second, no matter how many threads ask
+    assert time.monotonic() - start >= 0.35
+    assert all(wait > 0 for wait in waits)
+
+
+class PolygonStandIn(BaseHTTPRequestHandler):
+    """Answers the first request with a 429, then serves an RSI reading"""
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if len(self.requests) == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"status": "OK", "results": {
+            "values": [{"timestamp": 1709305200000, "value": 42.0}], "underlying": {}}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_polygon_client_waits_out_429s_and_stays_within_the_plan(monkeypatch):
+    server = HTTPServer(("127.0.0.1", 0), PolygonStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    plan = rate_limiter.BUCKETS["polygon"]
+    assert plan.max_rate == pytest.approx(rate_limiter.POLYGON_CALLS_PER_MIN / 61)
+    bucket = TokenBucket(calls=5, period=1)
+    monkeypatch.setitem(rate_limiter.BUCKETS, "polygon", bucket)
+    monkeypatch.setenv("MASSIVE_API_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("MASSIVE_API_KEY", "key")
+    poly_api.get_client.cache_clear()
+    try:
+        assert poly_api.get_indicator("AAA", "rsi") == 42.0
+        assert len(PolygonStandIn.requests) == 2
+        assert bucket.state()["throttled"] == 1
+        for _ in range(50):
+            bucket.observe(200)
+        assert bucket.state()["calls_per_min"] <= 5 * 60
+    finally:
+        server.shutdown()
+        poly_api.get_client.cache_clear()
+
+
+def test_polygon_limiter_wait_is_not_counted_as_call_time(monkeypatch):
+    PolygonStandIn.requests = []
+    server = HTTPServer(("127.0.0.1", 0), PolygonStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # one call per half second, so the retry after the 429 waits for its token
+    monkeypatch.setitem(rate_limiter.BUCKETS, "polygon", TokenBucket(calls=1, period=0.5))
+    monkeypatch.setenv("MASSIVE_API_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("MASSIVE_API_KEY", "key")
+    poly_api.get_client.cache_clear()
+    summaries = []
+    try:
+        with metrics.run("buy", summaries.append):
+            assert poly_api.get_indicator("AAA", "rsi") == 42.0
+    finally:
+        server.shutdown()
+        poly_api.get_client.cache_clear()
+
+    stats = summaries[0]["endpoints"]["polygon.rsi"]
+    assert stats["calls"] == 2 and stats["errors"] == 1
+    assert stats["bytes"] > 0
+    waited = summaries[0]["limiter"]["polygon"]["total"]
+    assert waited >= 0.3
+    assert stats["total"] < waited
@@ -0,0 +1,40 @@
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from alpaca.trading.enums import OrderSide, OrderStatus
+from alpaca.trading.models import Order, TradeAccount
+from fakes import make_order
+from strategy import serializers
+
+SUBMITTED = datetime(2024, 3, 1, 15, tzinfo=timezone.utc)
+
+
+def test_order_record_is_flat_typed_and_leaves_the_order_alone():
+    leg = make_order(SUBMITTED, symbol="LEG")
+    order = make_order(SUBMITTED, qty="3", filled_avg_price="10.5", asset_id=uuid.uuid4(), legs=[leg])
+    before = dict(order.__dict__)
+
+    record = serializers.serialize(order)
+
+    assert order.__dict__ == before and isinstance(order.id, uuid.UUID)
+    assert record["id"] == str(order.id) and record["asset_id"] == str(order.asset_id)
+    assert record["status"] == "filled" and record["side"] == "buy"
+    assert type(record["status"]) is str
+    assert record["submitted_at"] == SUBMITTED
+    assert record["qty"] == "3" and record["filled_avg_price"] == "10.5"
+    assert record["replaced_by"] is None
+    assert record["legs"][0]["symbol"] == "LEG"
+    assert record[serializers.SCHEMA_FIELD] == serializers.SCHEMA_VERSION
+    assert set(record) == set(Order.model_fields) | {serializers.SCHEMA_FIELD}
+
+
+def test_account_record_and_fallbacks():
+    account = TradeAccount(id=uuid.uuid4(), account_number="PA1", status="ACTIVE", cash="100")
+    record = serializers.serialize(account)
+    assert record["id"] == str(account.id) and record["status"] == "ACTIVE"
+    assert record["cash"] == "100"
+    # values set without validation and non-model objects go through the generic path
+    unvalidated = make_order(SUBMITTED).model_copy(update={"status": "canceled"})
+    assert serializers.serialize(unvalidated)["status"] == "canceled"
+    assert serializers.convert_value([Decimal("1.10"), OrderSide.SELL, {"s": OrderStatus.NEW}]) == [
+        "1.10", "sell", {"s": "new"}]
@@ -0,0 +1,85 @@
+import threading
+import time
+from types import SimpleNamespace
+from fakes import FakeOrdersClient
+from strategy import main_strategy
+
+SECRET = {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret", "FMP_KEY": "fmp"}
+
+
+def test_buy_signals_are_evaluated_concurrently(monkeypatch):
+    handler = main_strategy.StrategyHandler(FakeOrdersClient([]), SECRET)
+    threads = set()
+
+    def indicator_signal(ticker):
+        threads.add(threading.get_ident())
+        time.sleep(0.1)
+        return "buy" if ticker.startswith("B") else "do nothing"
+
+    monkeypatch.setattr(handler, "indicator_signal", indicator_signal)
+    tickers = ["BAA", "CCC", "BDD", "EEE", "FFF", "BGG", "HHH", "III"]
+    start = time.monotonic()
+    signals = handler.evaluate_buy_signals(tickers)
+    assert time.monotonic() - start < 0.5
+    assert len(threads) > 1
+    assert list(signals) == tickers
+    assert [ticker for ticker, signal in signals.items() if signal == "buy"] == ["BAA", "BDD", "BGG"]
+
+
+def position(symbol, plpc=0.0):
+    return SimpleNamespace(symbol=symbol, unrealized_plpc=str(plpc), qty_available="1")
+
+
+def test_take_profit_sells_without_fetching_indicators(monkeypatch):
+    handler = main_strategy.StrategyHandler(FakeOrdersClient([]), SECRET)
+
+    def no_fetch(ticker):
+        raise AssertionError(f"fetched indicators of {ticker}")
+
+    monkeypatch.setattr(handler, "get_macd", no_fetch)
+    assert handler.sell_signal(position("AAA", plpc=0.08)) == "sell"
+
+
+def test_sell_signals_survive_errors_and_drop_late_positions(monkeypatch):
+    monkeypatch.setattr(main_strategy, "SIGNAL_WORKERS", 1)
+    handler = main_strategy.StrategyHandler(FakeOrdersClient([]), SECRET)
+    evaluated = []
+
+    def sell_signal(held):
+        evaluated.append(held.symbol)
+        if held.symbol == "BAD":
+            raise RuntimeError("polygon is down")
+        if held.symbol == "SLOW":
+            time.sleep(0.3)
+        return "sell"
+
+    monkeypatch.setattr(handler, "sell_signal", sell_signal)
+    signals = handler.evaluate_sell_signals([position("BAD"), position("AAA")], timeout=5)
+    assert signals == {"BAD": None, "AAA": "sell"}
+
+    before = threading.active_count()
+    signals = handler.evaluate_sell_signals(
+        [position("AAA"), position("SLOW"), position("LATE")], timeout=0.1)
+    assert signals == {"AAA": "sell"}
+    assert "LATE" not in evaluated  # queued behind the timeout, never started
+    assert threading.active_count() <= before
+
+
+def test_buy_signals_leave_out_failed_tickers(monkeypatch):
+    handler = main_strategy.StrategyHandler(FakeOrdersClient([]), SECRET)
+
+    def indicator_signal(ticker):
+        if ticker == "BAD":
+            raise RuntimeError("Error fetching RSI data from polygon API")
+        return "buy"
+
+    monkeypatch.setattr(handler, "indicator_signal", indicator_signal)
+    assert handler.evaluate_buy_signals(["AAA", "BAD", "CCC"]) == {"AAA": "buy", "CCC": "buy"}
+
+
+def test_missing_polygon_macd_gives_no_signal(monkeypatch):
+    handler = main_strategy.StrategyHandler(FakeOrdersClient([]), SECRET)
+    monkeypatch.setattr(main_strategy.poly_api, "get_indicator", lambda ticker, indicator: None)
+    assert handler.fetch_macd("NOMACD") is None
+    assert handler.indicator_signal("NOMACD") == "do nothing"
+    assert handler.sell_signal(position("NOMACD")) is None
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import requests
+from strategy import indicators
+from strategy.main_strategy import StrategyExecution
+from strategy.rules import StrategyParams
+from strategy.streaming import StreamingStrategy
+from fakes import AlpacaStreamStandIn, make_order, stream_bar, stream_quote
+
+SECRET = {"ALPACA_KEY": "key", "ALPACA_SECRET": "secret", "FMP_KEY": "fmp"}
+
+
+class FakeTradingClient():
+    """accepts orders as new ones, after rejecting the first `failures` submissions"""
+    def __init__(self, failures=0):
+        self.submitted = []
+        self.orders = []
+        self.failures = failures
+
+    def get_account(self):
+        return SimpleNamespace(cash="100000")
+
+    def submit_order(self, order_data):
+        self.submitted.append(order_data)
+        if self.failures:
+            self.failures -= 1
+            raise requests.HTTPError("403 insufficient buying power")
+        order = make_order(datetime.now(timezone.utc), status="new", symbol=order_data.symbol,
+                           side=order_data.side.value, qty=str(order_data.qty),
+                           client_order_id=order_data.client_order_id)
+        self.orders.append(order)
+        return order
+
+    def get_orders(self, filter):
+        return list(self.orders)
+
+    def get_all_positions(self):
+        return []
+
+
+def test_stream_bars_trigger_a_buy():
+    start = datetime(2024, 3, 1, 15, tzinfo=timezone.utc)
+    messages = [stream_quote("AAA", 20.0, 19.9, start)]
+    messages += [stream_bar("AAA", 20.0 + minute * 0.01, start + timedelta(minutes=minute))
+                 for minute in range(0, 90, 15)]
+    server = AlpacaStreamStandIn(messages).start()
+    client = FakeTradingClient()
+    # rsi_buy above 100 so the buy only depends on the MACD crossing up
+    execution = StrategyExecution(client, SECRET, params=StrategyParams(rsi_buy=101))
+    streaming = StreamingStrategy(execution, SECRET, url_override=server.url)
+    streaming.seed({"AAA": [10.0 + i * 0.1 for i in range(40)]})
+    streaming.watchlist = {"AAA"}
+
+    thread = threading.Thread(target=streaming.listen, args=(["AAA"],), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not client.submitted and time.monotonic() < deadline:
+        time.sleep(0.05)
+    streaming.stop()
+    thread.join(10)
+    server.stop()
+
+    assert server.subscriptions[0]["bars"] == ["AAA"]
+    assert [order.symbol for order in client.submitted] == ["AAA"]
+    assert streaming.bought == {"AAA"}
+    assert streaming.running_hour["AAA"] == start.replace(hour=16)
+
+
+def test_bars_keep_flowing_while_a_ticker_is_decided():
+    execution = StrategyExecution(FakeTradingClient(), SECRET)
+    streaming = StreamingStrategy(execution, SECRET)
+    streaming.seed({"AAA": [10.0 + i * 0.1 for i in range(40)]})
+    release = threading.Event()
+    decided = []
+
+    def decide(symbol, price):
+        decided.append(price)
+        release.wait(5)
+
+    streaming.decide = decide
+    start = datetime(2024, 3, 1, 15, tzinfo=timezone.utc)
+
+    async def feed():
+        for minute, close in enumerate((14.0, 14.1, 14.2)):
+            bar = SimpleNamespace(symbol="AAA", close=close,
+                                  timestamp=start + timedelta(minutes=minute))
+            await asyncio.wait_for(streaming.on_bar(bar), 1)
+        assert streaming.busy == {"AAA"}
+        release.set()
+        await asyncio.gather(*streaming.tasks)
+
+    asyncio.run(feed())
+    # the later bars were folded into the state but not decided again
+    assert decided == [14.0]
+    assert streaming.running_close["AAA"] == 14.2
+    assert streaming.busy == set()
+
+
+def test_stream_started_mid_hour_counts_the_running_hour_once():
+    now = datetime.now(timezone.utc)
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    completed = [10.0 + i * 0.1 + (i % 3) * 0.05 for i in range(40)]
+    opens = [(hour - timedelta(hours=40 - i)).timestamp() for i in range(40)]
+    # the last bar is the running hour, it closes later at 14.9
+    series = np.array([opens + [hour.timestamp()], completed + [14.6]])
+    execution = StrategyExecution(FakeTradingClient(), SECRET)
+    streaming = StreamingStrategy(execution, SECRET)
+    streaming.execution.watchlist_handler.candidates = lambda: [{"symbol": "aaa"}]
+    streaming.handler.bar_series = lambda symbols: {"AAA": series}
+
+    assert streaming.prepare() == ["AAA"]
+    assert streaming.running_hour["AAA"] == hour
+    assert streaming.running_close["AAA"] == 14.6
+
+    streaming.update_state(SimpleNamespace(symbol="AAA", close=14.9,
+                                           timestamp=hour + timedelta(minutes=59)))
+    reading = streaming.update_state(SimpleNamespace(symbol="AAA", close=15.2,
+                                                     timestamp=hour + timedelta(minutes=65)))
+    expected = indicators.latest_indicators({"AAA": completed + [14.9, 15.2]})["AAA"]
+    assert reading == pytest.approx(expected)
+
+
+def test_failed_buy_is_retried_on_the_next_signal():
+    client = FakeTradingClient(failures=1)
+    streaming = StreamingStrategy(StrategyExecution(client, SECRET), SECRET)
+    streaming.handler.quote_cache["AAA"] = (time.monotonic(), {"ap": 20.0, "bp": 19.9})
+
+    streaming.decide_buy("AAA")
+    assert streaming.bought == set() and streaming.orders["buy"] == []
+    streaming.decide_buy("AAA")
+    assert streaming.bought == {"AAA"}
+    assert [order.symbol for order in streaming.orders["buy"]] == ["AAA"]
+    assert len(client.submitted) == 2
+
+
+def test_failed_sell_keeps_the_position_for_a_retry():
+    client = FakeTradingClient(failures=1)
+    streaming = StreamingStrategy(StrategyExecution(client, SECRET), SECRET)
+    streaming.positions["AAA"] = SimpleNamespace(
+        symbol="AAA", avg_entry_price="10", qty_available="5",
+        model_copy=lambda update: SimpleNamespace(symbol="AAA", **update))
+
+    # 20% above the entry, take-profit sells without indicators
+    streaming.decide_sell("AAA", 12.0)
+    assert "AAA" in streaming.positions and streaming.orders["sell"] == []
+    streaming.decide_sell("AAA", 12.0)
+    assert "AAA" not in streaming.positions
+    assert [order.side.value for order in streaming.orders["sell"]] == ["sell"]
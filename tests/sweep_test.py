@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from strategy import backtest, sweep
+
+
+def market(days=30, symbols=6):
+    index = pd.date_range("2024-01-02", periods=days, freq="B")
+    timestamps = pd.DatetimeIndex([day + pd.Timedelta(hours=hour)
+                                   for day in index for hour in range(15, 21)]).to_numpy()
+    rng = np.random.default_rng(3)
+    close = 20 * np.exp(np.cumsum(rng.normal(0, 0.02, (symbols, timestamps.size)), axis=1))
+    return backtest.MarketData.from_closes([f"S{i}" for i in range(symbols)], timestamps, close)
+
+
+def test_sweep_matches_serial_backtests_for_every_grid_point():
+    data = market()
+    param_sets = sweep.grid({"rsi_buy": [30.0, 45.0], "take_profit": [0.02, 0.05]})
+    summary = sweep.run_sweep(data, param_sets, workers=2)
+
+    assert len(summary) == 4
+    assert list(summary["total_return"]) == sorted(summary["total_return"], reverse=True)
+    for params in param_sets:
+        row = summary[(summary["rsi_buy"] == params.rsi_buy)
+                      & (summary["take_profit"] == params.take_profit)].iloc[0]
+        expected = backtest.Backtester(data, params).run().summary()
+        assert row["total_return"] == expected["total_return"]
+        assert row["trades"] == expected["trades"]
+
+
+def test_worker_closes_its_shared_memory_handles():
+    shared = sweep.SharedMarketData(market(days=5, symbols=2))
+    try:
+        sweep.init_worker(shared.spec)
+        assert sweep.run_one(sweep.DEFAULT_PARAMS, {})["trades"] >= 0
+        sweep.close_worker()
+        assert sweep._worker_data is None and not sweep._worker_blocks
+    finally:
+        shared.close()